@@ -1,50 +1,75 @@
+import asyncio
 import logging
+import time
 import discord
 import utils.embedBuilder as embedBuilder
-import re
+import utils.structLog as structLog
 from asyncio import sleep
 from discord.ext import commands, tasks
 from discord import DMChannel
 from datetime import datetime, timedelta
-from strsimpy import SIFT4
+from utils.messageRouter import MessageContext, CHANNEL_GUILD, CHANNEL_THREAD
+from utils.analysis import analyzeMessage
+from utils.contentScanner import buildRules, scannerFor
+from utils.raidIndex import RaidIndex
+from utils.spamTracker import UserTracker
+from utils.metrics import registry
 
 logger = logging.getLogger("NinjaBot." + __name__)
-
-# Regex pattern for common image hosting URLs
-IMAGE_URL_PATTERN = re.compile(
-    r'(?:https?://)?(?:www\.)?'
-    r'(?:'
-    r'(?:i\.)?imgur\.com/\w+|'
-    r'giphy\.com/\w+|'
-    r'i\.redd\.it/\w+|'
-    r'media\.discordapp\.net/attachments/|'
-    r'cdn\.discordapp\.com/attachments/|'
-    r'tenor\.com/\w+|'
-    r'gfycat\.com/\w+'
-    r')',
-    re.IGNORECASE
-)
+slog = structLog.getLogger("NinjaBot." + __name__)
 
 class NinjaAntiSpam(commands.Cog):
     def __init__(self, bot) -> None:
         logger.debug(f"Loading {self.__class__.__name__}")
         self.bot = bot
         self.isInternal = True
-        self.s = SIFT4()
-        self.h = {}
+        # recently active users, bounded, see "antiSpam" in the config
+        antiSpamConfig = self.bot.config.get("antiSpam") or {}
+        self.h = UserTracker(antiSpamConfig.get("maxTrackedUsers", 10000), antiSpamConfig.get("idleSeconds", 60))
+        # fingerprints of recent messages of all users, see "raidDetection" in the config
+        self.raidIndex = self._createRaidIndex()
+        # image links, invites and secrets, see "contentRules" in the config
+        self.scanner = scannerFor(buildRules(self.bot.config.get("contentRules")))
+        registry.gauge("ninjabot_antispam_tracked_users", "Users the anti spam currently tracks", fn=lambda: len(self.h))
+        registry.gauge("ninjabot_antispam_raid_fingerprints", "Message fingerprints in the raid window",
+                       fn=lambda: len(self.raidIndex) if self.raidIndex is not None else 0)
         self.historyCleanupJob.start()
         # self.botlogCleanupJob.start() disabled for now
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message) -> None:
+    async def cog_load(self) -> None:
+        # bots, DMs, and system messages are already filtered out by the router
+        self.bot.router.register(
+            f"{self.__class__.__name__}.onMessage",
+            self.onMessage,
+            channelTypes=(CHANNEL_GUILD, CHANNEL_THREAD)
+        )
+        self.bot.config.subscribe(f"{self.__class__.__name__}.raidIndex", self._onRaidConfigChange, keys=("raidDetection",))
+        self.bot.config.subscribe(f"{self.__class__.__name__}.tracker", self._onTrackerConfigChange, keys=("antiSpam",))
+        self.bot.config.subscribe(f"{self.__class__.__name__}.scanner", self._onScannerConfigChange, keys=("contentRules",))
+
+    def _onScannerConfigChange(self, changed: frozenset[str]) -> None:
+        self.scanner = scannerFor(buildRules(self.bot.config.get("contentRules")))
+
+    def _onTrackerConfigChange(self, changed: frozenset[str]) -> None:
+        # a smaller limit takes effect with the next new user
+        antiSpamConfig = self.bot.config.get("antiSpam") or {}
+        self.h.maxUsers = antiSpamConfig.get("maxTrackedUsers", 10000)
+        self.h.idleSeconds = antiSpamConfig.get("idleSeconds", 60)
+
+    def _createRaidIndex(self) -> RaidIndex | None:
+        raidConfig = self.bot.config.get("raidDetection") or {}
+        if not raidConfig.get("enabled", True):
+            return None
+        self.raidMemberAge = timedelta(days=raidConfig.get("memberAge", 7))
+        return RaidIndex(accounts=raidConfig.get("accounts", 4), window=raidConfig.get("window", 60))
+
+    def _onRaidConfigChange(self, changed: frozenset[str]) -> None:
+        # recent fingerprints are dropped, they would be judged by the new limits otherwise
+        self.raidIndex = self._createRaidIndex()
+
+    async def onMessage(self, mctx: MessageContext) -> None:
         """For anti-spam purposes we don't care if it's a command or normal message"""
-        if message.author == self.bot.user \
-            or message.author.bot \
-            or isinstance(message.channel, discord.DMChannel) \
-            or not (message.type == discord.MessageType.default \
-            or message.type == discord.MessageType.reply):
-            # ignore messages by bots, DMs, and system messages
-            return
+        message = mctx.message
 
         # Check for protected roles (skip anti-spam for trusted members)
         protected_roles = {"Steve", "Admin", "Moderator", "Sponsor"}
@@ -53,47 +78,55 @@ class NinjaAntiSpam(commands.Cog):
             if protected_roles & author_role_names:  # intersection - any match
                 return
     
-        now = datetime.now().timestamp()
+        now = time.monotonic()
         uid = message.author.id
         abuseInc = 0
         current_channel = message.channel.id
-    
-        if uid not in self.h:
-            # user is not currently in our message buffer, add them
-            # also can't judge in here if it's spam or not
-            self.h[uid] = {
-                "lm": "",  # Only store text content, not filenames
-                "lmts": now,
-                "abuse": 0,
-                "msgs": [[message.id, message.channel.id]],
-                "channels": [],  # Track channels for text spam
-                "image_channels": [],  # Track channels where images were posted
-                "image_timestamps": {},  # {channel_id: [timestamps]} for rate limiting
-            }
-            logger.debug(f"built new user {str(uid)}/{str(message.author)} object {self.h[uid]}")
-        else:
-            # user has posted their 2nd+ message
-            self.h[uid]["msgs"].append([message.id, message.channel.id])
-            self.h[uid]["lmts"] = now
+
+        # content scan and the sift4 distance, in the analysis pool for long messages.
+        # awaited before any tracking state is touched, so the checks below still run in one go
+        previous = self.h.get(uid)
+        # many fresh accounts posting (nearly) the same text within a short time is a raid, even if each of them only posts once.
+        # longer standing members are never counted, so their messages don't need a fingerprint
+        joinedAt = getattr(message.author, "joined_at", None)
+        raidCandidate = self.raidIndex is not None and bool(mctx.guildId) \
+            and (joinedAt is None or discord.utils.utcnow() - joinedAt < self.raidMemberAge)
+        analysis = await self.bot.analysisPool.run(
+            analyzeMessage, message.content, previous.lastText if previous else "", self.scanner, raidCandidate,
+            size=len(message.content)
+        )
+
+        # from here on only the local record is used, a concurrent cleanup may drop it from the tracker
+        user, created = self.h.touch(uid, message.author, now)
+        user.addMessage(message.id, message.channel.id, self.reportLine(message))
+        if created:
+            # user was not in our message buffer, can't judge in here if it's spam or not
+            slog.debug("antispam.newUser", every=1.0, uid=uid, author=lambda: str(message.author), users=lambda: len(self.h))
+
+        # the raid index may have been turned off while the analysis ran
+        if raidCandidate and self.raidIndex is not None and analysis.fingerprint is not None:
+            raiders = self.raidIndex.add(mctx.guildId, uid, analysis.fingerprint)
+            if raiders:
+                await self.cleanupRaid(message, raiders)
+                return
 
         # Determine if this is an image-only message or has text
         has_text = bool(message.content)
         has_attachment = bool(message.attachments)
-        has_image_url = bool(IMAGE_URL_PATTERN.search(message.content)) if message.content else False
+        has_image_url = analysis.hasImageUrl
         has_image = has_attachment or has_image_url
 
         # Handle TEXT messages (use SIFT4 similarity for cross-channel text spam)
-        if has_text and uid in self.h and self.h[uid]["lm"]:
+        if has_text and analysis.distance is not None:
             # Add current channel to text channel list if not already present
-            if current_channel not in self.h[uid]["channels"]:
-                self.h[uid]["channels"].append(current_channel)
+            user.addChannel(current_channel)
 
-            # Calculate message distance using sift4
-            dist = self.s.distance(self.h[uid]["lm"], message.content)
-            logger.debug(f"sift4 distance: {dist}")
+            # message distance to the last one using sift4
+            dist = analysis.distance
+            slog.debug("antispam.sift4", every=1.0, uid=uid, distance=dist)
 
             # Only increment abuse if posting similar text in DIFFERENT channels
-            if len(self.h[uid]["channels"]) > 1:
+            if len(user.channels) > 1:
                 if dist == 0:
                     # messages are identical
                     abuseInc = 1.5
@@ -103,50 +136,42 @@ class NinjaAntiSpam(commands.Cog):
 
         # Cross-channel rapid posting detection (independent of content similarity)
         # Track all channels user has posted to
-        if current_channel not in self.h[uid]["channels"]:
-            self.h[uid]["channels"].append(current_channel)
+        user.addChannel(current_channel)
 
         # If user posts to 3+ channels within the tracking window, flag as spam
-        if len(self.h[uid]["channels"]) >= 3:
-            logger.info(f"Cross-channel spam detected: {len(self.h[uid]['channels'])} channels by user {message.author}")
+        if len(user.channels) >= 3:
+            logger.info(f"Cross-channel spam detected: {len(user.channels)} channels by user {message.author}")
             abuseInc = max(abuseInc, 3)  # Immediate kick threshold
 
         # Update last text message (only for text, not image filenames)
-        if has_text and self.h[uid]["abuse"] < 3:
-            self.h[uid]["lm"] = message.content
+        if has_text and user.abuse < 3:
+            user.setText(message.content)
 
         # Handle IMAGE messages (attachments or image URLs)
         # For image URLs, we still track them even though they have text content
         if has_image:
-            # Track image timestamps for rate limiting
-            if current_channel not in self.h[uid]["image_timestamps"]:
-                self.h[uid]["image_timestamps"][current_channel] = []
-            self.h[uid]["image_timestamps"][current_channel].append(now)
-
-            # Track unique channels where images were posted
-            if current_channel not in self.h[uid]["image_channels"]:
-                self.h[uid]["image_channels"].append(current_channel)
+            # Track image timestamps for rate limiting and the channels where images were posted
+            user.addImage(current_channel, now)
 
             # Check for cross-channel image spam (3+ channels = immediate kick)
-            if len(self.h[uid]["image_channels"]) >= 3:
-                logger.info(f"Cross-channel image spam detected: {len(self.h[uid]['image_channels'])} channels")
+            if len(user.imageChannels) >= 3:
+                logger.info(f"Cross-channel image spam detected: {len(user.imageChannels)} channels")
                 abuseInc = max(abuseInc, 3)  # Immediate kick threshold
 
             # Check for single-channel rate limiting (5+ images in 30 seconds)
-            recent_images = [ts for ts in self.h[uid]["image_timestamps"][current_channel] if now - ts <= 30]
-            self.h[uid]["image_timestamps"][current_channel] = recent_images  # Clean old timestamps
+            recent_images = user.recentImages(current_channel, now, 30)
 
-            if len(recent_images) > 5:
-                logger.info(f"Single-channel image spam: {len(recent_images)} images in 30s")
+            if recent_images > 5:
+                logger.info(f"Single-channel image spam: {recent_images} images in 30s")
                 # Delete this message (excess image)
                 try:
                     await message.delete()
-                    self.h[uid]["msgs"].pop()  # Remove from tracking since we deleted it
+                    user.msgs.pop()  # Remove from tracking since we deleted it
                 except Exception as e:
                     logger.warning(f"Could not delete spam image: {e}")
 
                 # Only warn on the 6th image (first excess)
-                if len(recent_images) == 6:
+                if recent_images == 6:
                     botmsg = await message.channel.send(
                         f"Hey {message.author.mention}, please slow down with the images! "
                         "Posting too many images too quickly may result in moderation action."
@@ -159,10 +184,10 @@ class NinjaAntiSpam(commands.Cog):
                     abuseInc = 1  # Add abuse point for rate limit violation
 
         # filter discord invite links no matter what the sift4 distance is
-        if len(re.findall(r"(?:https?://)?(www\.)?(?:discord(?:app)?\.(?:gg|io|me|li|com))/(?!channels/)\S{,20}", message.content)):
+        if analysis.hasInvite:
             logger.info("Discord invite link found, deleting message")
             abuseInc = 1.5 # increase the abuse count (more then for a normal message)
-            self.h[uid]["msgs"].pop() # remove last saved message since we already delete them here
+            if user.msgs: user.msgs.pop() # remove last saved message since we already delete them here
             if not isinstance(message.channel, DMChannel):
                 await message.delete()
 
@@ -171,29 +196,55 @@ class NinjaAntiSpam(commands.Cog):
             if not isinstance(botmsg.channel, DMChannel):
                 await botmsg.delete()
 
-        # find stream keys in messages and delete them for safetly
-        # right now we have youtube and twitch
-        if len(re.findall(r"(?:live_\d{8}_[a-zA-Z0-9]{32})|(?:[a-z0-9]{4}-){4}[a-z0-9]{4}", message.content)):
-            logger.info("Streamkey was found in message, deleting for safety")
+        # find stream keys, tokens, passwords, ... in messages and delete them for safetly
+        if analysis.secrets:
+            logger.info(f"{', '.join(analysis.secrets)} found in message, deleting for safety")
+            if user.msgs and user.msgs[-1].id == message.id: user.msgs.pop()
             if not isinstance(message.channel, DMChannel):
                 await message.delete()
 
-            botmsg = await message.channel.send(f"Hey there {message.author.mention}, there was a stream key found in your last message. "
+            botmsg = await message.channel.send(f"Hey there {message.author.mention}, your last message contained a secret ({', '.join(analysis.secrets)}). "
                                                 "For your safety the message was deleted. You can post your message again without doxing yourself ;)")
             await sleep(12)
             if not isinstance(botmsg.channel, DMChannel):
                 await botmsg.delete()
 
-        self.h[uid]["abuse"] += abuseInc
+        user.abuse += abuseInc
         if abuseInc > 0: 
-            logger.debug(f"user {self.h[uid]} increased abuse count by {abuseInc} to {self.h[uid]['abuse']}")
-        if self.h[uid]["abuse"] >= 3: # too much spam
+            slog.debug("antispam.abuse", uid=uid, increase=abuseInc, abuse=user.abuse, channels=lambda: len(user.channels))
+        if user.abuse >= 3: # too much spam
             logger.info("starting spam cleanup")
             await self.cleanupMember(message.author)
 
+    @staticmethod
+    def reportLine(message: discord.Message) -> str:
+        """how a message shows up in the spam report, text beats attachments"""
+        channelName = getattr(message.channel, "name", message.channel.id)
+        if message.content:
+            return f"{channelName}: {message.content}"
+        if message.attachments:
+            return f"{channelName}: {message.attachments[0].filename} <{message.attachments[0].url}>"
+        return f"{channelName}: (no content)"
+
+    # kick all accounts of a raid and cleanup their messages at once
+    async def cleanupRaid(self, message: discord.Message, raiders: list[int]) -> None:
+        # the member cache may be incomplete, the authors of the tracked messages are always there
+        members = [self.h.get(uid).member if uid in self.h else message.guild.get_member(uid) for uid in raiders]
+        members = [m for m in members if m is not None]
+        logger.warning(f"Raid detected: {', '.join(map(str, members))} posted the same text")
+        slog.debug("antispam.raid", guild=message.guild.id, accounts=len(raiders), found=len(members))
+        if len(raiders) > 1:
+            botlogCh = self.bot.get_channel(self.bot.config.snapshot.forGuild(message.guild.id).botlogChannel)
+            if botlogCh:
+                await botlogCh.send(f"Raid detected: {len(raiders)} accounts posted the same text, cleaning up")
+        results = await asyncio.gather(*[self.cleanupMember(member) for member in members], return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.exception(result)
+
     # function to (kick a member and) cleanup their messages
     async def cleanupMember(self, author, kick=True) -> None:
-        botlogCh = self.bot.get_channel(int(self.bot.config.get("botlogChannel")))
+        botlogCh = self.bot.get_channel(self.bot.config.snapshot.forGuild(author.guild.id).botlogChannel)
 
         if kick:
             try:
@@ -205,61 +256,86 @@ class NinjaAntiSpam(commands.Cog):
 
         while True:
             try:
-                if author.id in self.h:
-                    userData = self.h[author.id].copy()
-                    del self.h[author.id]
-                    if userData["msgs"]:
-                        await self.deleteOldMessages(userData["msgs"], botlogCh)
-                    elif userData["lm"]:
-                        # if we don't have message history (aka there is nothing to cleanup), only post the last message we saved
-                        await self.sendReport(botlogCh, userData["lm"])
-                    else:
-                        await self.sendReport(botlogCh, "No History available")
-                    logger.debug(userData)
-                    await sleep(2)
-                else:
+                userData = self.h.pop(author.id)
+                if userData is None:
                     break
+                if userData.msgs:
+                    await self.deleteOldMessages(userData.msgs, botlogCh)
+                elif userData.lastText:
+                    # if we don't have message history (aka there is nothing to cleanup), only post the last message we saved
+                    await self.sendReport(botlogCh, userData.lastText)
+                else:
+                    await self.sendReport(botlogCh, "No History available")
+                logger.debug(userData.toDict())
+                await sleep(2)
             except Exception as E:
                 logger.exception(E)
                 break
         logger.debug("cleanupMember() done")
 
     async def deleteOldMessages(self, msgs, botlogCh) -> None:
-        blMsg = line = ""
-        for mid, chid in msgs:
+        """Delete the tracked messages, grouped by channel and all channels at once"""
+        byChannel: dict[int, list[int]] = {}
+        for tracked in msgs:
+            logger.warning(tracked.line)
+            byChannel.setdefault(tracked.channelId, []).append(tracked.id)
+        # the report is built from what was captured when the messages came in, nothing is fetched
+        results = await asyncio.gather(
+            self.sendReports(botlogCh, [tracked.line for tracked in msgs]),
+            *[self.deleteChannelMessages(channelId, messageIds) for channelId, messageIds in byChannel.items()],
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.exception(result)
+
+    async def deleteChannelMessages(self, channelId: int, messageIds: list[int]) -> None:
+        # requests of one channel share a rate limit bucket that discord.py queues, other channels don't wait for it
+        channel = self.bot.get_channel(channelId)
+        if channel is None: return
+        # bulk delete takes up to 100 messages that are younger than 14 days
+        bulkAfter = discord.utils.time_snowflake(discord.utils.utcnow() - timedelta(days=14) + timedelta(minutes=5))
+        bulk = [mid for mid in messageIds if mid > bulkAfter]
+        single = [mid for mid in messageIds if mid <= bulkAfter]
+        if len(bulk) > 1 and hasattr(channel, "delete_messages"):
+            for i in range(0, len(bulk), 100):
+                chunk = bulk[i:i + 100]
+                try:
+                    await channel.delete_messages([discord.Object(mid) for mid in chunk], reason="Spam")
+                except discord.HTTPException as E:
+                    logger.warning(f"Bulk delete in {channel} failed, deleting one by one: {E}")
+                    single += chunk
+        else:
+            single += bulk
+        for mid in single:
             try:
-                spamChannel = self.bot.get_channel(chid)
-                msg = await spamChannel.fetch_message(mid)
-                # text message beats attachments
-                line = f"{msg.channel.name}: (no content)"
-                if msg.attachments:
-                    line = f"{msg.channel.name}: {msg.attachments[0].filename} <{msg.attachments[0].url}>"
-                if msg.content:
-                    line = f"{msg.channel.name}: {msg.content}"
-                logger.warning(line)
-                await msg.delete()
-                if len(blMsg) + len(line) > 4090:
-                    await self.sendReport(botlogCh, blMsg)
-                    blMsg = line
-                else:
-                    blMsg += line + "\n"
-            except Exception as E:
-                logger.exception(E)
-        await self.sendReport(botlogCh, blMsg)
-    
+                await channel.get_partial_message(mid).delete()
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as E:
+                # keep going, the other messages of the channel may still be deletable
+                logger.warning(f"Could not delete message {mid} in {channel}: {E}")
+
+    async def sendReports(self, ch, lines: list[str]) -> None:
+        """one embed per 4096 characters of report lines"""
+        report = ""
+        for line in lines:
+            if report and len(report) + len(line) > 4090:
+                await self.sendReport(ch, report)
+                report = ""
+            report += line + "\n"
+        await self.sendReport(ch, report)
+
     async def sendReport(self, ch, msg) -> None:
         await ch.send(embed=embedBuilder.ninjaEmbed(description=msg[:4096].rstrip()))
 
-    # use task to cleanup old user objects
-    @tasks.loop(minutes=2)
+    # users also expire whenever a new one is tracked, this catches quiet times.
+    # only the expired users at the front of the tracker are touched, not everybody
+    @tasks.loop(seconds=5)
     async def historyCleanupJob(self) -> None:
-        logger.debug("Running antispam history-cleanup job")
-        logger.debug(f"self.h before history-cleanup: {self.h}")
-        now = datetime.now().timestamp()
-        for uid, d in self.h.copy().items():
-            if now - d["lmts"] > 60:
-                del self.h[uid]
-        logger.debug(f"self.h after history-cleanup: {self.h}")
+        expired = self.h.expire(time.monotonic())
+        if expired:
+            slog.debug("antispam.historyCleanup", expired=expired, tracked=len(self.h))
 
     @historyCleanupJob.before_loop
     async def before_historyCleanupJob(self) -> None:
@@ -269,15 +345,25 @@ class NinjaAntiSpam(commands.Cog):
     @tasks.loop(hours=12)
     async def botlogCleanupJob(self) -> None:
         logger.debug("Running botlog channel cleanup job")
-        botlogChannel = self.bot.get_channel(int(self.bot.config.get("botlogChannel")))
-        async for message in botlogChannel.history(limit=300, before=datetime.today()-timedelta(days=30)):
-            if message.author == self.bot.user and "has been kicked" not in message.content:
-                await message.delete()
+        for channelId in self.bot.config.allGuildValues("botlogChannel"):
+            botlogChannel = self.bot.get_channel(int(channelId))
+            if botlogChannel is None: continue
+            async for message in botlogChannel.history(limit=300, before=datetime.today()-timedelta(days=30)):
+                if message.author == self.bot.user and "has been kicked" not in message.content:
+                    await message.delete()
 
     @botlogCleanupJob.before_loop
     async def before_botlogCleanupJob(self) -> None:
         await self.bot.wait_until_ready()
 
+    def exportState(self) -> dict:
+        """Keep tracked users across an extension reload"""
+        return {"h": self.h}
+
+    def importState(self, state: dict) -> None:
+        if isinstance(state.get("h"), UserTracker):
+            self.h.merge(state["h"])
+
     async def getCommands(self) -> list:
         """Return the available commands as a list"""
         """This cog doesn't have commands"""
@@ -285,6 +371,10 @@ class NinjaAntiSpam(commands.Cog):
 
     async def cog_unload(self) -> None:
         logger.debug(f"Shutting down {self.__class__.__name__}")
+        self.bot.router.unregister(f"{self.__class__.__name__}.onMessage")
+        self.bot.config.unsubscribe(f"{self.__class__.__name__}.raidIndex")
+        self.bot.config.unsubscribe(f"{self.__class__.__name__}.tracker")
+        self.bot.config.unsubscribe(f"{self.__class__.__name__}.scanner")
         self.historyCleanupJob.cancel()
         self.botlogCleanupJob.cancel()
 
@@ -14,14 +14,9 @@ class NinjaBotHelp(commands.Cog):
     @commands.command(aliases=["list"])
     async def commands(self, ctx) -> None:
         """List all available commands"""
-        allCommands = []
-        for cog in self.bot.cogs:
-            cogInstance = self.bot.get_cog(cog)
-            if not cogInstance.isInternal:
-                allCommands.extend(await cogInstance.getCommands())
         await ctx.send(embed=embedBuilder.ninjaEmbed(
             title="Available commands:",
-            description="".join(["!" + c + "\n" for c in sorted(allCommands)])
+            description="".join(["!" + c + "\n" for c in self.bot.commandIndex.catalog()])
             ))
         if not isinstance(ctx.channel, DMChannel):
             await ctx.message.delete()
@@ -1,5 +1,7 @@
 import logging
+import math
 from discord.ext import commands
+import utils.metrics as metrics
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
@@ -12,9 +14,65 @@ class NinjaBotUtils(commands.Cog):
     @commands.command(hidden=True)
     @commands.has_role("Moderator")
     @commands.guild_only()
-    async def update(self, ctx) -> None:
-        """Update the available commands by reloading the bot extensions"""
-        await self.bot.reloadExtensions(ctx)
+    async def update(self, ctx, mode: str = "") -> None:
+        """Reload the bot extensions that changed, or all of them with '!update all'"""
+        await self.bot.reloadExtensions(ctx, changedOnly=mode.lower() != "all")
+
+    @commands.command(hidden=True)
+    @commands.has_role("Moderator")
+    @commands.guild_only()
+    async def sync(self, ctx) -> None:
+        """Force pushing the application commands to discord"""
+        await self.bot.syncAppCommands(force=True)
+        await ctx.send("Application commands synced")
+
+    @commands.command(hidden=True)
+    @commands.has_role("Moderator")
+    @commands.guild_only()
+    async def stats(self, ctx) -> None:
+        """Show where the bot spends its time"""
+        latency = self.bot.latency
+        lines = [f"gateway latency: {'n/a' if math.isnan(latency) else f'{latency * 1000:.0f} ms'}", "",
+                 f"{'handler':<44}{'calls':>7}{'total':>9}{'p50':>8}{'p99':>8}"]
+        for name, row in metrics.topHandlers(10):
+            lines.append(f"{name[:43]:<44}{row['count']:>7}{row['sum']:>8.1f}s"
+                         f"{row['p50'] * 1000:>6.0f}ms{row['p99'] * 1000:>6.0f}ms")
+        hosts = self.bot.httpClient.stats()
+        if hosts:
+            lines += ["", f"{'http host':<44}{'calls':>7}{'errors':>8}{'avg':>8}"]
+            for host, s in hosts.items():
+                lines.append(f"{host[:43]:<44}{s['requests']:>7}{s['errors']:>8}{s['avgMs']:>6.0f}ms")
+        if self.bot.loopWatchdog:
+            lag = self.bot.loopWatchdog.summary()
+            lines += ["", f"loop lag p50 {lag['p50'] * 1000:.1f} ms, p99 {lag['p99'] * 1000:.1f} ms, {lag['stalls']} stalls"]
+            for culprit, count, worst in lag["culprits"]:
+                lines.append(f"  {culprit[:50]:<52}{count:>5}x  worst {worst * 1000:.0f} ms")
+        rest = metrics.restSeconds.rows()
+        if rest:
+            lines += ["", f"discord REST: {sum(r['count'] for r in rest)} calls, {sum(r['sum'] for r in rest):.1f}s total"]
+        await ctx.send("```\n" + "\n".join(lines)[:1900] + "\n```")
+
+    @commands.command(hidden=True)
+    @commands.has_role("Moderator")
+    @commands.guild_only()
+    async def restbudget(self, ctx) -> None:
+        """Show which cogs and features use up the discord rate limits"""
+        rows = metrics.restBudget(15)
+        if not rows:
+            await ctx.send("No discord REST calls recorded yet")
+            return
+        perCog = {}
+        for labels, calls in metrics.restCalls.items():
+            cog = labels[0].split(".")[0]
+            perCog[cog] = perCog.get(cog, 0) + calls
+        lines = [f"{'cog':<30}{'calls':>7}"]
+        for cog, calls in sorted(perCog.items(), key=lambda c: c[1], reverse=True)[:8]:
+            lines.append(f"{cog[:29]:<30}{calls:>7.0f}")
+        lines += ["", f"{'feature / route':<52}{'calls':>7}{'429s':>6}{'waited':>9}"]
+        for row in rows:
+            lines.append(f"{row['feature'][:51]:<52}{row['calls']:>7}{row['rateLimited']:>6}{row['waitSeconds']:>8.1f}s")
+            lines.append(f"  {row['route'][:66]}")
+        await ctx.send("```\n" + "\n".join(lines)[:1900] + "\n```")
 
     async def getCommands(self) -> list:
         """Return the available commands as a list"""
@@ -1,11 +1,11 @@
 import logging
+import aiohttp
 import utils.embedBuilder as embedBuilder
+import utils.structLog as structLog
 import re
 import asyncio
 import json
-import aiohttp
 import discord
-import time
 from discord import app_commands
 from discord.ext import commands
 from typing import Union
@@ -13,23 +13,30 @@ from typing import Union
 # This module is basically deprecated by NinjaAI
 
 logger = logging.getLogger("NinjaBot." + __name__)
+slog = structLog.getLogger("NinjaBot." + __name__)
+
+# seconds a resolved docs url is reused
+URL_CACHE_TTL = 7 * 86400
 
 class NinjaDocs(commands.Cog):
     def __init__(self, bot) -> None:
         logger.debug(f"Loading {self.__class__.__name__}")
         self.bot = bot
         self.isInternal = False
-        self.http = aiohttp.ClientSession()
         self.ninjaDocsBaseUrl = "https://docs.vdo.ninja/"
         self.gbBaseUrl = "https://api.gitbook.com/v1/"
         self.gbHeaders = {
                 "Authorization": f"Bearer {self.bot.config.get('gitbookApiKey')}"
             }
-        self.urlCache: dict[str, tuple[int, str]] = {}
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        """The bot's shared HTTP session"""
+        return self.bot.httpClient.session
 
     @staticmethod
     def _checkIfInATEC(interaction: discord.Interaction) -> bool:
-        return str(interaction.channel_id) not in interaction.client.config.get("autoThreadEnabledChannels")
+        return interaction.channel_id not in interaction.client.config.snapshot.forGuild(interaction.guild_id).autoThreadChannels
 
     # app command for manually asking questions to gitbook lens
     @app_commands.command()
@@ -138,26 +145,20 @@ class NinjaDocs(commands.Cog):
         pageId = page["page"]
         pageSelection = page["sections"][0] if len(page["sections"]) == 1 else ""
         pageKey = f"{pageId}|{pageSelection}"
-        logger.debug(pageKey)
-        logger.debug(self.urlCache)
-
-        # if page is in cache
-        if pageKey in self.urlCache:
-            # and cache is no older then 7 days
-            if time.time() - self.urlCache[pageKey][0] > 7*86400:
-                # remove from cache
-                logger.debug(f"removed {str(self.urlCache[pageKey])} from cache because of age")
-                self.urlCache.pop(pageKey)
-            else:
-                logger.debug(f"returning from cache {pageKey} -> {str(self.urlCache[pageKey])}")
-                return self.urlCache[pageKey][1]
+        slog.debug("docs.resolvePage", pageKey=pageKey)
+
+        # resolved urls are cached in the state store for 7 days
+        cachedUrl = await self.bot.state.get("docs.urls", pageKey)
+        if cachedUrl:
+            slog.debug("docs.cacheHit", pageKey=pageKey, url=cachedUrl)
+            return cachedUrl
 
         # it's not in cache, run request
         pageResponse = await self.resolveGbPageIdToUrl(pageId)
         if pageResponse:
             pageUrl = self.ninjaDocsBaseUrl + pageResponse["path"] + self.resolveSectionIdToAnchor(pageResponse, pageSelection)
             # save to cache
-            self.urlCache.update({pageKey: (int(time.time()), pageUrl)})
+            await self.bot.state.put("docs.urls", pageKey, pageUrl, ttl=URL_CACHE_TTL)
             logger.debug(f"returning from api {pageKey} -> {pageUrl}")
             return pageUrl
         return None
@@ -187,7 +188,7 @@ class NinjaDocs(commands.Cog):
         try:
             async with self.http.post(self.gbBaseUrl + endpoint, json=data, headers=self.gbHeaders) as resp:
                 apiResponse = await resp.json(content_type=None)
-                logger.debug(await resp.text())
+                slog.debug("docs.lensResponse", every=10.0, status=resp.status, body=lambda: json.dumps(apiResponse))
                 logger.info(f"'status code': '{resp.status}', "\
                             f"'content_type': '{resp.content_type}', "\
                             f"'X-Ratelimit-Limit': '{resp.headers.get('X-Ratelimit-Limit')}', "\
@@ -1,9 +1,6 @@
 import logging
-import pathlib
-from re import S
 from discord.ext import commands, tasks
-from utils.commandReplyProcessor import commandProc
-from utils.jsonFile import fileHelper
+from utils.commandIndex import SOURCE_DYNAMIC
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
@@ -12,13 +9,9 @@ class NinjaDynCmds(commands.Cog):
         logger.debug(f"Loading {self.__class__.__name__}")
         self.bot = bot
         self.isInternal = False
-        self._fh = fileHelper(pathlib.Path(__file__).parent.resolve() / "../suggestions.json")
         self.commands = {}
         self.loadCommands.start()
 
-    async def process_command(self, ctx) -> bool:
-        return await commandProc(self, ctx)
-
     @commands.command(hidden=True, aliases=["addcom"])
     @commands.has_role("Moderator")
     async def add(self, ctx: commands.Context, command: str, reply: str, *args) -> None:
@@ -33,8 +26,8 @@ class NinjaDynCmds(commands.Cog):
             await ctx.send("Command already exists as a temp command. please use !delete <command> or !delcom <command> first")
         else:
             self.commands[command] = reply
-            await self._saveToFile()
-            await self._loadFromFile()
+            await self.bot.state.put("dynCmds", command, reply)
+            await self._load()
             await ctx.send(f"Command '{command}' with reply '{reply}' has been added")
 
     @commands.command(hidden=True, aliases=["delcom"])
@@ -42,8 +35,8 @@ class NinjaDynCmds(commands.Cog):
     async def delete(self, ctx: commands.Context, command: str) -> None:
         if command in self.commands:
             del self.commands[command]
-            await self._saveToFile()
-            await self._loadFromFile()
+            await self.bot.state.delete("dynCmds", command)
+            await self._load()
             await ctx.send(f"Command '{command}' was successfully deleted from my memory")
         else:
             NinjaGithub = self.bot.get_cog("NinjaGithub")
@@ -57,18 +50,15 @@ class NinjaDynCmds(commands.Cog):
         """Post error that happen inside this cog to channel"""
         await ctx.send(str(error))
 
-    async def _loadFromFile(self) -> None:
-        logger.debug("Loading dyn cmds from file")
-        self.commands = await self._fh.read()
-
-    async def _saveToFile(self) -> None:
-        logger.debug("Saving dyn cmds to file")
-        await self._fh.write(self.commands)
+    async def _load(self) -> None:
+        logger.debug("Loading dyn cmds from the state store")
+        self.commands = await self.bot.state.items("dynCmds")
+        self.bot.commandIndex.setReplies(SOURCE_DYNAMIC, self.commands)
 
     # run only once
     @tasks.loop(count=1)
     async def loadCommands(self) -> None:
-        await self._loadFromFile()
+        await self._load()
 
     async def getCommands(self) -> list:
         """Return the available commands as a list"""
@@ -77,6 +67,7 @@ class NinjaDynCmds(commands.Cog):
     async def cog_unload(self) -> None:
         logger.debug(f"Shutting down {self.__class__.__name__}")
         self.loadCommands.cancel()
+        self.bot.commandIndex.setReplies(SOURCE_DYNAMIC, {})
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaDynCmds(bot))
\ No newline at end of file
@@ -1,7 +1,6 @@
 import logging
-import aiohttp
 from discord.ext import commands, tasks
-from utils.commandReplyProcessor import commandProc
+from utils.commandIndex import SOURCE_GITHUB
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
@@ -16,23 +15,30 @@ class NinjaGithub(commands.Cog):
 
     async def fetchCommands(self) -> None:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.githubUrl) as resp:
-                    self.commands = await resp.json(content_type="text/plain")
+            async with self.bot.httpClient.session.get(self.githubUrl) as resp:
+                self.commands = await resp.json(content_type="text/plain")
         except Exception as E:
             raise E
         else:
             logger.debug("Sucessfully loaded commands from github")
             #logger.debug(json.dumps(self.commands, indent=2, sort_keys=True))
-
-    async def process_command(self, ctx) -> bool:
-        return await commandProc(self, ctx)
+            self.bot.commandIndex.setReplies(SOURCE_GITHUB, self.commands)
 
     @tasks.loop(hours=1)
     async def regularUpdater(self) -> None:
         logger.debug("Regular github update started")
         await self.fetchCommands()
 
+    def exportState(self) -> dict:
+        """Keep the last fetched commands across an extension reload"""
+        return {"commands": self.commands}
+
+    def importState(self, state: dict) -> None:
+        # only fill in if the new instance didn't already fetch fresh ones
+        if not self.commands and state.get("commands"):
+            self.commands = state["commands"]
+            self.bot.commandIndex.setReplies(SOURCE_GITHUB, self.commands)
+
     async def getCommands(self) -> list:
         """Return the available commands as a list"""
         return list(self.commands.keys())
@@ -40,6 +46,7 @@ class NinjaGithub(commands.Cog):
     async def cog_unload(self) -> None:
         logger.debug(f"Shutting down {self.__class__.__name__}")
         self.regularUpdater.cancel()
+        self.bot.commandIndex.setReplies(SOURCE_GITHUB, {})
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaGithub(bot))
\ No newline at end of file
@@ -1,13 +1,14 @@
 import logging
+import aiohttp
 import asyncio
 import discord
-import aiohttp
 import json
 from discord.ext import commands
 from discord import app_commands
 from discord.ui import View, Button
 from datetime import datetime
 import uuid
+from utils.messageRouter import MessageContext, AUTHOR_HUMAN, AUTHOR_BOT
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
@@ -23,8 +24,7 @@ class ServiceApprovalView(View):
     async def approve_button(self, interaction: discord.Interaction, button: Button):
         """Handle approve button click"""
         # Check if user is an approved reviewer
-        approvers = self.cog.bot.config.get("servicesApprovers") if self.cog.bot.config.has("servicesApprovers") else []
-        if str(interaction.user.id) not in approvers:
+        if interaction.user.id not in self.cog.bot.config.snapshot.forGuild(interaction.guild_id).servicesApprovers:
             await interaction.response.send_message("You don't have permission to approve listings.", ephemeral=True)
             return
 
@@ -78,8 +78,7 @@ class ServiceApprovalView(View):
     async def reject_button(self, interaction: discord.Interaction, button: Button):
         """Handle reject button click"""
         # Check if user is an approved reviewer
-        approvers = self.cog.bot.config.get("servicesApprovers") if self.cog.bot.config.has("servicesApprovers") else []
-        if str(interaction.user.id) not in approvers:
+        if interaction.user.id not in self.cog.bot.config.snapshot.forGuild(interaction.guild_id).servicesApprovers:
             await interaction.response.send_message("You don't have permission to reject listings.", ephemeral=True)
             return
 
@@ -129,31 +128,42 @@ class NinjaServices(commands.Cog):
         logger.debug(f"Loading {self.__class__.__name__}")
         self.bot = bot
         self.isInternal = True
-        self.http = aiohttp.ClientSession()
         # Lock to prevent race conditions on gist updates
         self.gist_lock = asyncio.Lock()
         # Register persistent view
         self.approval_view = ServiceApprovalView(self)
         bot.add_view(self.approval_view)
 
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        """The bot's shared HTTP session"""
+        return self.bot.httpClient.session
+
     def cog_check(self, ctx) -> bool:
         """Only allow commands in guild context"""
         return ctx.guild is not None
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message) -> None:
+    async def cog_load(self) -> None:
+        self._registerRoute()
+        # channels edited in the config file are picked up without a reload
+        self.bot.config.subscribe(f"{self.__class__.__name__}.onMessage", self._registerRoute, keys=("servicesChannel",))
+
+    def _registerRoute(self, changed: frozenset[str] | None = None) -> None:
+        # only the services review channel is of interest, webhook messages count as bot messages
+        self.bot.router.register(
+            f"{self.__class__.__name__}.onMessage",
+            self.onMessage,
+            channels=self.bot.config.allGuildValues("servicesChannel"),
+            authors=(AUTHOR_HUMAN, AUTHOR_BOT),
+            kinds=None
+        )
+
+    async def onMessage(self, mctx: MessageContext) -> None:
         """Listen for webhook messages in the services channel and add approval buttons"""
-
-        # Check if services feature is configured
-        if not self.bot.config.has("servicesChannel"):
-            return
-
-        # Check if message is in the services channel
-        if message.channel.id != int(self.bot.config.get("servicesChannel")):
-            return
+        message = mctx.message
 
         # Check if it's a webhook message
-        if not message.webhook_id:
+        if not mctx.isWebhook:
             return
 
         # Check if it has embeds (our submission format)
@@ -177,12 +187,9 @@ class NinjaServices(commands.Cog):
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
         """Fallback: Allow approving submissions via checkmark reaction on the original webhook message"""
 
-        # Check if services feature is configured
-        if not self.bot.config.has("servicesChannel"):
-            return
-
-        # Check if reaction is in the services channel
-        if payload.channel_id != int(self.bot.config.get("servicesChannel")):
+        # Check if services feature is configured and the reaction is in the services channel of that guild
+        settings = self.bot.config.snapshot.forGuild(payload.guild_id)
+        if settings.servicesChannel is None or payload.channel_id != settings.servicesChannel:
             return
 
         # Check if it's a checkmark or X reaction
@@ -190,8 +197,7 @@ class NinjaServices(commands.Cog):
             return
 
         # Check if user is an approver
-        approvers = self.bot.config.get("servicesApprovers") if self.bot.config.has("servicesApprovers") else []
-        if str(payload.user_id) not in approvers:
+        if payload.user_id not in settings.servicesApprovers:
             return
 
         # Ignore bot's own reactions
@@ -477,7 +483,7 @@ class NinjaServices(commands.Cog):
         """Remove a service listing by Discord username"""
 
         # Check if user is an approved reviewer
-        if str(interaction.user.id) not in self.bot.config.get("servicesApprovers", []):
+        if interaction.user.id not in self.bot.config.snapshot.forGuild(interaction.guild_id).servicesApprovers:
             await interaction.response.send_message("You don't have permission to remove service listings.", ephemeral=True)
             return
 
@@ -617,7 +623,8 @@ class NinjaServices(commands.Cog):
 
     async def cog_unload(self) -> None:
         logger.debug(f"Shutting down {self.__class__.__name__}")
-        await self.http.close()
+        self.bot.router.unregister(f"{self.__class__.__name__}.onMessage")
+        self.bot.config.unsubscribe(f"{self.__class__.__name__}.onMessage")
 
 
 async def setup(bot) -> None:
@@ -4,11 +4,14 @@ import re
 import discord
 import utils.embedBuilder as embedBuilder
 import utils.ai as ai
+import utils.structLog as structLog
 from datetime import datetime, timedelta, timezone
 from discord.ext import commands
 from discord import app_commands
+from utils.messageRouter import MessageContext, CHANNEL_GUILD, CHANNEL_THREAD
 
 logger = logging.getLogger("NinjaBot." + __name__)
+slog = structLog.getLogger("NinjaBot." + __name__)
 
 # The popup modal to rename a thread
 class ThreadTitleChangeModal(discord.ui.Modal, title="Rename Thread"):
@@ -93,12 +96,25 @@ class NinjaThreadManager(commands.Cog):
         self.isInternal = True
         self.ai = ai.NinjaAI(bot)
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message) -> None:
-        # Ignore bot messages
-        if message.author == self.bot.user or message.author.bot:
-            return
-                
+    async def cog_load(self) -> None:
+        self._registerRoute()
+        # channels edited in the config file are picked up without a reload
+        self.bot.config.subscribe(f"{self.__class__.__name__}.onMessage", self._registerRoute, keys=("autoThreadEnabledChannels",))
+
+    def _registerRoute(self, changed: frozenset[str] | None = None) -> None:
+        # only threads and auto thread channels are of interest, bot messages are filtered by the router
+        self.bot.router.register(
+            f"{self.__class__.__name__}.onMessage",
+            self.onMessage,
+            channels=self.bot.config.allGuildValues("autoThreadEnabledChannels"),
+            channelTypes=(CHANNEL_THREAD,)
+        )
+
+    async def onMessage(self, mctx: MessageContext) -> None:
+        message = mctx.message
+        # compiled settings of the guild the message is from
+        settings = self.bot.config.snapshot.forGuild(mctx.guildId)
+
         # Handle reply to bot in an existing thread
         if isinstance(message.channel, discord.Thread) and message.reference and message.reference.message_id and self.ai:
             try:
@@ -138,7 +154,7 @@ class NinjaThreadManager(commands.Cog):
             try:
                 channel_id_str = str(message.channel.parent_id)
                 
-                if self.bot.config.has("aiEnabledChannels") and channel_id_str in self.bot.config.get("aiEnabledChannels"):
+                if message.channel.parent_id in settings.aiChannels:
                     # Get all messages in the thread so far
                     thread_messages = []
                     async for msg in message.channel.history(limit=10):
@@ -187,42 +203,31 @@ class NinjaThreadManager(commands.Cog):
             except Exception as e:
                 logger.exception(f"Error processing thread message: {e}")
         
-        # Get context for regular message processing (thread creation)
-        ctx = await self.bot.get_context(message)
-        
         # Check if we should create a thread
-        if (not isinstance(ctx.message.channel, discord.DMChannel) 
-            and self.bot.config.has("autoThreadEnabledChannels") 
-            and self.bot.config.has("autoThreadWelcomeMapping") 
-            and str(ctx.channel.id) in self.bot.config.get("autoThreadEnabledChannels")):
+        if mctx.channelType == CHANNEL_GUILD and settings.createThreads:
 
             # Create thread
             try:
-                createdThread = await ctx.message.create_thread(
-                    name=self._getThreadTitle(ctx.message), 
+                createdThread = await message.create_thread(
+                    name=self._getThreadTitle(message), 
                     auto_archive_duration=10080, 
                     reason=__name__
                 )
                 
                 # Send welcome message
-                welcomeMapping = self.bot.config.get("autoThreadWelcomeMapping")
                 try:
-                    if str(ctx.channel.id) in welcomeMapping:
-                        welcomeText = self.bot.config.get(welcomeMapping[str(ctx.channel.id)])
-                        welcomeText = welcomeText.format(usermention=ctx.message.author.mention)
+                    welcomeText = settings.welcomeTexts.get(message.channel.id)
+                    if welcomeText is not None:
+                        welcomeText = welcomeText.format(usermention=message.author.mention)
                         embed = embedBuilder.ninjaEmbed(description=welcomeText)
-                        await createdThread.send(embed=embed, view=ThreadManagementButtons(self, ctx.message.author.id))
+                        await createdThread.send(embed=embed, view=ThreadManagementButtons(self, message.author.id))
                 except Exception as e:
                     logger.exception(f"Error sending welcome message: {e}")
                 
                 # Add logged in staff to thread
                 try:
-                    # Fix: Get loggedOnSupportStaff without default value
-                    loggedOnSupportStaff = self.bot.config.get("loggedOnSupportStaff")
-                    if loggedOnSupportStaff is None:
-                        loggedOnSupportStaff = []
-                        
-                    for staff in loggedOnSupportStaff:
+                    loggedOnSupportStaff = await self.bot.state.members(f"supportStaff.{mctx.guildId}")
+                    for staff in map(int, loggedOnSupportStaff):
                         user = self.bot.get_user(staff)
                         # if user not in cache, try api request
                         if not user:
@@ -232,29 +237,20 @@ class NinjaThreadManager(commands.Cog):
                     logger.exception(f"Error adding staff to thread: {e}")
                 
                 # Check if AI should respond in this channel
-                if self.ai and self.bot.config.has("aiEnabledChannels") and ctx.message.content:
-                    # Fix: Get aiEnabledChannels without default value
-                    ai_enabled_channels = self.bot.config.get("aiEnabledChannels")
-                    if ai_enabled_channels is None:
-                        ai_enabled_channels = []
-                        
-                    logger.info(f"Checking if AI should respond in channel: {ctx.channel.id}")
-                    logger.debug(f"AI enabled channels: {ai_enabled_channels}")
-                    
-                    if self.bot.config.has("ai"):
-                        logger.debug(f"AI config: {self.bot.config.get('ai')}")
-                    
-                    channel_id_str = str(ctx.channel.id)
-                    logger.info(f"Current channel ID: {channel_id_str}")
-                    logger.info(f"Channel in AI enabled list: {channel_id_str in ai_enabled_channels}")
+                if self.ai and settings.aiChannels and message.content:
+                    logger.info(f"Checking if AI should respond in channel: {message.channel.id}")
+                    slog.debug("threads.aiChannels", every=60.0, channels=lambda: sorted(settings.aiChannels))
+
+                    channel_id_str = str(message.channel.id)
+                    logger.info(f"Channel in AI enabled list: {message.channel.id in settings.aiChannels}")
                     
-                    if channel_id_str in ai_enabled_channels:
+                    if message.channel.id in settings.aiChannels:
                         try:
                             # Format message for AI
                             messages = [{
-                                "content": ctx.message.content,
+                                "content": message.content,
                                 "author": {
-                                    "id": ctx.message.author.id,
+                                    "id": message.author.id,
                                     "bot": False
                                 }
                             }]
@@ -273,7 +269,7 @@ class NinjaThreadManager(commands.Cog):
                                     await createdThread.send(
                                         "**Here's what NinjaBot thinks might help with your question. If it answers your question, click the button below or reply for more assistance:**",
                                         embed=ai_embed,
-                                        view=AIReplyButtons(self, ctx.message.author.id)
+                                        view=AIReplyButtons(self, message.author.id)
                                     )
                         except Exception as e:
                             logger.exception(f"Error in AI response process: {e}")
@@ -351,15 +347,11 @@ class NinjaThreadManager(commands.Cog):
     @app_commands.checks.has_permissions(manage_messages=True)
     async def login(self, interaction: discord.Interaction) -> None:
         """Login to automatic pings for support thread creations"""
-        loggedOnSupportStaff = self.bot.config.get("loggedOnSupportStaff")
-        if loggedOnSupportStaff is None:
-            loggedOnSupportStaff = []
-            
-        if interaction.user.id in loggedOnSupportStaff:
+        namespace = f"supportStaff.{interaction.guild_id}"
+        if await self.bot.state.contains(namespace, interaction.user.id):
             await interaction.response.send_message(f"You are already logged in to NinjaSupport! :x:", ephemeral=True)
             return
-        loggedOnSupportStaff.append(interaction.user.id)
-        await self.bot.config.set("loggedOnSupportStaff", loggedOnSupportStaff)
+        await self.bot.state.add(namespace, [interaction.user.id])
         await interaction.response.send_message(f"You are now logged in to NinjaSupport :white_check_mark: :bell:", ephemeral=True)
 
     @app_commands.command()
@@ -367,15 +359,9 @@ class NinjaThreadManager(commands.Cog):
     @app_commands.checks.has_permissions(manage_messages=True)
     async def logout(self, interaction: discord.Interaction) -> None:
         """Logout from automatic pings for support thread creations"""
-        loggedOnSupportStaff = self.bot.config.get("loggedOnSupportStaff")
-        if loggedOnSupportStaff is None:
-            loggedOnSupportStaff = []
-            
-        if interaction.user.id not in loggedOnSupportStaff:
+        if not await self.bot.state.discard(f"supportStaff.{interaction.guild_id}", interaction.user.id):
             await interaction.response.send_message(f"You are not logged in to NinjaSupport! :x:", ephemeral=True)
             return
-        loggedOnSupportStaff.remove(interaction.user.id)
-        await self.bot.config.set("loggedOnSupportStaff", loggedOnSupportStaff)
         await interaction.response.send_message(f"You are now logged out of NinjaSupport :zzz: :no_bell:", ephemeral=True)
 
     @app_commands.command()
@@ -469,8 +455,8 @@ class NinjaThreadManager(commands.Cog):
 
     async def cog_unload(self) -> None:
         logger.debug(f"Shutting down {self.__class__.__name__}")
-        if self.ai:
-            await self.ai.close()
+        self.bot.router.unregister(f"{self.__class__.__name__}.onMessage")
+        self.bot.config.unsubscribe(f"{self.__class__.__name__}.onMessage")
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaThreadManager(bot))
\ No newline at end of file
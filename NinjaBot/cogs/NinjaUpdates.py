@@ -1,11 +1,12 @@
 import logging
+import aiohttp
 import re
 import discord
-import aiohttp
 import json
 from functools import partial
 from discord.ext import commands
 from datetime import datetime
+from utils.messageRouter import MessageContext, AUTHOR_HUMAN, AUTHOR_BOT
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
@@ -14,26 +15,47 @@ class NinjaUpdates(commands.Cog):
         logger.debug(f"Loading {self.__class__.__name__}")
         self.bot = bot
         self.isInternal = True
-        self.http = aiohttp.ClientSession()
 
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message) -> None:
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        """The bot's shared HTTP session"""
+        return self.bot.httpClient.session
+
+    async def cog_load(self) -> None:
+        self._registerRoute()
+        # channels edited in the config file are picked up without a reload
+        self.bot.config.subscribe(f"{self.__class__.__name__}.onMessage", self._registerRoute, keys=("updatesChannel",))
+
+    def _registerRoute(self, changed: frozenset[str] | None = None) -> None:
+        # only the updates channel is of interest
+        self.bot.router.register(
+            f"{self.__class__.__name__}.onMessage",
+            self.onMessage,
+            channels=self.bot.config.allGuildValues("updatesChannel"),
+            authors=(AUTHOR_HUMAN, AUTHOR_BOT),
+            kinds=None
+        )
+
+    async def onMessage(self, mctx: MessageContext) -> None:
+        await self.publishUpdate(mctx.message)
+
+    async def publishUpdate(self, message: discord.Message) -> None:
+        # every guild can publish to its own gist
+        guildId = message.guild.id if message.guild else None
+        config = self.bot.config.forGuild(guildId)
         # Check if config options are there and are the expected values
-        if (self.bot.config.has("updatesChannel") \
-            and self.bot.config.has("allowedUpdateUsers") \
-            and message.channel.id == int(self.bot.config.get("updatesChannel")) \
-            and str(message.author.id) in self.bot.config.get("allowedUpdateUsers")) \
-            and self.bot.config.has("githubApiKey") \
-            and self.bot.config.has("githubGistId"):
+        if message.author.id in self.bot.config.snapshot.forGuild(guildId).allowedUpdateUsers \
+            and config.has("githubApiKey") \
+            and config.has("githubGistId"):
 
             ghHeaders = {
                 "Accept": "application/vnd.github+json",
-                "Authorization": f"token {self.bot.config.get('githubApiKey')}"
+                "Authorization": f"token {config.get('githubApiKey')}"
             }
 
             try:
                 # get latest gist raw url from github api
-                async with self.http.get(f"https://api.github.com/gists/{self.bot.config.get('githubGistId')}", headers=ghHeaders) as resp:
+                async with self.http.get(f"https://api.github.com/gists/{config.get('githubGistId')}", headers=ghHeaders) as resp:
                     gistApiData = await resp.json(content_type="application/json")
                     if resp.status == 200 and "files" in gistApiData and "updates.json" in gistApiData["files"]:
                         raw_url = gistApiData["files"]["updates.json"]["raw_url"]
@@ -87,7 +109,7 @@ class NinjaUpdates(commands.Cog):
 
                 #logger.debug(json.dumps(gistContent, indent=4))
                 # send updated data to github
-                async with self.http.patch(f"https://api.github.com/gists/{self.bot.config.get('githubGistId')}", json=patchData, headers=ghHeaders) as gistApiResp:
+                async with self.http.patch(f"https://api.github.com/gists/{config.get('githubGistId')}", json=patchData, headers=ghHeaders) as gistApiResp:
                     if gistApiResp.status == 200:
                         logger.info("Successfully updated gist data")
                     else:
@@ -98,10 +120,11 @@ class NinjaUpdates(commands.Cog):
     
     @commands.Cog.listener()
     async def on_raw_message_edit(self, partialMessage) -> None:
-        if partialMessage.channel_id != int(self.bot.config.get("updatesChannel")): return # Ignore everything not from the update channel
+        updatesChannel = self.bot.config.snapshot.forGuild(partialMessage.guild_id).updatesChannel
+        if partialMessage.channel_id != updatesChannel: return # Ignore everything not from the update channel
         channel = self.bot.get_channel(partialMessage.channel_id)
         message = await channel.fetch_message(partialMessage.message_id)
-        await self.on_message(message)
+        await self.publishUpdate(message)
 
     async def formatMessageContent(self, message: discord.Message) -> str:
         content = message.content
@@ -131,7 +154,8 @@ class NinjaUpdates(commands.Cog):
 
     async def cog_unload(self) -> None:
         logger.debug(f"Shutting down {self.__class__.__name__}")
-        await self.http.close()
+        self.bot.router.unregister(f"{self.__class__.__name__}.onMessage")
+        self.bot.config.unsubscribe(f"{self.__class__.__name__}.onMessage")
 
 async def setup(bot) -> None:
     await bot.add_cog(NinjaUpdates(bot))
\ No newline at end of file
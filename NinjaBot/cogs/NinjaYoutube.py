@@ -1,10 +1,11 @@
 import logging
 import asyncio
 import functools
-import googleapiclient.discovery
+import time
 from datetime import datetime, timezone, timedelta
 from discord.ext import commands, tasks
 from asyncio import sleep
+from utils.stateStore import POSTED_TTL
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
@@ -13,15 +14,31 @@ class NinjaYoutube(commands.Cog):
         logger.debug(f"Loading {self.__class__.__name__}")
         self.bot = bot
         self.isInternal = True
-        self.youtube = googleapiclient.discovery.build("youtube", "v3", developerKey = self.bot.config.get("youtubeApiKey"))
+        # the api client is built on first use, see getYoutube()
+        self.youtube = None
         self.youtubeChecker.start()
 
+    def _buildYoutube(self):
+        # importing googleapiclient and parsing the discovery document is slow, so this runs in an executor
+        start = time.perf_counter()
+        import googleapiclient.discovery
+        youtube = googleapiclient.discovery.build("youtube", "v3", developerKey = self.bot.config.get("youtubeApiKey"))
+        logger.info(f"Built youtube api client in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return youtube
+
+    async def getYoutube(self):
+        """Return the youtube api client, building it without blocking the event loop if needed"""
+        if self.youtube is None:
+            self.youtube = await asyncio.get_running_loop().run_in_executor(None, self._buildYoutube)
+        return self.youtube
+
     @tasks.loop(hours=1)
     async def youtubeChecker(self) -> None:
         logger.debug("Running youtube checker")
 
         try:
-            request = self.youtube.search().list(
+            youtube = await self.getYoutube()
+            request = youtube.search().list(
                 part="id,snippet",
                 channelId=self.bot.config.get("youtubeChannelId"),
                 maxResults=6,
@@ -34,13 +51,11 @@ class NinjaYoutube(commands.Cog):
             response = await loop.run_in_executor(None, request.execute)
 
             if response and response["kind"] == "youtube#searchListResponse" and "items" in response and response["items"]:
-                postedVideos = self.bot.config.get("youtubePostedVideo") or []
                 toPostVideos = []
-                logger.debug(f"Posted videos so far: '{postedVideos}'")
                 logger.debug(response["items"])
                 for video in response["items"]:
                     if video["kind"] != "youtube#searchResult" and video["id"]["kind"] != "youtube#video": continue
-                    if video["id"]["videoId"] in postedVideos: continue
+                    if await self.bot.state.contains("youtube.posted", video["id"]["videoId"]): continue
                     if not video["snippet"]["description"]: continue
                     if not video["snippet"]["title"]: continue
                     #if "#VDO.Ninja" not in video["snippet"]["description"]: continue
@@ -70,13 +85,11 @@ class NinjaYoutube(commands.Cog):
                 youtubeChannel = self.bot.get_channel(int(self.bot.config.get("youtubeDiscordChannel")))
                 for video in toPostVideos:
                     await youtubeChannel.send(f"New video by Steve! Check it out: https://www.youtube.com/watch?v={video['id']['videoId']}")
-                    postedVideos.append(video["id"]["videoId"])
+                    # remember every sent video right away, so a crash can't post it twice
+                    await self.bot.state.add("youtube.posted", [video["id"]["videoId"]], ttl=POSTED_TTL)
                     await sleep(2) # do some reate limiting ourselfs
             except Exception as E:
                 logger.exception(E)
-            finally:
-                # update list of video id's we already posted so far
-                await self.bot.config.set("youtubePostedVideo", postedVideos)
 
     @youtubeChecker.before_loop
     async def before_youtubeChecker(self) -> None:
@@ -2,10 +2,25 @@ import discord
 import asyncio
 import logging
 import pathlib
+import time
+import hashlib
+import importlib.util
 import discord.ext.commands
-import logging.handlers
+import yarl
 from discord.ext import commands
 from utils.config import Config
+from utils.logPipeline import LogPipeline
+from utils.messageRouter import MessageRouter, MessageContext
+from utils.commandIndex import CommandIndex, SOURCE_NATIVE
+from utils.commandReplyProcessor import commandProc
+from utils.startupProfile import StartupProfile, ImportProfiler
+from utils.treeSync import TreeSyncer
+from utils.httpClient import HttpClient
+import utils.metrics as metrics
+from utils.loopWatchdog import LoopWatchdog
+from utils.eventReplay import EventRecorder
+from utils.analysisPool import AnalysisPool
+from utils.stateStore import StateStore
 
 # get local directory as path object
 LOCALDIR = pathlib.Path(__file__).parent.resolve()
@@ -14,40 +29,28 @@ LOCALDIR = pathlib.Path(__file__).parent.resolve()
 generalLogLevel = logging.DEBUG
 formatter = logging.Formatter("[{asctime}] [{levelname:<8}] {name}: {message}", datefmt="%Y-%m-%d %H:%M:%S", style="{")
 
-# rotating log file handler
-rotateFileHnd = logging.handlers.RotatingFileHandler(
-    filename="ninjaBot.log",
-    encoding="utf-8",
-    maxBytes=32 * 1024 * 1024,  # 32 MiB
-    backupCount=5,  # Rotate through 5 files
-)
-rotateFileHnd.setLevel(generalLogLevel)
-rotateFileHnd.setFormatter(formatter)
-
-# cmd output
-streamHnd = logging.StreamHandler()
-streamHnd.setLevel(generalLogLevel)
-streamHnd.setFormatter(formatter)
-
-# discord logger
-dcL = logging.getLogger("discord")
-dcL.propagate = False
-dcL.setLevel(generalLogLevel)
-dcL.addHandler(rotateFileHnd)
-dcL.addHandler(streamHnd)
-
-logging.getLogger("discord.http").setLevel(logging.INFO)
-logging.getLogger("discord.gateway").setLevel(logging.INFO)
-logging.getLogger("discord.client").setLevel(logging.INFO)
-logging.getLogger("discord.webhook").setLevel(logging.INFO)
-
-# NinjaBot logger
-nbL = logging.getLogger("NinjaBot")
-nbL.propagate = False
-nbL.setLevel(generalLogLevel)
-nbL.addHandler(rotateFileHnd)
-nbL.addHandler(streamHnd)
-logger = nbL
+# NinjaBot logger, its handlers are added by setupLogging()
+logger = logging.getLogger("NinjaBot")
+logPipeline: LogPipeline | None = None
+
+def setupLogging() -> LogPipeline:
+    """Start the log pipeline, only in the bot process: analysis workers import this module again"""
+    global logPipeline
+    # log calls only enqueue records, file and console output happen in a background thread
+    pipeline = LogPipeline("ninjaBot.log", generalLogLevel, formatter)
+    # discord logger
+    pipeline.attach("discord", generalLogLevel)
+    # default levels per subsystem, can be overwritten with "logLevels" in the config
+    pipeline.applyLevels({
+        "discord.http": "INFO",
+        "discord.gateway": "INFO",
+        "discord.client": "INFO",
+        "discord.webhook": "INFO",
+    })
+    pipeline.attach("NinjaBot", generalLogLevel)
+    pipeline.start()
+    logPipeline = pipeline
+    return pipeline
 
 # disable voice client warning
 discord.VoiceClient.warn_nacl = False
@@ -60,8 +63,30 @@ intents.typing = False
 # configure allowed mentions so bot can't ping @everyone
 mentions = discord.AllowedMentions(everyone=False)
 
-# create config handler
-config = Config(file=LOCALDIR / "discordbot.cfg")
+# all the extensions we want to use
+# statically defined for security reasons
+# none of them depend on each other at load time, so they are loaded concurrently
+EXTENSIONS = [
+    "cogs.NinjaBotUtils",  # internal bot commands
+    "cogs.NinjaAntiSpam",  # spammer detection system
+    "cogs.NinjaBotHelp",  # the bot help command
+    "cogs.NinjaGithub",  # commands from github
+    "cogs.NinjaDynCmds",  # commands added through the bot
+    "cogs.NinjaReddit",  # reddit events
+    "cogs.NinjaYoutube",  # youtube uploads
+    "cogs.NinjaUpdates",  # updates.vdon.ninja page
+    "cogs.NinjaThreadManager",  # auto-thread manager
+    "cogs.NinjaServices",  # freelancer services marketplace
+]
+
+class NinjaTree(discord.app_commands.CommandTree):
+    # app commands run in their own task, this books their REST calls on the command
+    async def _call(self, interaction: discord.Interaction) -> None:
+        name = (interaction.data or {}).get("name", "unknown")
+        command = self.get_command(name, guild=interaction.guild) or self.get_command(name)
+        owner = type(command.binding).__name__ if command is not None and command.binding else "app"
+        with metrics.feature(f"{owner}./{name}"):
+            await super()._call(interaction)
 
 class NinjaBot(commands.Bot):
     def __init__(self, config, *args, **kwargs) -> None:
@@ -70,82 +95,264 @@ class NinjaBot(commands.Bot):
             command_prefix=self.config.get("commandPrefix"),
             intents=intents,
             allowed_mentions=mentions,
-            help_command=None
+            help_command=None,
+            tree_cls=NinjaTree,
+            # time on the wire of every REST call, the rest of a call is rate limit waiting
+            http_trace=metrics.restTrace(),
+            **kwargs
+        )
+        # pooled http session shared by all cogs
+        self.httpClient = HttpClient(self.config.get("http"))
+        # merged registry of github, dynamic and native commands
+        self.commandIndex = CommandIndex()
+        # every message goes through the router once, cogs register the parts they care about
+        self.router = MessageRouter(self)
+        self._registerCommandRoute()
+        # edits of the config file are applied while running, see Config.watch()
+        self.config.subscribe("NinjaBot.commands", self._onConfigChange, keys=("autoThreadEnabledChannels", "commandPrefix"))
+        # only pushes app commands to discord when they changed
+        self.treeSyncer = TreeSyncer(self.tree, LOCALDIR / "appCommandHashes.json")
+        # content hash of every extension source file as it was when it got loaded
+        self.extensionHashes: dict[str, str] = {}
+        # import and setup timings of all extensions
+        self.startupProfile = StartupProfile()
+        # optional per module import cost report, see the "profileImports" config option
+        self.importProfiler = ImportProfiler() if self.config.get("profileImports") else None
+        if self.importProfiler:
+            self.importProfiler.install()
+        # latency histograms for listeners, routes, tasks and REST calls, optionally served for prometheus
+        metrics.instrumentDiscordHttp(self.http)
+        metrics.registry.gauge("ninjabot_gateway_latency_seconds", "Discord gateway heartbeat latency", fn=lambda: self.latency)
+        metricsConfig = self.config.get("metrics") or {}
+        self.metricsServer = metrics.MetricsServer(metricsConfig.get("host", "127.0.0.1"), metricsConfig.get("port", 9108)) \
+            if metricsConfig.get("enabled") else None
+        # reports callbacks that block the event loop, enabled unless "loopWatchdog": {"enabled": false}
+        watchdogConfig = self.config.get("loopWatchdog") or {}
+        self.loopWatchdog = LoopWatchdog(
+            self,
+            threshold=watchdogConfig.get("threshold", 0.25),
+            reportInterval=watchdogConfig.get("reportInterval", 300)
+        ) if watchdogConfig.get("enabled", True) else None
+        # cpu heavy message analysis (anti spam regexes, sift4, ...) in worker processes, see the "analysis" config option
+        analysisConfig = self.config.get("analysis") or {}
+        self.analysisPool = AnalysisPool(
+            analysisConfig.get("executor", "inline"),
+            workers=analysisConfig.get("workers"),
+            maxPending=analysisConfig.get("maxPending", 256),
+            inlineBelow=analysisConfig.get("inlineBelow", 200)
         )
+        # runtime state of the cogs, the config file itself is never written
+        self.state = StateStore(LOCALDIR / (self.config.get("stateFile") or "state.sqlite3"))
+        # optional sanitized recording of gateway traffic for replay.py
+        self.eventRecorder = EventRecorder(self, self.config.get("recordEvents")) if self.config.get("recordEvents") else None
 
-    # informational event when bot has finished logging in
-    async def on_ready(self) -> None:
-        logger.info(f"Bot logged in as {self.user}")
+    def _registerCommandRoute(self) -> None:
+        self.router.register(
+            "NinjaBot.commands",
+            self.handleCommand,
+            kinds=None,
+            excludeChannels=self.config.allGuildValues("autoThreadEnabledChannels"),
+            commandsOnly=True
+        )
+
+    def _onConfigChange(self, changed: frozenset[str]) -> None:
+        self.command_prefix = self.config.get("commandPrefix")
+        self._registerCommandRoute()
+
+    # runs exactly once after login and before the gateway connects, unlike on_ready
+    async def setup_hook(self) -> None:
+        await self.state.open()
+        await self.state.migrateLegacy(self.config, LOCALDIR / "suggestions.json")
+        if self.loopWatchdog:
+            self.loopWatchdog.start()
+        if self.eventRecorder:
+            self.eventRecorder.start()
+        # workers boot in the background, until they are up jobs just wait a bit longer
+        self.loop.create_task(self.analysisPool.start(), name="analysisPool.start")
+        results = await asyncio.gather(*[self.load_extension(ext) for ext in EXTENSIONS], return_exceptions=True)
+        for ext, result in zip(EXTENSIONS, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Could not load extension {ext}")
+                logger.exception(result)
+        logger.info(self.startupProfile.report())
+        if self.importProfiler:
+            logger.info(self.importProfiler.report())
 
-        # load all the extensions we want to use
-        # statically defined for security reasons
-
-        # internal bot commands
-        await self.load_extension("cogs.NinjaBotUtils")
-        # spammer detection system
-        await self.load_extension("cogs.NinjaAntiSpam")
-        # the bot help command
-        await self.load_extension("cogs.NinjaBotHelp")
-        # commands from github
-        await self.load_extension("cogs.NinjaGithub")
-        # commands added through the bot
-        await self.load_extension("cogs.NinjaDynCmds")
-        # reddit events
-        await self.load_extension("cogs.NinjaReddit")
-        # youtube uploads
-        await self.load_extension("cogs.NinjaYoutube")
-        # updates.vdon.ninja page
-        await self.load_extension("cogs.NinjaUpdates")
-        # auto-thread manager
-        await self.load_extension("cogs.NinjaThreadManager")
-        # freelancer services marketplace
-        await self.load_extension("cogs.NinjaServices")
-
-        # takes care of pushing all application commands to discord
-        guild = int(self.config.get("guild"))
-        self.tree.copy_global_to(guild=discord.Object(id=guild))
-        await self.tree.sync(guild=discord.Object(id=guild))
+        await self.syncAppCommands()
+        if self.metricsServer:
+            try:
+                await self.metricsServer.start()
+            except OSError as E:
+                logger.error(f"Could not start the metrics endpoint: {E}")
         # attach error handler to tree to handle app command errors
         self.tree.on_error = self.on_app_command_error
+        self.config.watch()
+        logger.info("Bot is done loading")
+
+    # takes care of pushing all application commands to every configured guild, skipped per guild if nothing changed unless forced
+    async def syncAppCommands(self, force: bool = False) -> bool:
+        synced = False
+        for guildId in self.config.guildIds():
+            try:
+                synced = await self.treeSyncer.sync(guildId, force=force) or synced
+            except discord.HTTPException as E:
+                # one guild that removed the bot or its app command scope must not block the others
+                logger.error(f"Could not sync app commands for guild {guildId}: {E}")
+        return synced
+
+    async def close(self) -> None:
+        await super().close()
+        await self.httpClient.close()
+        if self.metricsServer:
+            await self.metricsServer.stop()
+        if self.loopWatchdog:
+            await self.loopWatchdog.stop()
+        if self.eventRecorder:
+            self.eventRecorder.stop()
+        await self.analysisPool.stop()
+        await self.state.close()
+        await self.config.stopWatching()
+
+    # every event listener (bot and cogs) runs through here, so this is the one place to time them
+    async def _run_event(self, coro, event_name: str, *args, **kwargs) -> None:
+        owner = getattr(coro, "__self__", None)
+        name = f"{type(owner).__name__}.{event_name}" if isinstance(owner, commands.Cog) else event_name
+        start = time.perf_counter()
+        try:
+            with metrics.feature(name):
+                await super()._run_event(coro, event_name, *args, **kwargs)
+        finally:
+            metrics.listenerSeconds.observe(time.perf_counter() - start, name)
+
+    # prefix commands book their REST calls on the command instead of the message router
+    async def invoke(self, ctx: commands.Context) -> None:
+        if ctx.command is None:
+            return await super().invoke(ctx)
+        with metrics.feature(f"{type(ctx.cog).__name__ if ctx.cog else 'NinjaBot'}.{ctx.command.qualified_name}"):
+            await super().invoke(ctx)
 
+    async def on_error(self, event_method: str, *args, **kwargs) -> None:
+        metrics.handlerErrors.inc(event_method)
+        await super().on_error(event_method, *args, **kwargs)
+
+    # informational event when bot has finished logging in
+    # also fires after every gateway reconnect, so nothing expensive in here
+    async def on_ready(self) -> None:
+        logger.info(f"Bot logged in as {self.user}")
         # for funsies
         await self.change_presence(status=discord.Status.online, activity=discord.Game("helping hand"))
-        logger.info("Bot is done loading")
+
+    # discord.py's extension loader, wrapped to time the import and the setup() of every extension
+    async def _load_from_module_spec(self, spec, key) -> None:
+        start = time.perf_counter()
+        execModule = spec.loader.exec_module
+
+        def timedExecModule(module) -> None:
+            execModule(module)
+            imported = time.perf_counter()
+            self.startupProfile.record(key, "import", imported - start)
+            setup = getattr(module, "setup", None)
+            if setup is None: return
+
+            async def timedSetup(bot) -> None:
+                setupStart = time.perf_counter()
+                try:
+                    await setup(bot)
+                finally:
+                    self.startupProfile.record(key, "setup", time.perf_counter() - setupStart)
+            module.setup = timedSetup
+
+        spec.loader.exec_module = timedExecModule
+        await super()._load_from_module_spec(spec, key)
+        self.extensionHashes[key] = self._sourceHash(spec.origin)
+        logger.debug(f"Loaded extension {key} in {(time.perf_counter() - start) * 1000:.1f} ms")
 
     async def on_message(self, message: discord.Message) -> None:
-        ctx = await self.get_context(message)
+        self.router.dispatch(message)
 
-        if (ctx.author == self.user \
-            or ctx.author.bot \
-            or str(ctx.channel.id) in self.config.get("autoThreadEnabledChannels")):
-            # ignore messages by the bot itself or other bots or autoThread channels
+    async def handleCommand(self, mctx: MessageContext) -> None:
+        # might be a command. one lookup in the command index decides who deals with it
+        # precedence: dynamic command -> github -> native command
+        line = mctx.message.content[len(self.config.get("commandPrefix")):].split()
+        if not line: return
+        entry = self.commandIndex.resolve(line[0])
+        if not entry:
+            logger.debug(f"'{line[0]}' is not a known command, ignoring")
             return
-        elif ctx.message.content.startswith(self.config.get("commandPrefix")):
-            # might be a command. pass it around to see if anyone wants to deal with it
-            # in order: github -> dynamic command -> native command
-            dynamicCommands = self.get_cog("NinjaDynCmds")
-            if dynamicCommands and await dynamicCommands.process_command(ctx): #type:ignore
-                return
-            NinjaGithub = self.get_cog("NinjaGithub")
-            if NinjaGithub and await NinjaGithub.process_command(ctx):  #type:ignore
-                return
-            # otherwise look elsewhere for command
-            logger.debug("Command not found by custom handlers, try processing native commands")
-            await self.process_commands(message)
+        if entry.source == SOURCE_NATIVE:
+            await self.process_commands(mctx.message)
+        else:
+            await commandProc(self, mctx.message, entry.reply, line)
+
+    # keep the native part of the command index in sync with loaded cogs
+    async def add_cog(self, cog, /, **kwargs) -> None:
+        await super().add_cog(cog, **kwargs)
+        self.commandIndex.setNative(self)
+        metrics.instrumentLoops(cog)
+
+    async def remove_cog(self, name, /, **kwargs):
+        cog = await super().remove_cog(name, **kwargs)
+        self.commandIndex.setNative(self)
+        return cog
     
     # reload all extensions
-    async def reloadExtensions(self, ctx) -> None:
-        await ctx.send("Reloading bot extensions")
+    # by default only extensions whose source file changed since they were loaded are reloaded
+    #
+    # state hand-off: a cog can define exportState() -> dict and importState(state: dict).
+    # exportState is called on the old cog right before its extension is reloaded and the
+    # result is passed to importState of the new cog with the same name, so things like
+    # caches and counters survive a reload
+    async def reloadExtensions(self, ctx, changedOnly: bool = True) -> None:
+        await ctx.send(f"Reloading {'changed' if changedOnly else 'all'} bot extensions")
+        reloaded = []
         try:
             for ext in list(self.extensions.keys()):
-                if ext != "cogs.NinjaThreadManager":
-                    logger.debug(f"Reloading extension {ext}")
-                    await self.reload_extension(ext)
+                if ext == "cogs.NinjaThreadManager":
+                    continue
+                if changedOnly and not self.extensionChanged(ext):
+                    continue
+                logger.debug(f"Reloading extension {ext}")
+                await self.reloadExtension(ext)
+                reloaded.append(ext)
+            # reloaded cogs may have changed their app commands
+            if reloaded and await self.syncAppCommands():
+                await ctx.send("Application commands changed and were synced")
         except Exception as E:
             await ctx.send("There was an error while reloading bot extensions:")
             await ctx.send(E)
         else:
-            await ctx.send("Successfully reloaded bot extensions")
+            if reloaded:
+                await ctx.send(f"Successfully reloaded: {', '.join(reloaded)}")
+            else:
+                await ctx.send("No extension changed, nothing to reload")
+
+    # reload a single extension and hand the state of its cogs over to the new instances
+    async def reloadExtension(self, ext: str) -> None:
+        states = {}
+        for name, cog in self.cogs.items():
+            if cog.__module__ == ext and hasattr(cog, "exportState"):
+                states[name] = cog.exportState()
+        await self.reload_extension(ext)
+        for name, state in states.items():
+            cog = self.get_cog(name)
+            if cog and hasattr(cog, "importState"):
+                cog.importState(state)
+                logger.debug(f"Handed state of {name} over to the reloaded cog")
+
+    # true if the source file of a loaded extension differs from what was loaded
+    def extensionChanged(self, ext: str) -> bool:
+        spec = importlib.util.find_spec(ext)
+        if spec is None or not spec.origin:
+            return True
+        return self._sourceHash(spec.origin) != self.extensionHashes.get(ext)
+
+    @staticmethod
+    def _sourceHash(path: str | None) -> str:
+        if not path: return ""
+        try:
+            return hashlib.sha256(pathlib.Path(path).read_bytes()).hexdigest()
+        except OSError:
+            return ""
 
     # handle some errors. this works for extension commands too so no need to redefine in there
     async def on_command_error(self, ctx, err) -> None:
@@ -176,18 +383,45 @@ class NinjaBot(commands.Bot):
         else:
             logger.exception(err)
 
+class ShardedNinjaBot(NinjaBot, commands.AutoShardedBot):
+    """NinjaBot on several gateway shards, for running it in many guilds"""
+
+    async def on_shard_ready(self, shardId: int) -> None:
+        logger.info(f"Shard {shardId} ready")
+
 async def main() -> None:
+    logPipeline = setupLogging()
     logger.info("Starting up NinjaBot V2.3")
+    # create config handler
+    config = Config(file=LOCALDIR / "discordbot.cfg")
     try:
         await config.parse()
     except Exception as E:
         logger.error("Error while parsing the configuration file")
         logger.exception(E)
+        logPipeline.stop()
         return
+    logPipeline.applyLevels(config.get("logLevels"))
+    config.subscribe("logLevels", lambda changed: logPipeline.applyLevels(config.get("logLevels")), keys=("logLevels",))
+    if config.get("jsonLog"):
+        logPipeline.addJsonLines(config.get("jsonLog"), generalLogLevel)
 
     logger.info(f"Token loaded. Loading bot and extensions.")
 
-    nBot = NinjaBot(config)
+    # point REST and gateway at another server, e.g. the local stand-in from standIn.py
+    if config.get("discordApiBase"):
+        apiBase = config.get("discordApiBase").rstrip("/")
+        discord.http.Route.BASE = f"{apiBase}/api/v{discord.http.INTERNAL_API_VERSION}"
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(apiBase.replace("http", "ws", 1) + "/gateway")
+        logger.warning(f"Using the discord API at {apiBase} instead of discord.com")
+
+    # "sharding": {"enabled": true} runs an auto sharded bot, shard count from discord unless configured
+    sharding = config.get("sharding") or {}
+    if sharding.get("enabled"):
+        nBot = ShardedNinjaBot(config, shard_count=sharding.get("shardCount"), shard_ids=sharding.get("shardIds"))
+        logger.info(f"Sharded mode for guilds {config.guildIds()}")
+    else:
+        nBot = NinjaBot(config)
 
     logger.info("Extensions loaded. Starting server")
     try:
@@ -198,6 +432,7 @@ async def main() -> None:
         pass
     await nBot.close()
     logger.info("Bot process exited. Closing program.")
+    logPipeline.stop()
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
@@ -0,0 +1,174 @@
+"""Replays recorded or synthetic gateway traffic against the full cog stack without a discord connection
+
+    python replay.py --scenario mixed --scale 2 --speed 0
+    python replay.py --events recording.jsonl.gz --speed 10
+
+REST calls are answered by an in memory emulator, so no token or network is needed. The report has
+the throughput, the p50/p99 latency of every listener and message route and the REST calls per route.
+"""
+import argparse
+import asyncio
+import json
+import pathlib
+import sys
+import tempfile
+from collections import defaultdict
+
+import discord
+import main
+import utils.metrics as metrics
+from utils.config import Config
+from utils.discordEmulator import DiscordEmulator, InProcessHttp
+from utils.eventReplay import TrafficGenerator, Replayer, readEvents, readHeader, writeEvents, CHANNEL_KEYS, configuredChannels
+
+class LatencyTap:
+    """Collects the exact durations the metrics histograms observe, for precise percentiles"""
+    def __init__(self, *histograms: metrics.Histogram) -> None:
+        self.histograms = histograms
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    def __enter__(self) -> "LatencyTap":
+        for histogram in self.histograms:
+            observe = histogram.observe
+            def tapped(value, *labels, _observe=observe, _kind=histogram.name.split("_")[1]):
+                self.samples[f"{_kind}:{labels[0]}"].append(value)
+                _observe(value, *labels)
+            histogram.observe = tapped
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for histogram in self.histograms:
+            del histogram.observe
+
+    def report(self) -> dict[str, dict]:
+        rows = {}
+        for name, values in sorted(self.samples.items()):
+            values = sorted(values)
+            pick = lambda q: values[min(int(q * len(values)), len(values) - 1)]
+            rows[name] = {"count": len(values), "p50Ms": pick(0.5) * 1000, "p99Ms": pick(0.99) * 1000, "maxMs": values[-1] * 1000}
+        return rows
+
+def prepareConfig(options: dict, emulator: DiscordEmulator, channels: dict | None = None) -> dict:
+    """Copy of the config pointing at the emulated guild, missing channels are created in the emulator"""
+    options = dict(options)
+    # synthetic recordings bring the channels they were generated for
+    for key, value in (channels or {}).items():
+        current = options.get(key)
+        if not current or not str(current[0] if isinstance(current, list) else current).isdigit():
+            options[key] = value
+    options["guild"] = str(emulator.guildId)
+    options["discordBotToken"] = ""
+    for key, ids in configuredChannels(options).items():
+        ids = [str(i) for i in ids] or [str(emulator.snowflake())]
+        for cid in ids:
+            emulator.ensureChannel(int(cid), key, CHANNEL_KEYS[key])
+        options[key] = ids if isinstance(options.get(key), list) or key == "autoThreadEnabledChannels" else ids[0]
+    # channels without a welcome text (e.g. sample config placeholders) get a simple one
+    mapping = dict(options.get("autoThreadWelcomeMapping") or {})
+    for cid in options["autoThreadEnabledChannels"]:
+        mapping.setdefault(cid, "replayWelcome")
+    options["autoThreadWelcomeMapping"] = mapping
+    options["replayWelcome"] = "Hello {usermention}!"
+    return options
+
+def scaleSleeps(bot, speed: float) -> None:
+    """Handlers that wait (warning messages etc.) wait 'speed' times shorter, or not at all with speed 0"""
+    originalSleep = asyncio.sleep
+
+    async def scaledSleep(delay, result=None):
+        return await originalSleep(delay / speed if speed else 0, result)
+
+    for module in bot.extensions.values():
+        if getattr(module, "sleep", None) is originalSleep:
+            module.sleep = scaledSleep
+
+async def replay(args) -> dict:
+    options = json.loads(pathlib.Path(args.config).read_text(encoding="utf-8"))
+    emulator = DiscordEmulator()
+    options = prepareConfig(options, emulator, readHeader(args.events).get("channels") if args.events else None)
+    generator = TrafficGenerator(emulator, options, seed=args.seed)
+
+    # the bot gets its own copy of the config and its own state store
+    workdir = pathlib.Path(tempfile.mkdtemp(prefix="ninjaReplay"))
+    options["stateFile"] = str(workdir / "state.sqlite3")
+    configFile = workdir / "discordbot.cfg"
+    configFile.write_text(json.dumps(options, indent=4), encoding="utf-8")
+    config = Config(file=configFile)
+    await config.parse()
+
+    bot = main.NinjaBot(config)
+    await bot._async_setup_hook()
+    InProcessHttp(emulator).install(bot)
+    metrics.instrumentDiscordHttp(bot.http)
+    state = bot._connection
+    state.application_id = emulator.applicationId
+    state.user = discord.ClientUser(state=state, data=emulator.botUser)
+    state._add_guild_from_data(emulator.guildPayload())
+    await bot.setup_hook()
+    # worker boot time is not what we want to measure
+    await bot.analysisPool.ready.wait()
+    scaleSleeps(bot, args.speed)
+
+    if args.events:
+        events = list(readEvents(args.events))
+    else:
+        events = generator.scenario(args.scenario, args.scale, bot.commandIndex.catalog())
+    if args.save:
+        writeEvents(args.save, events, channels={key: options[key] for key in CHANNEL_KEYS})
+
+    emulator.calls.clear()
+    with LatencyTap(metrics.listenerSeconds, metrics.routeSeconds) as tap:
+        result = await Replayer(bot, emulator).run(events, args.speed)
+
+    messages = result["events"].get("MESSAGE_CREATE", 0)
+    report = {
+        "events": result["events"],
+        "seconds": result["seconds"],
+        "eventsPerSecond": sum(result["events"].values()) / result["seconds"] if result["seconds"] else 0,
+        "messagesPerSecond": messages / result["seconds"] if result["seconds"] else 0,
+        "handlers": tap.report(),
+        "rest": {f"{method} {path}": n for (method, path), n in emulator.calls.most_common()}
+    }
+    for ext in list(bot.extensions):
+        await bot.unload_extension(ext)
+    await bot.close()
+    return report
+
+def printReport(report: dict) -> None:
+    print(f"replayed {sum(report['events'].values())} events in {report['seconds']:.2f} s "
+          f"({report['eventsPerSecond']:.0f} events/s, {report['messagesPerSecond']:.0f} messages/s)")
+    print(f"\n{'handler':<52}{'calls':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for name, row in report["handlers"].items():
+        print(f"{name[:51]:<52}{row['count']:>7}{row['p50Ms']:>9.2f}{row['p99Ms']:>9.2f}{row['maxMs']:>9.2f}")
+    print(f"\n{'REST route':<70}{'calls':>7}")
+    for route, calls in report["rest"].items():
+        print(f"{route[:69]:<70}{calls:>7}")
+
+def parseArgs(argv=None):
+    parser = argparse.ArgumentParser(description="Replay gateway traffic against NinjaBot and measure handler latency")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--events", help="recording made with the 'recordEvents' option")
+    source.add_argument("--scenario", default="mixed",
+                        choices=["mixed", "chatter", "raid", "support", "updates", "commands", "reactions"],
+                        help="synthetic traffic to generate (default: mixed)")
+    parser.add_argument("--config", default=str(main.LOCALDIR / "discordbot.sample.cfg"), help="bot config to use")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the amount of synthetic traffic")
+    parser.add_argument("--speed", type=float, default=0, help="replay N times faster than recorded, 0 = no pauses")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for synthetic traffic")
+    parser.add_argument("--save", help="also write the replayed events to this file")
+    parser.add_argument("--json", help="write the report as json to this file")
+    parser.add_argument("--log-level", default="WARNING", help="log level of the bot during the replay")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    args = parseArgs()
+    logPipeline = main.setupLogging()
+    logPipeline.applyLevels({"NinjaBot": args.log_level, "discord": args.log_level})
+    try:
+        report = asyncio.run(replay(args))
+    finally:
+        logPipeline.stop()
+    printReport(report)
+    if args.json:
+        pathlib.Path(args.json).write_text(json.dumps(report, indent=4), encoding="utf-8")
+    sys.exit(0)
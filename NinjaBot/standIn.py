@@ -0,0 +1,86 @@
+"""Local stand-in for the discord API, to run the whole bot without network access
+
+    python standIn.py --config discordbot.cfg --port 8765
+    python standIn.py --config discordbot.cfg --scenario mixed --scale 2 --speed 5
+
+Set "discordApiBase": "http://127.0.0.1:8765" in the bot config and start the bot as usual, any token works.
+With --scenario, synthetic traffic is pushed to the bot once it connected, afterwards the REST calls
+and 429 answers per route are printed. The numbers are also available on /_standin/stats at any time.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import pathlib
+
+from utils.discordEmulator import DiscordEmulator
+from utils.eventReplay import TrafficGenerator, CHANNEL_KEYS, configuredChannels
+from utils.restStandIn import StandInServer
+
+logger = logging.getLogger("NinjaBot.standIn")
+
+def buildEmulator(options: dict) -> DiscordEmulator:
+    """Emulated guild with the guild id and channels from the bot config"""
+    guild = str(options.get("guild") or "")
+    emulator = DiscordEmulator(int(guild) if guild.isdigit() else None)
+    for key, ids in configuredChannels(options).items():
+        if not ids:
+            logger.warning(f"'{key}' has no valid channel id in the config, that feature won't see any traffic")
+        for cid in ids:
+            emulator.ensureChannel(cid, key, CHANNEL_KEYS[key])
+    return emulator
+
+async def pushTraffic(server: StandInServer, events: list, speed: float) -> None:
+    previous = events[0][0] if events else 0
+    for t, event, data in events:
+        if speed and t > previous:
+            await asyncio.sleep((t - previous) / speed)
+        previous = max(previous, t)
+        await server.inject(event, data)
+
+async def run(args) -> None:
+    options = json.loads(pathlib.Path(args.config).read_text(encoding="utf-8"))
+    emulator = buildEmulator(options)
+    generator = TrafficGenerator(emulator, options, seed=args.seed) if args.scenario else None
+    server = StandInServer(emulator, args.host, args.port)
+    await server.start()
+    print(f"Discord stand-in on {server.baseUrl}, set \"discordApiBase\": \"{server.baseUrl}\" in the bot config")
+    try:
+        if generator:
+            await server.connected.wait()
+            # give the bot a moment to load its extensions and sync
+            await asyncio.sleep(args.warmup)
+            events = generator.scenario(args.scenario, args.scale)
+            emulator.calls.clear()
+            server.limiter.limited.clear()
+            print(f"Pushing {len(events)} events")
+            await pushTraffic(server, events, args.speed)
+            await asyncio.sleep(args.settle)
+            printStats(server.stats())
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+def printStats(stats: dict) -> None:
+    print(f"\n{'REST route':<70}{'calls':>7}{'429s':>7}")
+    for route, calls in stats["calls"].items():
+        print(f"{route[:69]:<70}{calls:>7}{stats['rateLimited'].get(route, 0):>7}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the discord REST API and gateway")
+    parser.add_argument("--config", default="discordbot.cfg", help="bot config, its guild and channel ids are emulated")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenario", choices=["mixed", "chatter", "raid", "support", "updates", "reactions"],
+                        help="synthetic traffic to push once the bot connected")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for the amount of synthetic traffic")
+    parser.add_argument("--speed", type=float, default=1.0, help="push traffic N times faster than generated, 0 = no pauses")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds to wait after the bot connected")
+    parser.add_argument("--settle", type=float, default=15.0, help="seconds to wait for the bot after the last event")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="[{asctime}] [{levelname:<8}] {name}: {message}", style="{")
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
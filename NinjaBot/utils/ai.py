@@ -3,46 +3,46 @@ import json
 import aiohttp
 import re
 import time
+import utils.structLog as structLog
+from utils.analysis import looksLikeQuestion
 from typing import Union, Dict, List, Any, Optional
 
 logger = logging.getLogger("NinjaBot." + __name__)
+slog = structLog.getLogger("NinjaBot." + __name__)
+
+DEFAULT_AI_CONFIG = {
+    "enabled": False,
+    "service": "NONE",
+    "api_key": "",
+    "model": "",
+    "api_url": "",
+    "temperature": 0.7,
+    "max_tokens": 1000
+}
 
 class NinjaAI:
     """A helper class to handle AI integrations for the bot"""
     def __init__(self, bot) -> None:
         self.bot = bot
-        self.http = aiohttp.ClientSession()
-        self.ai_config = self._get_ai_config()
-        self.channel_instructions = self._get_channel_instructions()
-        logger.info(f"NinjaAI initialized with config: {self.ai_config}")
-        logger.info(f"Channel instructions configured: {list(self.channel_instructions.keys()) if self.channel_instructions else 'None'}")
-        
-    def _get_ai_config(self) -> Dict[str, Any]:
-        """Get AI configuration from the bot config"""
-        default_config = {
-            "enabled": False,
-            "service": "NONE",
-            "api_key": "",
-            "model": "",
-            "api_url": "",
-            "temperature": 0.7,
-            "max_tokens": 1000
-        }
+        if not self.bot.config.has("ai"):
+            logger.warning("No AI config found in bot config, using defaults")
+        logger.info(f"NinjaAI initialized with service {self.ai_config.get('service')}, enabled: {self.ai_config.get('enabled', False)}")
+        logger.info(f"Channel instructions configured: {list(self.channel_instructions.keys()) or 'None'}")
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        """The bot's shared HTTP session"""
+        return self.bot.httpClient.session
         
-        # Try to get AI configuration from bot config
-        if self.bot.config.has("ai"):
-            ai_config = self.bot.config.get("ai")
-            logger.info(f"Found AI config in bot config: {ai_config}")
-            return ai_config
-            
-        logger.warning("No AI config found in bot config, using defaults")
-        return default_config
+    @property
+    def ai_config(self) -> Dict[str, Any]:
+        """AI configuration from the bot config, read on every use so config reloads apply right away"""
+        return self.bot.config.get("ai") or DEFAULT_AI_CONFIG
     
-    def _get_channel_instructions(self) -> Dict[str, str]:
-        """Get channel-specific instructions from the bot config"""
-        if self.bot.config.has("channelInstructions"):
-            return self.bot.config.get("channelInstructions")
-        return {}
+    @property
+    def channel_instructions(self) -> Dict[int, str]:
+        """Channel-specific instructions of all guilds, prebuilt in the config snapshot"""
+        return self.bot.config.snapshot.channelInstructions
     
     def _get_system_instruction(self, channel_id: str) -> str:
         """Get the appropriate system instruction for the given channel"""
@@ -67,9 +67,10 @@ class NinjaAI:
         )
         
         # If we have channel-specific instructions, use them
-        if channel_id in self.channel_instructions:
+        instruction = self.channel_instructions.get(int(channel_id)) if str(channel_id).isdigit() else None
+        if instruction is not None:
             logger.info(f"Using channel-specific instruction for channel {channel_id}")
-            return self.channel_instructions[channel_id]
+            return instruction
         
         logger.info(f"No channel-specific instruction found for channel {channel_id}, using default")
         return default_instruction
@@ -118,16 +119,11 @@ class NinjaAI:
             logger.info(f"Combined message content is too short ({len(combined_content)} chars), will not respond")
             return False
             
-        # Check if the user is asking a question in any of their messages
-        question_indicators = ["?", "how", "what", "why", "where", "when", "who", "is", "can", "could", "would", "should", "help"]
-        
-        has_question = "?" in combined_content.lower()
-        has_question_word = any(word in combined_content.lower().split() for word in question_indicators)
+        # Check if the user is asking a question in any of their messages, long threads are checked in the analysis pool
+        is_question = await self.bot.analysisPool.run(looksLikeQuestion, combined_content, size=len(combined_content))
+        logger.debug(f"Combined message looks like a question: {is_question}")
         
-        logger.debug(f"Combined message has question mark: {has_question}")
-        logger.debug(f"Combined message has question words: {has_question_word}")
-        
-        if has_question or has_question_word:
+        if is_question:
             logger.info("Combined messages appear to be a question, will respond")
             return True
             
@@ -136,7 +132,7 @@ class NinjaAI:
     
     async def should_respond(self, messages: List[Dict[str, Any]], channel_id: str = None) -> bool:
         """Determine if the AI should respond based on the message history"""
-        logger.debug(f"Checking if AI should respond to messages in channel {channel_id}: {messages}")
+        slog.debug("ai.shouldRespond", channel=channel_id, messages=len(messages))
         
         # Check if AI is enabled
         if not self.ai_config.get("enabled", False):
@@ -161,16 +157,11 @@ class NinjaAI:
             return False
             
         # Check if the user is asking a question
-        question_indicators = ["?", "how", "what", "why", "where", "when", "who", "is", "can", "could", "would", "should", "help"]
-        
-        has_question = "?" in initial_message.lower()
-        has_question_word = any(word in initial_message.lower().split() for word in question_indicators)
-        
-        logger.debug(f"Message has question mark: {has_question}")
-        logger.debug(f"Message has question words: {has_question_word}")
+        is_question = await self.bot.analysisPool.run(looksLikeQuestion, initial_message, size=len(initial_message))
+        logger.debug(f"Message looks like a question: {is_question}")
         
         # Simple heuristic: if the message contains a question mark or question words, respond
-        if has_question or has_question_word:
+        if is_question:
             # Additional check: if there are multiple messages and the last one is from the bot, don't respond
             if len(messages) > 1 and messages[-1].get("author", {}).get("bot", False):
                 logger.info("Last message is from bot, will not respond")
@@ -318,7 +309,7 @@ class NinjaAI:
                 "Authorization": f"Bearer {api_key}"
             }
             
-            logger.debug(f"Sending request to OpenAI API with data: {json.dumps(request_data)}")
+            slog.debug("ai.request", every=5.0, service="OPENAI", data=lambda: json.dumps(request_data))
             
             async with self.http.post(
                 "https://api.openai.com/v1/chat/completions",
@@ -326,7 +317,7 @@ class NinjaAI:
                 json=request_data
             ) as response:
                 response_text = await response.text()
-                logger.debug(f"OpenAI API response: {response_text}")
+                slog.debug("ai.response", every=5.0, service="OPENAI", status=response.status, body=response_text)
                 
                 if response.status != 200:
                     logger.error(f"OpenAI API returned status {response.status}")
@@ -370,7 +361,7 @@ class NinjaAI:
             
             # Log request data for debugging
             logger.info(f"Sending request to Gemini API: {api_url}")
-            logger.debug(f"Request data: {json.dumps(request_data)}")
+            slog.debug("ai.request", every=5.0, service="GEMINI", data=lambda: json.dumps(request_data))
             
             try:
                 async with self.http.post(
@@ -378,8 +369,7 @@ class NinjaAI:
                     json=request_data
                 ) as response:
                     response_text = await response.text()
-                    logger.debug(f"Gemini API response status: {response.status}")
-                    logger.debug(f"Gemini API raw response: {response_text}")
+                    slog.debug("ai.response", every=5.0, service="GEMINI", status=response.status, body=response_text)
                     
                     if response.status != 200:
                         logger.error(f"Gemini API returned error status {response.status}")
@@ -433,7 +423,7 @@ class NinjaAI:
                 "stream": False
             }
             
-            logger.debug(f"Sending request to Ollama API with data: {json.dumps(request_data)}")
+            slog.debug("ai.request", every=5.0, service="OLLAMA", data=lambda: json.dumps(request_data))
             
             # Make request to Ollama API
             async with self.http.post(
@@ -441,7 +431,7 @@ class NinjaAI:
                 json=request_data
             ) as response:
                 response_text = await response.text()
-                logger.debug(f"Ollama API response: {response_text}")
+                slog.debug("ai.response", every=5.0, service="OLLAMA", status=response.status, body=response_text)
                 
                 if response.status != 200:
                     logger.error(f"Ollama API returned status {response.status}")
@@ -453,7 +443,3 @@ class NinjaAI:
         except Exception as e:
             logger.exception(f"Error getting response from Ollama: {e}")
             return None
-            
-    async def close(self):
-        """Close the HTTP session"""
-        await self.http.close()
\ No newline at end of file
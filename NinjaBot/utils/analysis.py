@@ -0,0 +1,136 @@
+"""CPU bound message analysis as pure functions
+
+Everything in here only takes and returns plain data, so it can run inline, in a thread or in a worker
+process of the AnalysisPool. No discord objects, no bot state, no logging.
+"""
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass
+from strsimpy import SIFT4
+from utils.contentScanner import DEFAULT_SCANNER, KIND_IMAGE, KIND_INVITE, KIND_SECRET, ContentScanner
+
+# reddit markdown links
+LINK_PATTERN = re.compile(r"(\[[^\]]*\]\([^\)]+\))")
+
+# raid fingerprints: mentions and url paths vary between raid accounts, the rest of the text doesn't
+MENTION_PATTERN = re.compile(r"<(?:@[!&]?|#)\d+>")
+URL_PATH_PATTERN = re.compile(r"https?://(?:www\.)?([^/\s]+)\S*")
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+# shorter texts ("thanks!", "same here") are posted by many people without being a raid
+FINGERPRINT_MIN_LENGTH = 20
+FINGERPRINT_SHINGLE = 4
+MASK64 = (1 << 64) - 1
+# hashes of recent shingles, most of them come up in message after message (about 120 bytes each)
+SHINGLE_CACHE_SIZE = 16384
+_shingleHashes: dict[str, int] = {}
+
+QUESTION_WORDS = frozenset(["?", "how", "what", "why", "where", "when", "who", "is", "can", "could", "would", "should", "help"])
+
+_sift4 = SIFT4()
+
+@dataclass(frozen=True, slots=True)
+class MessageAnalysis:
+    """What the anti spam checks need to know about a message"""
+    distance: float | None  # sift4 distance to the user's previous message, None if there is none
+    hasImageUrl: bool
+    hasInvite: bool
+    # labels of the leaked secrets, e.g. ("stream key",)
+    secrets: tuple[str, ...] = ()
+    fingerprint: int | None = None  # simhash of the normalized text, None for short texts
+
+def analyzeMessage(content: str, previous: str, scanner: ContentScanner = DEFAULT_SCANNER, withFingerprint: bool = True) -> MessageAnalysis:
+    """The content scan, the similarity to the previous message and the raid fingerprint (if asked for) in one go"""
+    if not content:
+        return MessageAnalysis(None, False, False)
+    findings = scanner.scan(content)
+    kinds = {finding.kind for finding in findings}
+    return MessageAnalysis(
+        distance=_sift4.distance(previous, content) if previous else None,
+        hasImageUrl=KIND_IMAGE in kinds,
+        hasInvite=KIND_INVITE in kinds,
+        secrets=tuple(dict.fromkeys(finding.label for finding in findings if finding.kind == KIND_SECRET)),
+        fingerprint=fingerprint(content) if withFingerprint else None
+    )
+
+def normalizeText(content: str) -> str:
+    """lower case letters and digits only, mentions and url paths removed, look-alike characters folded"""
+    text = unicodedata.normalize("NFKC", content).casefold()
+    text = MENTION_PATTERN.sub("", text)
+    text = URL_PATH_PATTERN.sub(r"\1", text)
+    return NON_WORD_PATTERN.sub("", text)
+
+def _hash64(text: str) -> int:
+    # not hash(), that is salted per process and the fingerprints come from different worker processes
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+def _shingleHash(shingle: str) -> int:
+    value = _shingleHashes.get(shingle)
+    if value is None:
+        if len(_shingleHashes) >= SHINGLE_CACHE_SIZE: _shingleHashes.clear()
+        value = _shingleHashes[shingle] = _hash64(shingle)
+    return value
+
+def fingerprint(content: str) -> int | None:
+    """64 bit simhash over character 4-grams, near duplicate texts differ in only a few bits"""
+    text = normalizeText(content)
+    if len(text) < FINGERPRINT_MIN_LENGTH:
+        return None
+    shingles = {text[i:i + FINGERPRINT_SHINGLE] for i in range(len(text) - FINGERPRINT_SHINGLE + 1)}
+    return _majorityBits(map(_shingleHash, shingles), len(shingles))
+
+def _majorityBits(hashes, count: int) -> int:
+    """bit i is set if it is set in more than half of the 'count' 64 bit hashes"""
+    # the 64 column counts are bit sliced: slices[j] holds bit j of every column's count,
+    # so adding a hash is a ripple carry over a few ints instead of 64 separate counters
+    slices = [0] * count.bit_length()
+    for carry in hashes:
+        j = 0
+        while carry:
+            current = slices[j]
+            slices[j] = current ^ carry
+            carry &= current
+            j += 1
+    # subtract count // 2 + 1 from every column at once, the columns that don't borrow are the majority
+    threshold = count // 2 + 1
+    borrow = 0
+    for j, column in enumerate(slices):
+        subtrahend = MASK64 if threshold >> j & 1 else 0
+        borrow = (~column & MASK64 & (subtrahend | borrow)) | (subtrahend & borrow & column)
+    return ~borrow & MASK64
+
+def looksLikeQuestion(text: str) -> bool:
+    """Question mark or a question word somewhere in the text"""
+    text = text.lower()
+    return "?" in text or not QUESTION_WORDS.isdisjoint(text.split())
+
+def formatSubmissionText(isSelf: bool, selftext: str, url: str, charLimit: int = 220) -> str:
+    """Shortened text of a reddit submission that never cuts off link markup"""
+    if not isSelf:
+        return url[:1024]
+    strippedNewlines = re.sub(r"\n{2,}", "\n", selftext) # remove newlines if more then one newline
+    # Make sure to not cut off links
+    splitText = LINK_PATTERN.split(strippedNewlines)
+    if len(splitText) > 1:
+        text = ""
+        for id, tp in enumerate(splitText):
+            tpIsLink = bool(LINK_PATTERN.search(tp)) # find out if the current "line" is a link
+            if tpIsLink:
+                linkTextLength = len(re.findall(r"(\[.+\])", tp)[0]) - 3 # get length of link text
+                if len(text) + linkTextLength > charLimit:
+                    # never cut off link text
+                    break
+                text += tp
+            else:
+                # if new length hits char limit, truncate
+                if len(text) + len(tp) > charLimit:
+                    if id == 0:
+                        text += tp[:charLimit-3] + "..."
+                    else:
+                        text += "..."
+                    break
+                else:
+                    text += tp
+    else:
+        text = strippedNewlines[:charLimit-3] + "..."
+    return text[:1024] # limit again just for safety
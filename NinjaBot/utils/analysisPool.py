@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, TypeVar
+from utils.metrics import registry
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+T = TypeVar("T")
+
+MODE_INLINE = "inline"
+MODE_THREAD = "thread"
+MODE_PROCESS = "process"
+
+analysisJobs = registry.counter("ninjabot_analysis_jobs_total", "Analysis jobs by where they ran", ("mode",))
+
+def _warmup() -> int:
+    return os.getpid()
+
+class AnalysisPool:
+    """Runs pure CPU bound functions (see utils.analysis) off the event loop
+
+    - "process": worker processes, so a raid full of long messages uses all cores and not the gateway heartbeat
+    - "thread": worker threads, only helps for code that releases the GIL
+    - "inline": directly on the event loop, like before
+    Small inputs always run inline, shipping them to a worker costs more than the work itself.
+    At most maxPending jobs wait for a worker, further callers wait for a free slot (back pressure).
+    """
+    def __init__(self, mode: str = MODE_INLINE, workers: int | None = None, maxPending: int = 256, inlineBelow: int = 200) -> None:
+        if mode not in (MODE_INLINE, MODE_THREAD, MODE_PROCESS):
+            logger.warning(f"Unknown analysis executor '{mode}', running analysis inline")
+            mode = MODE_INLINE
+        self.mode = mode
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.inlineBelow = inlineBelow
+        self.maxPending = maxPending
+        self._slots = asyncio.Semaphore(maxPending)
+        self._executor: Executor | None = None
+        # jobs handed to the executor and not done yet
+        self.pending = 0
+        # set once the workers are up (or starting them failed)
+        self.ready = asyncio.Event()
+        registry.gauge("ninjabot_analysis_pending", "Analysis jobs waiting for or running in a worker", fn=lambda: self.pending)
+
+    def _createExecutor(self) -> Executor | None:
+        if self.mode == MODE_PROCESS:
+            # spawn, a forked worker would inherit the gateway and http sockets of the bot
+            return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        if self.mode == MODE_THREAD:
+            return ThreadPoolExecutor(self.workers, thread_name_prefix="analysis")
+        return None
+
+    async def start(self) -> None:
+        """Create the executor and boot its workers now instead of on the first raid"""
+        executor = self._executor = self._createExecutor()
+        if executor is None:
+            self.ready.set()
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*[loop.run_in_executor(executor, _warmup) for _ in range(self.workers)])
+        except Exception as E:
+            logger.error(f"Could not start the analysis pool, running analysis inline: {E}")
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self._executor is executor: self._executor = None
+            return
+        finally:
+            self.ready.set()
+        logger.info(f"Analysis pool started: {self.mode} executor with {self.workers} workers")
+
+    async def stop(self) -> None:
+        if self._executor is None: return
+        executor, self._executor = self._executor, None
+        # don't block the event loop while the workers finish
+        await asyncio.get_running_loop().run_in_executor(None, lambda: executor.shutdown(wait=True, cancel_futures=True))
+
+    async def run(self, fn: Callable[..., T], *args, size: int = 0) -> T:
+        """Result of fn(*args), computed in a worker if the input ('size', e.g. text length) is big enough"""
+        if self._executor is None or size < self.inlineBelow:
+            analysisJobs.inc(MODE_INLINE)
+            return fn(*args)
+        async with self._slots:
+            self.pending += 1
+            executor = self._executor
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                # a worker died (e.g. killed by the OOM killer), start fresh ones and do this job here
+                if self._executor is executor:
+                    logger.error("Analysis worker process died, restarting the pool")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = self._createExecutor()
+                analysisJobs.inc(MODE_INLINE)
+                return fn(*args)
+            finally:
+                self.pending -= 1
+        analysisJobs.inc(self.mode)
+        return result
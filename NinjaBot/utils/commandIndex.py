@@ -0,0 +1,59 @@
+import logging
+from typing import NamedTuple
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# command sources, first one wins if a name exists in more then one source
+SOURCE_DYNAMIC = "dynamic"
+SOURCE_GITHUB = "github"
+SOURCE_NATIVE = "native"
+PRECEDENCE = (SOURCE_DYNAMIC, SOURCE_GITHUB, SOURCE_NATIVE)
+
+class CommandEntry(NamedTuple):
+    name: str
+    source: str
+    reply: str | None  # reply text for dynamic/github commands, None for native ones
+    public: bool  # listed in the help output
+
+class CommandIndex:
+    """One merged lookup table for every command the bot knows, no matter where it comes from"""
+    def __init__(self) -> None:
+        self._sources: dict[str, dict[str, CommandEntry]] = {s: {} for s in PRECEDENCE}
+        self._merged: dict[str, CommandEntry] = {}
+
+    def resolve(self, name: str) -> CommandEntry | None:
+        """Find the command that handles 'name', reply commands are case insensitive"""
+        return self._merged.get(name.lower()) or self._merged.get(name)
+
+    def catalog(self) -> list[str]:
+        """Sorted list of all public command names"""
+        return sorted(e.name for e in self._merged.values() if e.public)
+
+    def setReplies(self, source: str, replies: dict) -> None:
+        """Replace the commands of a reply source (github or dynamic)"""
+        self._update(source, {
+            name.lower(): CommandEntry(name.lower(), source, reply, True) for name, reply in replies.items()
+        })
+
+    def setNative(self, bot) -> None:
+        """Replace the native commands with what is currently registered on the bot"""
+        entries = {}
+        for name, cmd in bot.all_commands.items():
+            # aliases resolve but are not listed, same for hidden commands and commands of internal cogs
+            public = name == cmd.name and not cmd.hidden and not getattr(cmd.cog, "isInternal", True)
+            entries[name] = CommandEntry(name, SOURCE_NATIVE, None, public)
+        self._update(SOURCE_NATIVE, entries)
+
+    def _update(self, source: str, entries: dict[str, CommandEntry]) -> None:
+        # only names that were added, removed or changed in this source need a new winner
+        old = self._sources[source]
+        changed = {n for n in old.keys() | entries.keys() if old.get(n) != entries.get(n)}
+        self._sources[source] = entries
+        for name in changed:
+            winner = next((self._sources[s][name] for s in PRECEDENCE if name in self._sources[s]), None)
+            if winner:
+                self._merged[name] = winner
+            else:
+                self._merged.pop(name, None)
+        if changed:
+            logger.debug(f"command index: {len(changed)} {source} command(s) changed, {len(self._merged)} total")
@@ -1,18 +1,94 @@
+import asyncio
+import inspect
+import json
 import logging
+import os
 from pathlib import Path
+from typing import Callable
 from utils.jsonFile import fileHelper
+from utils.configSnapshot import ConfigSnapshot, compileSnapshot
+from utils.configSchema import validate, RESTART_KEYS
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
+# seconds between checks of the config file for changes, see "configReloadInterval"
+DEFAULT_RELOAD_INTERVAL = 2.0
+# channels of one guild, a guild without its own never gets the channel of another guild
+GUILD_CHANNEL_KEYS = frozenset({"botlogChannel", "updatesChannel", "servicesChannel", "servicesAnnounceChannel"})
+
+class GuildConfig:
+    """Config of a single guild, keys in its "guilds" block win over the global ones"""
+    def __init__(self, config: "Config", guildId: int | None) -> None:
+        self._config = config
+        self.guildId = guildId
+
+    def _own(self) -> dict | None:
+        return self._config._guildOptions(self.guildId)
+
+    def _inherits(self, key) -> bool:
+        # the top level channels belong to the legacy "guild", or to every guild if none is configured
+        if key not in GUILD_CHANNEL_KEYS: return True
+        return not self._config.guildIds() if self.guildId is None else self.guildId == self._config.primaryGuildId()
+
+    def get(self, key):
+        """return a config option of this guild, or the global one"""
+        own = self._own()
+        if own is not None and key in own:
+            return own[key]
+        return self._config.get(key) if self._inherits(key) else None
+
+    def has(self, key):
+        own = self._own()
+        return bool(own is not None and key in own) or (self._inherits(key) and self._config.has(key))
+
+    async def set(self, key, newVal) -> None:
+        """set an option of this guild, global if the guild has no own block"""
+        own = self._own()
+        if own is None:
+            await self._config.set(key, newVal)
+            return
+        own[key] = newVal
+        self._config._compile()
+        await self._config._flushToFile()
+        logger.debug(f"changed {key} of guild {self.guildId} to {newVal}")
+
 class Config:
-    """A helper class to handle the bot config file"""
+    """A helper class to handle the bot config file
+
+    set() writes the file right away, in one atomic write. The bot keeps its changing state in the
+    state store, so set() is rare and there is nothing to collect changes for.
+
+    Edits of the file are picked up while the bot runs (see watch()): a valid new document replaces
+    the options and the snapshot in one go and subscribers are told which keys changed.
+    An invalid one is logged and the running config stays.
+    """
     def __init__(self, file: str | Path) -> None:
+        self._file = file
         self._fh = fileHelper(file)
         self._configOptions = {}
+        self._flushLock = asyncio.Lock()
+        # what the file holds right now, identical content is never written again
+        self._written: str | None = None
+        # guild id -> view, so per message lookups stay a dict hit no matter how many guilds there are
+        self._guildViews: dict[int, GuildConfig] = {}
+        self._defaultView = GuildConfig(self, None)
+        # name -> (callback, keys it cares about or None for all)
+        self._subscribers: dict[str, tuple[Callable, frozenset[str] | None]] = {}
+        self._watchTask: asyncio.Task | None = None
+        # (mtime, size) of the file when it was last read or written
+        self._fileStat: tuple[int, int] | None = None
+        # compiled, read-only view for hot paths, replaced as a whole on every change
+        self.snapshot: ConfigSnapshot = compileSnapshot(self)
 
     async def parse(self) -> None:
         """read config file"""
+        self._fileStat = self._stat()
         self._configOptions = await self._fh.read()
+        self._written = self._serialize()
+        self._indexGuilds()
+        self._compile()
+        for error in validate(self._configOptions):
+            logger.warning(f"config: {error}")
 
     def get(self, key):
         """return a config option by the given key"""
@@ -24,9 +100,157 @@ class Config:
     async def set(self, key, newVal) -> None:
         """set a config option to a new value + trigger flush"""
         self._configOptions[key] = newVal
+        if key in ("guild", "guilds"):
+            self._indexGuilds()
+        self._compile()
         await self._flushToFile()
         logger.debug(f"changed {key} to {newVal}")
 
+    def subscribe(self, name: str, callback: Callable, keys=None) -> None:
+        """Call callback(changedKeys) (sync or async) after a reload changed one of 'keys' (default: any key)"""
+        self._subscribers[name] = (callback, frozenset(keys) if keys is not None else None)
+
+    def unsubscribe(self, name: str) -> None:
+        self._subscribers.pop(name, None)
+
+    def watch(self) -> None:
+        """Start polling the file for changes, every "configReloadInterval" seconds (0 turns it off)"""
+        interval = self._configOptions.get("configReloadInterval", DEFAULT_RELOAD_INTERVAL)
+        if not interval or self._watchTask: return
+        self._watchTask = asyncio.get_running_loop().create_task(self._watchLoop(interval), name="config.watch")
+        logger.info(f"Watching {self._file} for changes every {interval} s")
+
+    async def stopWatching(self) -> None:
+        if self._watchTask is None: return
+        self._watchTask.cancel()
+        try:
+            await self._watchTask
+        except asyncio.CancelledError:
+            pass
+        self._watchTask = None
+
+    async def _watchLoop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            stat = self._stat()
+            if stat is None or stat == self._fileStat: continue
+            self._fileStat = stat
+            try:
+                await self.reload()
+            except Exception as E:
+                logger.exception(E)
+
+    async def reload(self) -> frozenset[str]:
+        """Read the file again and apply it if it is valid, returns the changed keys"""
+        try:
+            content = await self._fh.readText()
+            if content == self._written:
+                return frozenset()
+            options = json.loads(content)
+        except (OSError, ValueError) as E:
+            logger.error(f"Not reloading the config, can't read it: {E}")
+            return frozenset()
+        errors = validate(options)
+        if errors:
+            logger.error("Not reloading the config, it is invalid:\n" + "\n".join(errors))
+            return frozenset()
+        changed = self._changedKeys(self._configOptions, options)
+        # swap everything before anyone gets notified
+        self._configOptions = options
+        self._written = self._serialize()
+        self._indexGuilds()
+        self._compile()
+        if not changed:
+            return changed
+        logger.info(f"Reloaded config, changed: {', '.join(sorted(changed))}")
+        if changed & RESTART_KEYS:
+            logger.warning(f"{', '.join(sorted(changed & RESTART_KEYS))} only take effect after a restart")
+        await self._notify(changed)
+        return changed
+
+    @staticmethod
+    def _changedKeys(old: dict, new: dict) -> frozenset[str]:
+        changed = frozenset(key for key in old.keys() | new.keys() if old.get(key) != new.get(key))
+        if "guilds" in changed:
+            # an option changed in a guild block counts as a change of that option
+            oldGuilds, newGuilds = old.get("guilds") or {}, new.get("guilds") or {}
+            for guildId in oldGuilds.keys() | newGuilds.keys():
+                changed |= Config._changedKeys(oldGuilds.get(guildId) or {}, newGuilds.get(guildId) or {})
+        return changed
+
+    async def _notify(self, changed: frozenset[str]) -> None:
+        for name, (callback, keys) in list(self._subscribers.items()):
+            if keys is not None and keys.isdisjoint(changed): continue
+            try:
+                result = callback(changed)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as E:
+                logger.error(f"config subscriber '{name}' failed")
+                logger.exception(E)
+
+    def _stat(self) -> tuple[int, int] | None:
+        try:
+            stat = os.stat(self._file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def forGuild(self, guildId: int | str | None) -> GuildConfig:
+        """Config view of a guild, unknown guilds (and DMs) see the global options without the guild channels"""
+        try:
+            return self._guildViews.get(int(guildId), self._defaultView)
+        except (TypeError, ValueError):
+            return self._defaultView
+
+    def guildIds(self) -> list[int]:
+        """Every guild the bot is configured for, the legacy "guild" key first"""
+        return list(self._guildViews)
+
+    def primaryGuildId(self) -> int | None:
+        """The legacy "guild" key, None if it is not set"""
+        guild = str(self._configOptions.get("guild") or "")
+        return int(guild) if guild.isdigit() else None
+
+    def allGuildValues(self, key) -> list:
+        """The value of an option in every configured guild, lists are flattened, e.g. for router channels"""
+        values = []
+        for view in self._guildViews.values() or [self._defaultView]:
+            value = view.get(key)
+            if value is None: continue
+            for v in value if isinstance(value, list) else [value]:
+                if v not in values: values.append(v)
+        return values
+
+    def _guildOptions(self, guildId: int | None) -> dict | None:
+        if guildId is None: return None
+        guilds = self._configOptions.get("guilds") or {}
+        return guilds.get(str(guildId))
+
+    def _indexGuilds(self) -> None:
+        primary = self.primaryGuildId()
+        ids = [] if primary is None else [primary]
+        for key in self._configOptions.get("guilds") or {}:
+            if not str(key).isdigit():
+                logger.warning(f"ignoring guild block '{key}', not a guild id")
+            elif int(key) not in ids:
+                ids.append(int(key))
+        self._guildViews = {guildId: GuildConfig(self, guildId) for guildId in ids}
+
+    def _compile(self) -> None:
+        # built completely before the swap, readers see the old or the new snapshot, never a mix
+        self.snapshot = compileSnapshot(self)
+
+    def _serialize(self) -> str:
+        return json.dumps(self._configOptions, indent=4)
+
     async def _flushToFile(self) -> None:
-        """Write config options from memory to file"""
-        await self._fh.write(self._configOptions)
\ No newline at end of file
+        """Write config options from memory to file, if they changed"""
+        async with self._flushLock:
+            content = self._serialize()
+            if content == self._written:
+                return
+            await self._fh.writeText(content)
+            self._written = content
+            # our own write is not an edit to reload
+            self._fileStat = self._stat()
@@ -0,0 +1,87 @@
+"""Checks a config document before it replaces the running one
+
+Only structure is checked, not whether ids exist on discord. Unknown keys are allowed,
+e.g. welcome texts referenced by autoThreadWelcomeMapping.
+"""
+
+ID = (str, int)
+
+# key -> accepted types, None is always accepted
+SCHEMA: dict[str, type | tuple] = {
+    "discordBotToken": str,
+    "commandPrefix": str,
+    "githubUrl": str,
+    "isDev": bool,
+    "stateFile": str,
+    "configReloadInterval": (int, float),
+    "profileImports": bool,
+    "logLevels": dict,
+    "jsonLog": str,
+    "loopWatchdog": dict,
+    "recordEvents": str,
+    "discordApiBase": str,
+    "metrics": dict,
+    "analysis": dict,
+    "http": dict,
+    "guild": ID,
+    "guilds": dict,
+    "sharding": dict,
+    "botlogChannel": ID,
+    "redditChannel": ID,
+    "youtubeDiscordChannel": ID,
+    "updatesChannel": ID,
+    "allowedUpdateUsers": list,
+    "autoThreadEnabledChannels": list,
+    "autoThreadWelcomeMapping": dict,
+    "lensEnabledChannels": list,
+    "aiEnabledChannels": list,
+    "ai": dict,
+    "channelInstructions": dict,
+    "stevesbotUserId": ID,
+    "servicesChannel": ID,
+    "servicesAnnounceChannel": ID,
+    "servicesApprovers": list,
+    "raidDetection": dict,
+    "antiSpam": dict,
+    "contentRules": list,
+}
+
+REQUIRED = ("discordBotToken", "commandPrefix")
+
+# only read once at startup, a change is applied but has no effect until the bot restarts
+RESTART_KEYS = frozenset(["discordBotToken", "discordApiBase", "stateFile", "sharding", "http", "analysis", "metrics", "loopWatchdog", "recordEvents", "profileImports", "jsonLog"])
+
+def _typeName(types) -> str:
+    return " or ".join(t.__name__ for t in types) if isinstance(types, tuple) else types.__name__
+
+def _checkOptions(options: dict, where: str, texts: dict) -> list[str]:
+    errors = []
+    for key, types in SCHEMA.items():
+        value = options.get(key)
+        # bool is an int, but an id or a delay is never true/false
+        if value is None or (isinstance(value, types) and not (isinstance(value, bool) and types is not bool)):
+            continue
+        errors.append(f"{where}{key} must be {_typeName(types)}, not {type(value).__name__}")
+    mapping = options.get("autoThreadWelcomeMapping")
+    for channel, textKey in mapping.items() if isinstance(mapping, dict) else ():
+        text = texts.get(textKey)
+        if text is None: continue
+        try:
+            text.format(usermention="")
+        except (AttributeError, KeyError, IndexError, ValueError) as E:
+            errors.append(f"{where}{textKey} (welcome text of {channel}) is not a valid template: {E!r}")
+    return errors
+
+def validate(options) -> list[str]:
+    """All problems of a config document, empty if it can be used"""
+    if not isinstance(options, dict):
+        return ["the config must be a json object"]
+    errors = [f"{key} is missing" for key in REQUIRED if key not in options]
+    errors += _checkOptions(options, "", options)
+    for guildId, block in (options.get("guilds") or {}).items() if isinstance(options.get("guilds"), dict) else ():
+        if not isinstance(block, dict):
+            errors.append(f"guilds.{guildId} must be an object")
+            continue
+        # welcome texts of a guild block may live in the global part
+        errors += _checkOptions(block, f"guilds.{guildId}.", {**options, **block})
+    return errors
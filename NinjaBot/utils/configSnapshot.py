@@ -0,0 +1,90 @@
+"""Typed, immutable view of the config for lookups on every message or reaction
+
+The config file keeps ids as strings in lists, e.g. "autoThreadEnabledChannels": ["123", ...].
+A snapshot converts them once into int frozensets and prebuilt maps, so hot paths compare
+discord ids directly instead of converting and scanning lists. Snapshots are never changed,
+the Config builds a new one on every change and swaps the reference.
+"""
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping
+
+def _id(value) -> int | None:
+    """a discord id from the config, None for placeholders like "YOUR_CHANNEL_ID" """
+    value = str(value or "").strip()
+    return int(value) if value.isdigit() else None
+
+def _ids(values) -> frozenset[int]:
+    if values is None: return frozenset()
+    if not isinstance(values, (list, tuple, set)): values = [values]
+    return frozenset(i for i in map(_id, values) if i is not None)
+
+def _channelMap(mapping) -> Mapping[int, str]:
+    return MappingProxyType({_id(k): v for k, v in (mapping or {}).items() if _id(k) is not None})
+
+@dataclass(frozen=True, slots=True)
+class GuildSnapshot:
+    """Compiled settings of one guild (or the global ones)"""
+    guildId: int | None
+    autoThreadChannels: frozenset[int]
+    # threads are only created if "autoThreadWelcomeMapping" exists
+    createThreads: bool
+    # channel id -> welcome text with {usermention}, already resolved through autoThreadWelcomeMapping
+    welcomeTexts: Mapping[int, str]
+    aiChannels: frozenset[int]
+    channelInstructions: Mapping[int, str]
+    updatesChannel: int | None
+    allowedUpdateUsers: frozenset[int]
+    servicesChannel: int | None
+    servicesAnnounceChannel: int | None
+    servicesApprovers: frozenset[int]
+    botlogChannel: int | None
+
+@dataclass(frozen=True, slots=True)
+class ConfigSnapshot:
+    guilds: Mapping[int, GuildSnapshot]
+    default: GuildSnapshot
+    commandPrefix: str | None
+    # channel ids are unique across guilds, so these can be merged over all guilds
+    channelInstructions: Mapping[int, str]
+
+    def forGuild(self, guildId: int | None) -> GuildSnapshot:
+        """Snapshot of a guild, unknown guilds (and DMs) get the global settings without the guild channels"""
+        return self.guilds.get(guildId, self.default)
+
+def compileGuild(config, guildId: int | None) -> GuildSnapshot:
+    """'config' is a GuildConfig, so per guild blocks already win over the global options and
+    channels like botlogChannel are only set for the guild they belong to"""
+    welcomeTexts = {}
+    for channel, textKey in (config.get("autoThreadWelcomeMapping") or {}).items():
+        text = config.get(textKey)
+        if _id(channel) is not None and isinstance(text, str):
+            welcomeTexts[_id(channel)] = text
+    return GuildSnapshot(
+        guildId=guildId,
+        autoThreadChannels=_ids(config.get("autoThreadEnabledChannels")),
+        createThreads=config.has("autoThreadWelcomeMapping"),
+        welcomeTexts=MappingProxyType(welcomeTexts),
+        aiChannels=_ids(config.get("aiEnabledChannels")),
+        channelInstructions=_channelMap(config.get("channelInstructions")),
+        updatesChannel=_id(config.get("updatesChannel")),
+        allowedUpdateUsers=_ids(config.get("allowedUpdateUsers")),
+        servicesChannel=_id(config.get("servicesChannel")),
+        servicesAnnounceChannel=_id(config.get("servicesAnnounceChannel")),
+        servicesApprovers=_ids(config.get("servicesApprovers")),
+        botlogChannel=_id(config.get("botlogChannel"))
+    )
+
+def compileSnapshot(config) -> ConfigSnapshot:
+    """Build a new snapshot from a Config"""
+    guilds = {guildId: compileGuild(config.forGuild(guildId), guildId) for guildId in config.guildIds()}
+    default = compileGuild(config.forGuild(None), None)
+    instructions = {}
+    for guild in list(guilds.values()) or [default]:
+        instructions.update(guild.channelInstructions)
+    return ConfigSnapshot(
+        guilds=MappingProxyType(guilds),
+        default=default,
+        commandPrefix=config.get("commandPrefix"),
+        channelInstructions=MappingProxyType(instructions)
+    )
@@ -0,0 +1,162 @@
+"""Finds image links, invites and leaked secrets in a message with one regex pass
+
+All rules are compiled into one alternation, so a message without findings (nearly all of them) is
+scanned once no matter how many rules there are. Most rules name a few literals that every match
+contains ("imgur", "obsws://", "sk-", ...). One search for all literals over the lower cased text picks
+the rules that can match at all, only those are combined with the few rules without literals. So the
+cost of a message depends on the rules that could match it, not on the size of the rule set.
+An alternation only reports the first rule that matches at a position and hides overlapping matches of
+other rules, so once it found something each of the active rules collects its own matches.
+Pure data in and out, like utils.analysis, so it also runs in the worker processes of the AnalysisPool.
+"""
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+KIND_IMAGE = "image"
+KIND_INVITE = "invite"
+KIND_SECRET = "secret"
+
+# combined patterns kept per scanner, one for each set of rules a message needed
+MAX_PATTERNS = 64
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    name: str
+    kind: str  # image, invite or secret
+    pattern: str
+    # lower case strings of which every match contains at least one, empty if there are none
+    literals: tuple[str, ...] = ()
+    # what the user is told was found, e.g. "stream key"
+    label: str = ""
+    ignoreCase: bool = False
+
+@dataclass(frozen=True, slots=True)
+class Finding:
+    rule: str
+    kind: str
+    label: str
+    start: int
+    end: int
+
+DEFAULT_RULES: tuple[Rule, ...] = (
+    # common image hosting urls
+    Rule("imageUrl", KIND_IMAGE,
+         r"(?:https?://)?(?:www\.)?(?:(?:i\.)?imgur\.com/\w+|giphy\.com/\w+|i\.redd\.it/\w+|media\.discordapp\.net/attachments/"
+         r"|cdn\.discordapp\.com/attachments/|tenor\.com/\w+|gfycat\.com/\w+)",
+         ("imgur.com/", "giphy.com/", "i.redd.it/", "discordapp.", "tenor.com/", "gfycat.com/"), ignoreCase=True),
+    # discord invite links, but not links to channels
+    Rule("discordInvite", KIND_INVITE, r"(?:https?://)?(?:www\.)?(?:discord(?:app)?\.(?:gg|io|me|li|com))/(?!channels/)\S{,20}", ("discord",)),
+    Rule("youtubeStreamKey", KIND_SECRET, r"(?:[a-z0-9]{4}-){4}[a-z0-9]{4}", label="stream key"),
+    Rule("twitchStreamKey", KIND_SECRET, r"live_\d{8}_[a-zA-Z0-9]{32}", ("live_",), "stream key"),
+    Rule("discordToken", KIND_SECRET, r"\b[MNO][\w-]{23,27}\.[\w-]{6}\.[\w-]{27,38}\b", label="Discord token"),
+    # obs websocket connect urls carry the password as path: obsws://host:4455/password
+    Rule("obsWebsocketPassword", KIND_SECRET, r"obsws://[^\s/]+/[^\s/]+", ("obsws://",), "OBS WebSocket password", ignoreCase=True),
+    # &password=false only turns the room password off
+    Rule("vdoNinjaPassword", KIND_SECRET, r"(?:vdo|obs)\.ninja/\S*?[?&](?:password|pass|pw)=(?!false\b)[^&\s]+",
+         (".ninja/",), "room password", ignoreCase=True),
+    Rule("openaiKey", KIND_SECRET, r"\bsk-(?:proj-|ant-)?[\w-]{32,}", ("sk-",), "API key"),
+    Rule("googleKey", KIND_SECRET, r"\bAIza[\w-]{35}", ("aiza",), "API key"),
+    Rule("githubToken", KIND_SECRET, r"\b(?:gh[pousr]_[A-Za-z0-9]{36}|github_pat_\w{82})", ("gh", "github_pat_"), "access token"),
+    Rule("awsAccessKey", KIND_SECRET, r"\b(?:AKIA|ASIA)[0-9A-Z]{16}\b", ("akia", "asia"), "API key"),
+    Rule("slackToken", KIND_SECRET, r"\bxox[abprs]-[A-Za-z0-9-]{10,}", ("xox",), "access token"),
+)
+
+def _compile(rule: Rule) -> re.Pattern:
+    return re.compile(rule.pattern, re.IGNORECASE if rule.ignoreCase else 0)
+
+def _combine(rules: tuple[Rule, ...]) -> re.Pattern | None:
+    parts = [f"{'(?i:' if rule.ignoreCase else '(?:'}{rule.pattern})" for rule in rules]
+    return re.compile("|".join(parts)) if parts else None
+
+class ContentScanner:
+    """All findings of a message, one pass over the combined rules if there are none"""
+    def __init__(self, rules: tuple[Rule, ...] = DEFAULT_RULES) -> None:
+        self.rules = tuple(rules)
+        literals = sorted({literal.lower() for rule in self.rules for literal in rule.literals}, key=len, reverse=True)
+        # a literal in the message also means every shorter literal inside it is there ("discordapp." -> "discord")
+        self._literalRules = {
+            literal: frozenset(i for i, rule in enumerate(self.rules) if any(l.lower() in literal for l in rule.literals))
+            for literal in literals
+        }
+        # the lookahead finds literals at every position, also where they overlap
+        self._literals = re.compile(f"(?=({'|'.join(map(re.escape, literals))}))") if literals else None
+        # rules without literals have to run for every message
+        self._unguarded = frozenset(i for i, rule in enumerate(self.rules) if not rule.literals)
+        self._rulePatterns = tuple(_compile(rule) for rule in self.rules)
+        # rule indexes -> combined pattern, only the combinations that messages actually need
+        self._patterns: dict[frozenset[int], re.Pattern | None] = {}
+
+    def __reduce__(self):
+        # workers rebuild it from the rules, compiled once per process
+        return scannerFor, (self.rules,)
+
+    def _pattern(self, active: frozenset[int]) -> re.Pattern | None:
+        if active not in self._patterns:
+            if len(self._patterns) >= MAX_PATTERNS: self._patterns.clear()
+            self._patterns[active] = _combine(tuple(self.rules[i] for i in sorted(active)))
+        return self._patterns[active]
+
+    def scan(self, content: str) -> list[Finding]:
+        if not content:
+            return []
+        active = self._unguarded
+        if self._literals is not None:
+            found = {match.group(1) for match in self._literals.finditer(content.lower())}
+            if found:
+                active = active.union(*(self._literalRules[literal] for literal in found))
+        pattern = self._pattern(active)
+        if pattern is None or pattern.search(content) is None:
+            return []
+        findings = []
+        for i in sorted(active):
+            rule = self.rules[i]
+            for match in self._rulePatterns[i].finditer(content):
+                findings.append(Finding(rule.name, rule.kind, rule.label, match.start(), match.end()))
+        findings.sort(key=lambda finding: finding.start)
+        return findings
+
+@lru_cache(maxsize=8)
+def scannerFor(rules: tuple[Rule, ...]) -> ContentScanner:
+    return ContentScanner(rules)
+
+def buildRules(options: list | None) -> tuple[Rule, ...]:
+    """The default rules changed by the "contentRules" config entries
+
+    An entry with the name of a default rule replaces it ({"name": ..., "enabled": false} turns it off),
+    any other name adds a rule. Entries with a pattern that is invalid on its own or together with the
+    other rules (e.g. a group name used twice) are logged and left out.
+    """
+    rules = {rule.name: rule for rule in DEFAULT_RULES}
+    for entry in options or []:
+        name = entry.get("name") if isinstance(entry, dict) else None
+        if not name:
+            logger.warning(f"Ignoring content rule without a name: {entry!r}")
+            continue
+        if entry.get("enabled", True) is False:
+            rules.pop(name, None)
+            continue
+        base = rules.get(name)
+        try:
+            rule = Rule(
+                name=name,
+                kind=entry.get("kind", base.kind if base else KIND_SECRET),
+                pattern=entry.get("pattern", base.pattern if base else None),
+                literals=tuple(l.lower() for l in entry.get("literals", base.literals if base else ())),
+                label=entry.get("label", base.label if base else "secret"),
+                ignoreCase=bool(entry.get("ignoreCase", base.ignoreCase if base else False))
+            )
+            _compile(rule)
+            # checked the way it is combined: group names must be unique over all rules and
+            # global flags like (?i) are only valid at the start of the combined pattern
+            _combine(tuple({**rules, name: rule}.values()))
+        except (TypeError, AttributeError, re.error) as E:
+            logger.error(f"Ignoring content rule {name}: {E}")
+            continue
+        rules[name] = rule
+    return tuple(rules.values())
+
+DEFAULT_SCANNER = scannerFor(DEFAULT_RULES)
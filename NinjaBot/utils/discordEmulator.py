@@ -0,0 +1,297 @@
+import asyncio
+import itertools
+import json
+import logging
+import re
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Callable
+import discord
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# discord epoch in ms, used to build snowflakes
+DISCORD_EPOCH = 1420070400000
+
+CHANNEL_TEXT = 0
+CHANNEL_NEWS = 5
+CHANNEL_PUBLIC_THREAD = 11
+
+# messages kept per channel for history and fetch requests
+HISTORY_SIZE = 200
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class DiscordEmulator:
+    """In memory stand-in for the part of the discord API the bot uses
+
+    Answers REST requests through handle() and announces the gateway events that real discord
+    would send as a consequence (bot messages, threads) to the onEvent callback. Used by the
+    replay harness in process and by the REST stand-in server over http.
+    """
+    def __init__(self, guildId: int | None = None) -> None:
+        self._seq = itertools.count()
+        self.guildId = guildId or self.snowflake()
+        self.applicationId = self.snowflake()
+        self.botUser = self.userPayload(self.snowflake(), "NinjaBot", bot=True)
+        self.roles: dict[int, dict] = {self.guildId: self.rolePayload(self.guildId, "@everyone")}
+        self.channels: dict[int, dict] = {}
+        self.users: dict[int, dict] = {int(self.botUser["id"]): self.botUser}
+        # user id -> when they joined the guild, members not in here joined just now
+        self.joinedAt: dict[int, str] = {}
+        self.messages: dict[int, dict] = {}
+        self.history: dict[int, deque] = {}
+        self.commands: list[dict] = []
+        # (method, route template) -> number of calls
+        self.calls: Counter = Counter()
+        self.onEvent: Callable[[str, dict], None] | None = None
+        self._routes = [(method, re.compile("^" + re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", path) + "$"), path, getattr(self, handler))
+                        for method, path, handler in ROUTES]
+
+    def snowflake(self) -> int:
+        """Unique, time ordered id"""
+        return ((int(time.time() * 1000) - DISCORD_EPOCH) << 22) | (next(self._seq) & 0x3FFFFF)
+
+    # payload builders, shaped like the real API so discord.py can parse them
+
+    def userPayload(self, userId: int, name: str, bot: bool = False) -> dict:
+        return {"id": str(userId), "username": name, "global_name": name, "discriminator": "0", "avatar": None, "bot": bot}
+
+    def rolePayload(self, roleId: int, name: str) -> dict:
+        return {"id": str(roleId), "name": name, "color": 0, "hoist": False, "position": 0,
+                "permissions": "0", "managed": False, "mentionable": False}
+
+    def memberPayload(self, user: dict, roles: list[int] | None = None) -> dict:
+        return {"user": user, "roles": [str(r) for r in roles or []], "joined_at": self.joinedAt.get(int(user["id"])) or _now(),
+                "deaf": False, "mute": False, "flags": 0}
+
+    def channelPayload(self, channelId: int, name: str, kind: int = CHANNEL_TEXT, parentId: int | None = None,
+                       ownerId: int | None = None) -> dict:
+        channel = {"id": str(channelId), "guild_id": str(self.guildId), "name": name, "type": kind, "position": 0,
+                   "permission_overwrites": [], "nsfw": False, "parent_id": str(parentId) if parentId else None,
+                   "last_message_id": None, "rate_limit_per_user": 0}
+        if kind == CHANNEL_PUBLIC_THREAD:
+            channel.update(owner_id=str(ownerId or self.botUser["id"]), message_count=0, member_count=1, flags=0,
+                           thread_metadata={"archived": False, "auto_archive_duration": 10080,
+                                            "archive_timestamp": _now(), "locked": False})
+        return channel
+
+    def messagePayload(self, channelId: int, author: dict, content: str = "", roles: list[int] | None = None,
+                       **extra) -> dict:
+        message = {"id": str(self.snowflake()), "channel_id": str(channelId), "guild_id": str(self.guildId),
+                   "author": author, "content": content, "timestamp": _now(), "edited_timestamp": None,
+                   "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+                   "attachments": [], "embeds": [], "pinned": False, "type": 0, "flags": 0}
+        if not author.get("bot"):
+            message["member"] = {k: v for k, v in self.memberPayload(author, roles).items() if k != "user"}
+        message.update(extra)
+        return message
+
+    def guildPayload(self) -> dict:
+        """GUILD_CREATE payload with everything that was added so far"""
+        return {"id": str(self.guildId), "name": "Emulated guild", "owner_id": self.botUser["id"], "icon": None,
+                "features": [], "emojis": [], "stickers": [], "member_count": 1,
+                "roles": list(self.roles.values()),
+                "channels": [c for c in self.channels.values() if c["type"] != CHANNEL_PUBLIC_THREAD],
+                "threads": [c for c in self.channels.values() if c["type"] == CHANNEL_PUBLIC_THREAD],
+                "members": [self.memberPayload(self.botUser)], "voice_states": [], "presences": []}
+
+    # state helpers
+
+    def addRole(self, name: str, roleId: int | None = None) -> int:
+        roleId = roleId or self.snowflake()
+        self.roles[roleId] = self.rolePayload(roleId, name)
+        return roleId
+
+    def addUser(self, name: str, userId: int | None = None, bot: bool = False, joinedAt: datetime | None = None) -> dict:
+        userId = userId or self.snowflake()
+        self.users[userId] = self.userPayload(userId, name, bot)
+        if joinedAt:
+            self.joinedAt[userId] = joinedAt.isoformat()
+        return self.users[userId]
+
+    def ensureChannel(self, channelId: int, name: str | None = None, kind: int = CHANNEL_TEXT,
+                      parentId: int | None = None, ownerId: int | None = None) -> dict:
+        if channelId not in self.channels:
+            self.channels[channelId] = self.channelPayload(channelId, name or f"channel-{channelId}", kind, parentId, ownerId)
+        return self.channels[channelId]
+
+    def store(self, message: dict) -> dict:
+        """Remember a message so it can be fetched, edited and shows up in history"""
+        mid, cid = int(message["id"]), int(message["channel_id"])
+        self.messages[mid] = message
+        channel = self.history.setdefault(cid, deque(maxlen=HISTORY_SIZE))
+        if len(channel) == channel.maxlen:
+            self.messages.pop(int(channel[0]["id"]), None)
+        channel.append(message)
+        return message
+
+    def emit(self, event: str, data: dict) -> None:
+        if self.onEvent: self.onEvent(event, data)
+
+    # REST
+
+    def match(self, method: str, path: str) -> tuple[str | None, dict, Callable | None]:
+        """(route template, path parameters, handler) of a request, template is None for unknown routes"""
+        for routeMethod, pattern, template, handler in self._routes:
+            if routeMethod != method: continue
+            match = pattern.match(path)
+            if match:
+                return template, match.groupdict(), handler
+        return None, {}, None
+
+    def handle(self, method: str, path: str, body: dict | list | None = None, params: dict | None = None) -> tuple[int, object]:
+        """Answer one REST request, returns (status, json payload or None)"""
+        template, pathParams, handler = self.match(method, path)
+        self.calls[(method, template or path)] += 1
+        if handler is None:
+            logger.debug(f"emulator has no route for {method} {path}")
+            return 404, {"code": 0, "message": "404: Not Found"}
+        return handler(body or {}, params or {}, **pathParams)
+
+    def _notFound(self, what: str) -> tuple[int, dict]:
+        return 404, {"code": 10008 if what == "message" else 10003, "message": f"Unknown {what}"}
+
+    def _sendMessage(self, body, params, channel_id):
+        cid = int(channel_id)
+        if cid not in self.channels: return self._notFound("channel")
+        extra = {"embeds": body.get("embeds") or [], "components": body.get("components") or []}
+        if body.get("message_reference"):
+            extra["message_reference"] = body["message_reference"]
+            extra["type"] = 19
+        message = self.store(self.messagePayload(cid, self.botUser, body.get("content") or "", **extra))
+        self.emit("MESSAGE_CREATE", message)
+        return 200, message
+
+    def _getMessages(self, body, params, channel_id):
+        messages = list(self.history.get(int(channel_id), ()))
+        if params.get("before"):
+            messages = [m for m in messages if int(m["id"]) < int(params["before"])]
+        limit = int(params.get("limit", 50))
+        return 200, messages[::-1][:limit]
+
+    def _getMessage(self, body, params, channel_id, message_id):
+        message = self.messages.get(int(message_id))
+        if not message or message["channel_id"] != channel_id: return self._notFound("message")
+        return 200, message
+
+    def _editMessage(self, body, params, channel_id, message_id):
+        message = self.messages.get(int(message_id))
+        if not message: return self._notFound("message")
+        message.update({k: v for k, v in body.items() if k in ("content", "embeds", "components")}, edited_timestamp=_now())
+        return 200, message
+
+    def _deleteMessage(self, body, params, channel_id, message_id):
+        message = self.messages.pop(int(message_id), None)
+        if not message: return self._notFound("message")
+        try:
+            self.history[int(channel_id)].remove(message)
+        except (KeyError, ValueError):
+            pass
+        return 204, None
+
+    def _bulkDelete(self, body, params, channel_id):
+        for mid in body.get("messages", []):
+            self._deleteMessage({}, {}, channel_id, mid)
+        return 204, None
+
+    def _createThread(self, body, params, channel_id, message_id=None):
+        parent = self.channels.get(int(channel_id))
+        if not parent: return self._notFound("channel")
+        # a thread started from a message has the id of that message
+        threadId = int(message_id) if message_id else self.snowflake()
+        thread = self.ensureChannel(threadId, body.get("name"), CHANNEL_PUBLIC_THREAD, int(channel_id))
+        self.emit("THREAD_CREATE", dict(thread, newly_created=True))
+        return 201, thread
+
+    def _editChannel(self, body, params, channel_id):
+        channel = self.channels.get(int(channel_id))
+        if not channel: return self._notFound("channel")
+        if "archived" in body:
+            channel.get("thread_metadata", {})["archived"] = body["archived"]
+        channel.update({k: v for k, v in body.items() if k in ("name", "topic")})
+        return 200, channel
+
+    def _getChannel(self, body, params, channel_id):
+        channel = self.channels.get(int(channel_id))
+        return (200, channel) if channel else self._notFound("channel")
+
+    def _noContent(self, body, params, **kwargs):
+        return 204, None
+
+    def _getMe(self, body, params):
+        return 200, self.botUser
+
+    def _getUser(self, body, params, user_id):
+        user = self.users.get(int(user_id)) or self.addUser(f"user-{user_id}", int(user_id))
+        return 200, user
+
+    def _kick(self, body, params, guild_id, user_id):
+        return 204, None
+
+    def _upsertCommands(self, body, params, application_id, guild_id):
+        self.commands = [dict(c, id=str(self.snowflake()), application_id=application_id, guild_id=guild_id, version="1")
+                         for c in body or []]
+        return 200, self.commands
+
+    def _getCommands(self, body, params, application_id, guild_id):
+        return 200, self.commands
+
+    def _crosspost(self, body, params, channel_id, message_id):
+        return self._getMessage(body, params, channel_id, message_id)
+
+# (method, path template, handler) of every emulated endpoint
+ROUTES = [
+    ("POST", "/channels/{channel_id}/messages", "_sendMessage"),
+    ("GET", "/channels/{channel_id}/messages", "_getMessages"),
+    ("POST", "/channels/{channel_id}/messages/bulk-delete", "_bulkDelete"),
+    ("GET", "/channels/{channel_id}/messages/{message_id}", "_getMessage"),
+    ("PATCH", "/channels/{channel_id}/messages/{message_id}", "_editMessage"),
+    ("DELETE", "/channels/{channel_id}/messages/{message_id}", "_deleteMessage"),
+    ("POST", "/channels/{channel_id}/messages/{message_id}/crosspost", "_crosspost"),
+    ("POST", "/channels/{channel_id}/messages/{message_id}/threads", "_createThread"),
+    ("POST", "/channels/{channel_id}/threads", "_createThread"),
+    ("PUT", "/channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me", "_noContent"),
+    ("PUT", "/channels/{channel_id}/thread-members/{user_id}", "_noContent"),
+    ("GET", "/channels/{channel_id}", "_getChannel"),
+    ("PATCH", "/channels/{channel_id}", "_editChannel"),
+    ("GET", "/users/@me", "_getMe"),
+    ("GET", "/users/{user_id}", "_getUser"),
+    ("DELETE", "/guilds/{guild_id}/members/{user_id}", "_kick"),
+    ("PUT", "/applications/{application_id}/guilds/{guild_id}/commands", "_upsertCommands"),
+    ("GET", "/applications/{application_id}/guilds/{guild_id}/commands", "_getCommands"),
+]
+
+class _Response:
+    """Just enough of an aiohttp response for discord.HTTPException"""
+    def __init__(self, status: int) -> None:
+        self.status = status
+        self.reason = "Emulated"
+
+class InProcessHttp:
+    """Replaces discord.py's HTTPClient.request so REST calls are answered by an emulator without any network"""
+    def __init__(self, emulator: DiscordEmulator) -> None:
+        self.emulator = emulator
+
+    def install(self, bot) -> None:
+        bot.http.request = self.request
+        # gateway events caused by REST calls are delivered like real ones, after the call returned
+        loop = asyncio.get_running_loop()
+        self.emulator.onEvent = lambda event, data: loop.call_soon(bot._connection.parsers[event], data)
+
+    async def request(self, route: discord.http.Route, *, files=None, form=None, **kwargs):
+        body = kwargs.get("json")
+        if form:
+            payload = next((f["value"] for f in form if f["name"] == "payload_json"), None)
+            body = json.loads(payload) if payload else None
+        path = route.url[len(route.BASE):].split("?")[0]
+        status, data = self.emulator.handle(route.method, path, body, kwargs.get("params"))
+        if status == 404:
+            raise discord.NotFound(_Response(status), data)
+        if status == 403:
+            raise discord.Forbidden(_Response(status), data)
+        if status >= 400:
+            raise discord.HTTPException(_Response(status), data)
+        return data
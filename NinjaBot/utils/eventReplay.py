@@ -0,0 +1,313 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator
+from utils.discordEmulator import DiscordEmulator, CHANNEL_NEWS, CHANNEL_PUBLIC_THREAD
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# gateway events the recorder keeps, everything else is not interesting for the hot path
+RECORDED_EVENTS = ("MESSAGE_CREATE", "MESSAGE_UPDATE", "MESSAGE_REACTION_ADD", "THREAD_CREATE")
+
+# config keys holding channel ids the cogs route on, with the channel type they get in an emulator
+CHANNEL_KEYS = {"updatesChannel": CHANNEL_NEWS, "servicesChannel": 0, "botlogChannel": 0, "autoThreadEnabledChannels": 0}
+
+# personal data in payloads, replaced by the recorder
+USER_FIELDS = ("username", "global_name", "nick", "display_name")
+DROPPED_FIELDS = ("avatar", "banner", "avatar_decoration_data", "email", "interaction", "interaction_metadata", "token")
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+MENTION_PATTERN = re.compile(r"<@!?(\d+)>")
+
+def configuredChannels(options: dict) -> dict[str, list[int]]:
+    """Valid channel ids of every routed config key, placeholders are left out"""
+    channels = {}
+    for key in CHANNEL_KEYS:
+        value = options.get(key)
+        channels[key] = [int(i) for i in (value if isinstance(value, list) else [value]) if i and str(i).isdigit()]
+    return channels
+
+class Sanitizer:
+    """Replaces user ids, names and mail addresses with stable pseudonyms, keeps everything else"""
+    def __init__(self, salt: str) -> None:
+        self.salt = salt.encode()
+
+    def userId(self, userId) -> str:
+        # stable per recording salt, so the same user keeps the same pseudonym
+        digest = hashlib.blake2b(str(userId).encode(), key=self.salt, digest_size=7).digest()
+        return str(int.from_bytes(digest, "big") | (1 << 60))
+
+    def _user(self, user: dict) -> dict:
+        user = {k: v for k, v in user.items() if k not in DROPPED_FIELDS}
+        user["id"] = self.userId(user["id"])
+        for field in USER_FIELDS:
+            if user.get(field): user[field] = "user" + user["id"][-6:]
+        return user
+
+    def content(self, text: str) -> str:
+        text = EMAIL_PATTERN.sub("user@example.com", text)
+        return MENTION_PATTERN.sub(lambda m: f"<@{self.userId(m.group(1))}>", text)
+
+    def payload(self, data):
+        if isinstance(data, list):
+            return [self.payload(v) for v in data]
+        if not isinstance(data, dict):
+            return data
+        if "username" in data and "id" in data:
+            return self._user(data)
+        clean = {}
+        for key, value in data.items():
+            if key in DROPPED_FIELDS: continue
+            if key in ("user_id", "owner_id", "author_id") and value:
+                clean[key] = self.userId(value)
+            elif key == "content" and isinstance(value, str):
+                clean[key] = self.content(value)
+            elif key in USER_FIELDS and value:
+                clean[key] = "user"
+            else:
+                clean[key] = self.payload(value)
+        return clean
+
+class EventRecorder:
+    """Writes sanitized gateway events to a gzip'd json lines file
+
+    Hooks into the parsers of discord.py's connection state, so the raw payloads are recorded
+    exactly as they came in and can be replayed through the same parsers later.
+    """
+    def __init__(self, bot, filename: str) -> None:
+        self.bot = bot
+        self.filename = filename
+        self.sanitizer = Sanitizer(hashlib.sha256(str(time.time_ns()).encode()).hexdigest())
+        self._file = None
+        self._start = 0.0
+        self._guilds: set[int] = set()
+        self._parsers: dict = {}
+
+    def start(self) -> None:
+        self._file = gzip.open(self.filename, "at", encoding="utf-8")
+        self._start = time.monotonic()
+        self._write({"version": 1, "recorded": time.time()})
+        parsers = self.bot._connection.parsers
+        for event in RECORDED_EVENTS:
+            self._parsers[event] = parsers[event]
+            parsers[event] = self._wrap(event, parsers[event])
+        logger.info(f"Recording gateway events to {self.filename}")
+
+    def stop(self) -> None:
+        if not self._file: return
+        self.bot._connection.parsers.update(self._parsers)
+        self._file.close()
+        self._file = None
+
+    def _wrap(self, event: str, parser):
+        def recordingParser(data) -> None:
+            try:
+                self.record(event, data)
+            except Exception as E:
+                logger.exception(E)
+            parser(data)
+        return recordingParser
+
+    def record(self, event: str, data: dict) -> None:
+        guildId = int(data.get("guild_id") or 0)
+        if guildId and guildId not in self._guilds:
+            # role names are needed to replay permission checks, they contain no personal data
+            self._guilds.add(guildId)
+            guild = self.bot.get_guild(guildId)
+            if guild:
+                self._write({"t": self._offset(), "e": "GUILD_ROLES", "d": [{"id": str(r.id), "name": r.name} for r in guild.roles]})
+        self._write({"t": self._offset(), "e": event, "d": self.sanitizer.payload(data)})
+
+    def _offset(self) -> float:
+        return round(time.monotonic() - self._start, 4)
+
+    def _write(self, entry: dict) -> None:
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+def readEvents(filename: str) -> Iterator[tuple[float, str, dict]]:
+    """(offset seconds, event name, payload) of a recording"""
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if "e" in entry:
+                yield entry["t"], entry["e"], entry["d"]
+
+def readHeader(filename: str) -> dict:
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        return json.loads(f.readline())
+
+def writeEvents(filename: str, events: Iterable[tuple[float, str, dict]], **header) -> None:
+    with gzip.open(filename, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"version": 1, "recorded": time.time(), **header}) + "\n")
+        for t, event, data in events:
+            f.write(json.dumps({"t": t, "e": event, "d": data}, separators=(",", ":")) + "\n")
+
+class TrafficGenerator:
+    """Synthetic gateway traffic built on top of an emulator, every scenario returns time ordered events"""
+    def __init__(self, emulator: DiscordEmulator, config, seed: int = 1) -> None:
+        self.emu = emulator
+        self.config = config
+        self.rnd = random.Random(seed)
+        self.moderatorRole = emulator.addRole("Moderator")
+        self.general = [int(emulator.ensureChannel(emulator.snowflake(), f"general-{i}")["id"]) for i in range(5)]
+
+    def _channel(self, key: str) -> int | None:
+        value = self.config.get(key)
+        if isinstance(value, list): value = value[0] if value else None
+        return int(value) if value and str(value).isdigit() else None
+
+    def _users(self, count: int, prefix: str, joinedDaysAgo: float = 365) -> list[dict]:
+        joinedAt = datetime.now(timezone.utc) - timedelta(days=joinedDaysAgo)
+        return [self.emu.addUser(f"{prefix}{i}", joinedAt=joinedAt) for i in range(count)]
+
+    def chatter(self, messages: int = 500, duration: float = 60) -> list:
+        """Regular members talking in general channels, mostly in one channel each"""
+        users = [(user, self.rnd.choice(self.general)) for user in self._users(max(messages // 10, 1), "member")]
+        words = "the stream is lagging when I add a second camera to the room with obs browser source".split()
+        events = []
+        for _ in range(messages):
+            user, home = self.rnd.choice(users)
+            content = " ".join(self.rnd.choices(words, k=self.rnd.randint(3, 20)))
+            if self.rnd.random() < 0.05: content += " https://i.imgur.com/abc123.png"
+            channel = home if self.rnd.random() < 0.9 else self.rnd.choice(self.general)
+            events.append((self.rnd.uniform(0, duration), "MESSAGE_CREATE", self.emu.messagePayload(channel, user, content)))
+        return events
+
+    def raid(self, accounts: int = 50, perAccount: int = 4, duration: float = 10) -> list:
+        """Fresh accounts posting the same scam across channels"""
+        text = "Free nitro for everyone!! claim here discord.gg/fr33n1tro before it runs out"
+        events = []
+        for user in self._users(accounts, "raider", joinedDaysAgo=0):
+            start = self.rnd.uniform(0, duration)
+            for i in range(perAccount):
+                content = text if self.rnd.random() < 0.7 else text + " " + self.rnd.choice("!?.")
+                events.append((start + i * 0.3, "MESSAGE_CREATE",
+                               self.emu.messagePayload(self.rnd.choice(self.general), user, content)))
+        return events
+
+    def supportBurst(self, users: int = 50, followUps: int = 3, duration: float = 30) -> list:
+        """Questions in the auto thread channels plus follow ups in already open threads"""
+        channel = self._channel("autoThreadEnabledChannels")
+        if not channel: return []
+        events = []
+        for user in self._users(users, "asker"):
+            t = self.rnd.uniform(0, duration)
+            events.append((t, "MESSAGE_CREATE", self.emu.messagePayload(
+                channel, user, "How do I get a stream key for vdo.ninja? It keeps disconnecting after a minute")))
+            thread = self.emu.channelPayload(self.emu.snowflake(), "older question", CHANNEL_PUBLIC_THREAD, channel, int(user["id"]))
+            events.append((t, "THREAD_CREATE", dict(thread, newly_created=True)))
+            for i in range(followUps):
+                events.append((t + 1 + i, "MESSAGE_CREATE", self.emu.messagePayload(
+                    int(thread["id"]), user, f"still not working, tried again ({i})")))
+        return events
+
+    def updateEdits(self, posts: int = 10, edits: int = 5, duration: float = 30) -> list:
+        """Posts in the updates channel that get edited a few times"""
+        channel = self._channel("updatesChannel")
+        if not channel: return []
+        author = self.emu.addUser("steve")
+        events = []
+        for _ in range(posts):
+            t = self.rnd.uniform(0, duration)
+            message = self.emu.store(self.emu.messagePayload(channel, author, "New version out, see <#1> for details",
+                                                              roles=[self.moderatorRole]))
+            events.append((t, "MESSAGE_CREATE", message))
+            for i in range(edits):
+                edit = dict(message, content=message["content"] + f" (edit {i})", edited_timestamp=message["timestamp"])
+                events.append((t + 0.5 + i, "MESSAGE_UPDATE", edit))
+        return events
+
+    def commands(self, names: list[str], count: int = 100, duration: float = 30) -> list:
+        """Members using text commands"""
+        if not names: return []
+        prefix = self.config.get("commandPrefix") or "!"
+        users = self._users(max(count // 5, 1), "helpseeker")
+        return [(self.rnd.uniform(0, duration), "MESSAGE_CREATE", self.emu.messagePayload(
+            self.rnd.choice(self.general), self.rnd.choice(users), prefix + self.rnd.choice(names))) for _ in range(count)]
+
+    def reactions(self, count: int = 50, duration: float = 30) -> list:
+        """Approval reactions in the services channel"""
+        channel = self._channel("servicesChannel")
+        if not channel: return []
+        users = self._users(5, "approver")
+        return [(self.rnd.uniform(0, duration), "MESSAGE_REACTION_ADD", {
+            "user_id": self.rnd.choice(users)["id"], "channel_id": str(channel), "message_id": str(self.emu.snowflake()),
+            "guild_id": str(self.emu.guildId), "emoji": {"id": None, "name": self.rnd.choice(["✅", "❌", "👍"])},
+            "burst": False, "type": 0}) for _ in range(count)]
+
+    def scenario(self, name: str, scale: float = 1.0, commandNames: list[str] | None = None) -> list:
+        """'chatter', 'raid', 'support', 'updates', 'commands', 'reactions' or 'mixed'"""
+        n = lambda v: max(int(v * scale), 1)
+        parts = {
+            "chatter": lambda: self.chatter(n(500)),
+            "raid": lambda: self.raid(n(50)),
+            "support": lambda: self.supportBurst(n(50)),
+            "updates": lambda: self.updateEdits(n(10)),
+            "commands": lambda: self.commands(commandNames or [], n(100)),
+            "reactions": lambda: self.reactions(n(50)),
+        }
+        names = list(parts) if name == "mixed" else [name]
+        events = []
+        for part in names:
+            events += parts[part]()
+        return sorted(events, key=lambda e: e[0])
+
+class Replayer:
+    """Feeds events into the connection state parsers at N times the recorded speed"""
+    def __init__(self, bot, emulator: DiscordEmulator) -> None:
+        self.bot = bot
+        self.emu = emulator
+
+    def prepare(self, event: str, data: dict) -> dict:
+        """Point recorded payloads at the emulated guild and make sure their channels exist"""
+        data = dict(data)
+        if "guild_id" in data: data["guild_id"] = str(self.emu.guildId)
+        if event == "THREAD_CREATE":
+            self.emu.ensureChannel(int(data["id"]), data.get("name"), CHANNEL_PUBLIC_THREAD,
+                                   int(data.get("parent_id") or 0) or None, int(data.get("owner_id") or 0) or None)
+        elif "channel_id" in data and int(data["channel_id"]) not in self.emu.channels:
+            # unknown channel from a recording, announce it to discord.py before the event that uses it
+            self.bot._connection.parsers["CHANNEL_CREATE"](self.emu.ensureChannel(int(data["channel_id"])))
+        if "author" in data:
+            self.emu.users.setdefault(int(data["author"]["id"]), data["author"])
+            if int(data["id"]) in self.emu.messages:
+                self.emu.messages[int(data["id"])].update(data)
+            elif event == "MESSAGE_CREATE":
+                self.emu.store(data)
+        return data
+
+    async def run(self, events: list, speed: float = 0) -> dict:
+        """Replay, wait until every handler is done and return counts and wall time. speed 0 means no pauses"""
+        parsers = self.bot._connection.parsers
+        counts: dict[str, int] = {}
+        start = time.perf_counter()
+        previous = events[0][0] if events else 0
+        for t, event, data in events:
+            if event == "GUILD_ROLES":
+                for role in data:
+                    if int(role["id"]) in self.emu.roles: continue
+                    self.emu.addRole(role["name"], int(role["id"]))
+                    parsers["GUILD_ROLE_CREATE"]({"guild_id": str(self.emu.guildId), "role": self.emu.roles[int(role["id"])]})
+                continue
+            if speed and t > previous:
+                await asyncio.sleep((t - previous) / speed)
+            previous = max(previous, t)
+            parsers[event](self.prepare(event, data))
+            counts[event] = counts.get(event, 0) + 1
+            # let the handlers run in between, like the gateway does between frames
+            await asyncio.sleep(0)
+        await self.drain()
+        return {"events": counts, "seconds": time.perf_counter() - start}
+
+    async def drain(self) -> None:
+        """Wait for all listener and route tasks, including the ones they spawn"""
+        while True:
+            pending = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()
+                       and t.get_name().startswith(("route:", "discord.py: "))]
+            if not pending: return
+            await asyncio.wait(pending)
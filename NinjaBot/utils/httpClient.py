@@ -0,0 +1,88 @@
+import aiohttp
+import logging
+import time
+from types import SimpleNamespace
+from utils.metrics import httpSeconds, httpErrors
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+class HostStats:
+    """Request counters for one remote host"""
+    __slots__ = ("requests", "errors", "totalTime", "maxTime")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+
+    def add(self, seconds: float, error: bool) -> None:
+        self.requests += 1
+        self.errors += error
+        self.totalTime += seconds
+        self.maxTime = max(self.maxTime, seconds)
+
+    def asDict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "errorRate": self.errors / self.requests if self.requests else 0.0,
+            "avgMs": self.totalTime / self.requests * 1000 if self.requests else 0.0,
+            "maxMs": self.maxTime * 1000
+        }
+
+class HttpClient:
+    """One pooled aiohttp session owned by the bot and shared by all cogs"""
+    def __init__(self, options: dict | None = None) -> None:
+        options = options or {}
+        self.limit = options.get("limit", 100)
+        self.limitPerHost = options.get("limitPerHost", 10)
+        self.dnsCacheTtl = options.get("dnsCacheTtl", 300)
+        self.keepaliveTimeout = options.get("keepaliveTimeout", 30)
+        self.hosts: dict[str, HostStats] = {}
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """The shared session, created on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limitPerHost,
+                ttl_dns_cache=self.dnsCacheTtl,
+                keepalive_timeout=self.keepaliveTimeout
+            )
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[self._traceConfig()])
+            logger.debug(f"Opened shared http session (limit {self.limit}, per host {self.limitPerHost})")
+        return self._session
+
+    def _traceConfig(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig(trace_config_ctx_factory=lambda trace_request_ctx: SimpleNamespace(start=0.0))
+
+        async def onStart(session, ctx, params) -> None:
+            ctx.start = time.perf_counter()
+
+        async def onEnd(session, ctx, params) -> None:
+            self._record(params.url.host, time.perf_counter() - ctx.start, params.response.status >= 400)
+
+        async def onException(session, ctx, params) -> None:
+            self._record(params.url.host, time.perf_counter() - ctx.start, True)
+
+        trace.on_request_start.append(onStart)
+        trace.on_request_end.append(onEnd)
+        trace.on_request_exception.append(onException)
+        return trace
+
+    def _record(self, host: str | None, seconds: float, error: bool) -> None:
+        host = host or "unknown"
+        self.hosts.setdefault(host, HostStats()).add(seconds, error)
+        httpSeconds.observe(seconds, host)
+        if error: httpErrors.inc(host)
+
+    def stats(self) -> dict[str, dict]:
+        """Per host request count, error rate and latency"""
+        return {host: s.asDict() for host, s in sorted(self.hosts.items())}
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
@@ -1,6 +1,7 @@
 import aiofile
 import json
 import logging
+import os
 
 logger = logging.getLogger("NinjaBot." + __name__)
 
@@ -11,10 +12,17 @@ class fileHelper:
 
     async def write(self, data: dict) -> None:
         """dump 'data' to the json file"""
+        await self.writeText(json.dumps(data, indent=4))
+
+    async def writeText(self, text: str) -> None:
+        """replace the file with 'text'. goes through a synced temp file, so a crash leaves the old or the new file, never half of one"""
         logger.debug("writing data to json file")
+        tmpName = f"{self._filename}.tmp"
         try:
-            async with aiofile.async_open(self._filename, mode="w") as f:
-                await f.write(json.dumps(data, indent=4))
+            async with aiofile.async_open(tmpName, mode="w") as f:
+                await f.write(text)
+                await f.flush(sync_metadata=True)
+            os.replace(tmpName, self._filename)
         except Exception as E:
             logger.exception(E)
             raise E
@@ -23,9 +31,12 @@ class fileHelper:
         """try to read from json file and return it"""
         logger.debug("reading from json file")
         try:
-            async with aiofile.async_open(self._filename, mode="r") as f:
-                data = await f.read()
-            return json.loads(data)
+            return json.loads(await self.readText())
         except Exception as E:
             logger.exception(E)
-            raise E
\ No newline at end of file
+            raise E
+
+    async def readText(self) -> str:
+        """the raw file content"""
+        async with aiofile.async_open(self._filename, mode="r") as f:
+            return await f.read()
\ No newline at end of file
@@ -0,0 +1,76 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+from utils.structLog import JsonLinesFormatter
+
+class LogPipeline:
+    """Loggers only put records on a queue, a background thread does the formatting and disk I/O"""
+    def __init__(self, filename: str, level: int, formatter: logging.Formatter) -> None:
+        # rotating log file handler
+        rotateFileHnd = logging.handlers.RotatingFileHandler(
+            filename=filename,
+            encoding="utf-8",
+            maxBytes=32 * 1024 * 1024,  # 32 MiB
+            backupCount=5,  # Rotate through 5 files
+        )
+        rotateFileHnd.setLevel(level)
+        rotateFileHnd.setFormatter(formatter)
+
+        # cmd output
+        streamHnd = logging.StreamHandler()
+        streamHnd.setLevel(level)
+        streamHnd.setFormatter(formatter)
+
+        self.handlers: list[logging.Handler] = [rotateFileHnd, streamHnd]
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.queueHandler = logging.handlers.QueueHandler(self._queue)
+        self._listener: logging.handlers.QueueListener | None = None
+
+    def attach(self, name: str, level: int) -> logging.Logger:
+        """Route a logger (and its children) through the queue"""
+        log = logging.getLogger(name)
+        log.propagate = False
+        log.setLevel(level)
+        log.addHandler(self.queueHandler)
+        return log
+
+    def addHandler(self, handler: logging.Handler) -> None:
+        """Add another output to the background thread, restarts the listener if needed"""
+        running = self._listener is not None
+        if running: self.stop()
+        self.handlers.append(handler)
+        if running: self.start()
+
+    def addJsonLines(self, filename: str, level: int) -> None:
+        """Also write every record as a json object per line, structured records keep their fields"""
+        jsonHnd = logging.handlers.RotatingFileHandler(
+            filename=filename,
+            encoding="utf-8",
+            maxBytes=32 * 1024 * 1024,  # 32 MiB
+            backupCount=5,
+        )
+        jsonHnd.setLevel(level)
+        jsonHnd.setFormatter(JsonLinesFormatter())
+        self.addHandler(jsonHnd)
+
+    def applyLevels(self, levels: dict | None) -> None:
+        """Set log levels per subsystem, e.g. {"discord.http": "INFO", "NinjaBot.cogs.NinjaAntiSpam": "DEBUG"}"""
+        for name, level in (levels or {}).items():
+            try:
+                logging.getLogger(name).setLevel(level.upper() if isinstance(level, str) else level)
+            except (ValueError, TypeError):
+                logging.getLogger("NinjaBot").warning(f"Invalid log level '{level}' for '{name}'")
+
+    def start(self) -> None:
+        if self._listener: return
+        self._listener = logging.handlers.QueueListener(self._queue, *self.handlers, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """Flush everything that is still queued and stop the background thread"""
+        if not self._listener: return
+        self._listener.stop()
+        self._listener = None
+        atexit.unregister(self.stop)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from utils.metrics import registry
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# everything below this directory is our code, frames from there are used for attribution
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COGS = os.path.join(ROOT, "cogs") + os.sep
+THIS = os.path.abspath(__file__)
+
+lagSeconds = registry.histogram("ninjabot_loop_lag_seconds", "Event loop scheduling lag per watchdog tick")
+stallSeconds = registry.histogram("ninjabot_loop_stall_seconds", "Event loop stalls above the threshold by culprit", ("culprit",))
+stallCount = registry.counter("ninjabot_loop_stalls_total", "Event loop stalls above the threshold by culprit", ("culprit",))
+
+class Stall:
+    """One blocked period of the event loop"""
+    __slots__ = ("at", "seconds", "culprit", "task", "stack")
+
+    def __init__(self, at: float, seconds: float, culprit: str, task: str | None, stack: str) -> None:
+        self.at = at
+        self.seconds = seconds
+        self.culprit = culprit
+        self.task = task
+        self.stack = stack
+
+class LoopWatchdog:
+    """Measures event loop lag with a ticking task, a helper thread grabs the loop's stack while it is blocked
+
+    The tick task records its heartbeat and sleeps for 'interval'. If the heartbeat is older than
+    interval + threshold, the helper thread samples the loop thread's frames once and attributes the
+    stall to the innermost frame from cogs/ (or the rest of the bot's code, or the running task name).
+    """
+    def __init__(self, bot, interval: float = 0.1, threshold: float = 0.25, reportInterval: float = 300) -> None:
+        self.bot = bot
+        self.interval = interval
+        self.threshold = threshold
+        self.reportInterval = reportInterval
+        self.recent: deque[Stall] = deque(maxlen=20)
+        self._beat: float | None = None
+        self._sample: tuple | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loopThread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+        self._lastReport = 0.0
+        self._unreported = 0
+
+    def start(self) -> None:
+        """Start watching the running loop, must be called from inside it"""
+        if self._task: return
+        self._loop = asyncio.get_running_loop()
+        self._loopThread = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, name="loopWatchdog", daemon=True)
+        self._thread.start()
+        self._task = self._loop.create_task(self._tick(), name="loopWatchdog")
+        logger.info(f"Event loop watchdog started (threshold {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _tick(self) -> None:
+        while True:
+            before = time.monotonic()
+            self._beat = before
+            await asyncio.sleep(self.interval)
+            lag = max(time.monotonic() - before - self.interval, 0.0)
+            lagSeconds.observe(lag)
+            if lag >= self.threshold:
+                sample = self._sample
+                self._onStall(lag, sample[1:] if sample and sample[0] == before else None)
+
+    def _watch(self) -> None:
+        # runs in its own thread, so it keeps going while the loop is stuck
+        while not self._stopped.wait(self.threshold / 4):
+            beat = self._beat
+            if beat is None or (self._sample and self._sample[0] == beat): continue
+            if time.monotonic() - beat - self.interval < self.threshold: continue
+            frame = sys._current_frames().get(self._loopThread)
+            if frame is None: continue
+            self._sample = (beat, *self._attribute(frame))
+
+    def _attribute(self, frame) -> tuple[str, str | None, str]:
+        culprit = where = None
+        inner = frame
+        while frame is not None:
+            path = frame.f_code.co_filename
+            if path.startswith(ROOT) and path != THIS:
+                # co_qualname is new in 3.11
+                name = getattr(frame.f_code, "co_qualname", frame.f_code.co_name)
+                label = f"{os.path.splitext(os.path.basename(path))[0]}.{name}"
+                if where is None: where = label
+                if culprit is None and path.startswith(COGS): culprit = label
+            frame = frame.f_back
+        # the running task tells which listener or route we are in, e.g. 'route:NinjaAntiSpam.onMessage'
+        task = asyncio.current_task(self._loop)
+        taskName = task.get_name() if task else None
+        stack = "".join(traceback.format_stack(inner, limit=8))
+        return culprit or where or taskName or "unknown", taskName, stack
+
+    def _onStall(self, seconds: float, sample: tuple | None) -> None:
+        culprit, task, stack = sample if sample else ("unknown", None, "")
+        stall = Stall(time.time(), seconds, culprit, task, stack)
+        self.recent.append(stall)
+        stallSeconds.observe(seconds, culprit)
+        stallCount.inc(culprit)
+        logger.warning(f"Event loop blocked for {seconds * 1000:.0f} ms in {culprit} (task {task})")
+        if stack:
+            logger.debug(f"Stack of the blocked loop:\n{stack}")
+
+        # the bot log channel only gets one report per interval, the rest is summed up
+        now = time.monotonic()
+        if now - self._lastReport < self.reportInterval:
+            self._unreported += 1
+            return
+        self._lastReport = now
+        self._loop.create_task(self._report(stall, self._unreported))
+        self._unreported = 0
+
+    async def _report(self, stall: Stall, skipped: int) -> None:
+        try:
+            botlogCh = self.bot.get_channel(int(self.bot.config.get("botlogChannel")))
+            if not botlogCh: return
+            text = f"Event loop was blocked for {stall.seconds * 1000:.0f} ms in `{stall.culprit}`"
+            if stall.task: text += f" (task `{stall.task}`)"
+            if skipped: text += f"\n{skipped} more stall(s) since the last report"
+            if stall.stack:
+                text += f"\n```\n{stall.stack[-1500:]}\n```"
+            await botlogCh.send(text)
+        except Exception as E:
+            logger.exception(E)
+
+    def summary(self) -> dict:
+        """Lag percentiles and the worst culprits, for !stats"""
+        culprits = sorted(stallSeconds.rows(), key=lambda r: r["sum"], reverse=True)
+        return {
+            "p50": lagSeconds.quantile(0.5),
+            "p99": lagSeconds.quantile(0.99),
+            "stalls": sum(r["count"] for r in culprits),
+            "culprits": [(r["labels"][0], r["count"], r["max"]) for r in culprits[:5]]
+        }
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+import discord
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable
+from utils.metrics import routeSeconds, handlerErrors, feature
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# who wrote the message
+AUTHOR_SELF = "self"
+AUTHOR_BOT = "bot"
+AUTHOR_HUMAN = "human"
+
+# where the message was posted
+CHANNEL_DM = "dm"
+CHANNEL_GUILD = "guild"
+CHANNEL_THREAD = "thread"
+
+# what kind of message it is
+KIND_DEFAULT = "default"
+KIND_REPLY = "reply"
+KIND_SYSTEM = "system"
+
+@dataclass(frozen=True, slots=True)
+class MessageContext:
+    """A message classified once by the router and handed to every interested handler"""
+    message: discord.Message
+    author: str
+    channelType: str
+    kind: str
+    channelId: int
+    parentId: int | None
+    guildId: int | None
+    isWebhook: bool
+    isCommand: bool
+
+class _Route:
+    __slots__ = ("name", "callback", "authors", "kinds", "excludeChannels", "commandsOnly")
+
+    def __init__(self, name, callback, authors, kinds, excludeChannels, commandsOnly) -> None:
+        self.name = name
+        self.callback = callback
+        self.authors = authors
+        self.kinds = kinds
+        self.excludeChannels = excludeChannels
+        self.commandsOnly = commandsOnly
+
+    def accepts(self, mctx: MessageContext) -> bool:
+        if self.authors is not None and mctx.author not in self.authors: return False
+        if self.kinds is not None and mctx.kind not in self.kinds: return False
+        if self.commandsOnly and not mctx.isCommand: return False
+        return mctx.channelId not in self.excludeChannels
+
+def parseIds(ids) -> frozenset[int]:
+    """Turn a config value (single id or list of ids, str or int) into a set of ints, skipping junk"""
+    if ids is None: return frozenset()
+    if isinstance(ids, (str, int)): ids = [ids]
+    parsed = set()
+    for i in ids:
+        try:
+            parsed.add(int(i))
+        except (TypeError, ValueError):
+            logger.warning(f"ignoring invalid id '{i}'")
+    return frozenset(parsed)
+
+class MessageRouter:
+    """Classifies each gateway message once and hands it only to the handlers that asked for it"""
+    def __init__(self, bot) -> None:
+        self.bot = bot
+        self._routes: dict[str, tuple[_Route, frozenset[int], frozenset[str] | None]] = {}
+        self._byChannel: dict[int, list[_Route]] = {}
+        self._byType: dict[str, list[_Route]] = {}
+        self._anywhere: list[_Route] = []
+        self._tasks: set[asyncio.Task] = set()
+
+    def register(self, name: str, callback: Callable[[MessageContext], Awaitable[None]], *,
+                 channels: Iterable | None = None,
+                 channelTypes: Iterable[str] | None = None,
+                 authors: Iterable[str] | None = (AUTHOR_HUMAN,),
+                 kinds: Iterable[str] | None = (KIND_DEFAULT, KIND_REPLY),
+                 excludeChannels: Iterable | None = None,
+                 commandsOnly: bool = False) -> None:
+        """Register a handler. Without channels and channelTypes it receives messages from everywhere"""
+        self.unregister(name)
+        route = _Route(
+            name, callback,
+            frozenset(authors) if authors is not None else None,
+            frozenset(kinds) if kinds is not None else None,
+            parseIds(excludeChannels),
+            commandsOnly
+        )
+        channelIds = parseIds(channels) if channels is not None else frozenset()
+        types = frozenset(channelTypes) if channelTypes is not None else None
+
+        if channels is None and types is None:
+            self._anywhere.append(route)
+        elif not channelIds and not types:
+            # asked for specific channels but none are configured, nothing will ever match
+            logger.info(f"route '{name}' has no valid channels configured, not registering")
+            return
+        for cid in channelIds:
+            self._byChannel.setdefault(cid, []).append(route)
+        for t in types or ():
+            self._byType.setdefault(t, []).append(route)
+        self._routes[name] = (route, channelIds, types)
+        logger.debug(f"registered message route '{name}'")
+
+    def unregister(self, name: str) -> None:
+        """Remove a handler from all indexes"""
+        if name not in self._routes: return
+        route, channelIds, types = self._routes.pop(name)
+        if route in self._anywhere:
+            self._anywhere.remove(route)
+        for cid in channelIds:
+            self._byChannel[cid].remove(route)
+            if not self._byChannel[cid]: del self._byChannel[cid]
+        for t in types or ():
+            self._byType[t].remove(route)
+            if not self._byType[t]: del self._byType[t]
+        logger.debug(f"unregistered message route '{name}'")
+
+    def classify(self, message: discord.Message) -> MessageContext:
+        """Build the immutable context for a message"""
+        if message.author.id == getattr(self.bot.user, "id", None):
+            author = AUTHOR_SELF
+        elif message.author.bot:
+            author = AUTHOR_BOT
+        else:
+            author = AUTHOR_HUMAN
+
+        channel = message.channel
+        if message.guild is None:
+            channelType = CHANNEL_DM
+        elif isinstance(channel, discord.Thread):
+            channelType = CHANNEL_THREAD
+        else:
+            channelType = CHANNEL_GUILD
+
+        if message.type == discord.MessageType.default:
+            kind = KIND_DEFAULT
+        elif message.type == discord.MessageType.reply:
+            kind = KIND_REPLY
+        else:
+            kind = KIND_SYSTEM
+
+        prefix = self.bot.config.get("commandPrefix")
+        return MessageContext(
+            message=message,
+            author=author,
+            channelType=channelType,
+            kind=kind,
+            channelId=channel.id,
+            parentId=getattr(channel, "parent_id", None),
+            guildId=message.guild.id if message.guild else None,
+            isWebhook=message.webhook_id is not None,
+            isCommand=bool(prefix) and message.content.startswith(prefix)
+        )
+
+    def routesFor(self, mctx: MessageContext) -> list[_Route]:
+        """All routes interested in this message, each at most once"""
+        candidates = self._byChannel.get(mctx.channelId, []) + self._byType.get(mctx.channelType, []) + self._anywhere
+        routes = []
+        for route in candidates:
+            if route not in routes and route.accepts(mctx):
+                routes.append(route)
+        return routes
+
+    def dispatch(self, message: discord.Message) -> MessageContext:
+        """Classify a message and schedule every interested handler"""
+        mctx = self.classify(message)
+        for route in self.routesFor(mctx):
+            # every handler gets its own task, same as discord.py listeners, so a slow one can't hold up the rest
+            task = asyncio.create_task(self._run(route, mctx), name=f"route:{route.name}")
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return mctx
+
+    async def _run(self, route: _Route, mctx: MessageContext) -> None:
+        start = time.perf_counter()
+        try:
+            with feature(route.name):
+                await route.callback(mctx)
+        except Exception as E:
+            handlerErrors.inc(route.name)
+            logger.error(f"Error in message route '{route.name}'")
+            logger.exception(E)
+        finally:
+            routeSeconds.observe(time.perf_counter() - start, route.name)
@@ -0,0 +1,339 @@
+import contextlib
+import contextvars
+import functools
+import logging
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+import aiohttp
+from aiohttp import web
+from discord.ext import tasks
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# upper bounds in seconds, the last (+Inf) bucket is implicit
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _labelValue(value) -> str:
+    # text format escapes: backslash, double quote and line feed
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labelText(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_labelValue(v)}"' for n, v in zip(names, values)]
+    if extra: pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _num(value: float) -> str:
+    if math.isnan(value): return "NaN"
+    if math.isinf(value): return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _HistData:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self, size: int) -> None:
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+class Histogram:
+    """Latency distribution per label set, fixed buckets so observing is O(log buckets) and memory is constant"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelNames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(sorted(buckets))
+        self._data: dict[tuple, _HistData] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        data = self._data.get(labels)
+        if data is None:
+            data = self._data[labels] = _HistData(len(self.buckets) + 1)
+        data.counts[bisect_left(self.buckets, value)] += 1
+        data.sum += value
+        data.count += 1
+        if value > data.max: data.max = value
+
+    def time(self, *labels) -> "_Timer":
+        """with histogram.time("label"): ..."""
+        return _Timer(self, labels)
+
+    def quantile(self, q: float, *labels) -> float:
+        """Estimate a quantile by interpolating inside the bucket it falls into"""
+        data = self._data.get(labels)
+        if not data or not data.count: return 0.0
+        rank = q * data.count
+        seen = 0
+        for i, c in enumerate(data.counts):
+            if seen + c >= rank and c:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else data.max
+                return min(lower + (upper - lower) * (rank - seen) / c, data.max)
+            seen += c
+        return data.max
+
+    def rows(self) -> list[dict]:
+        """Summary per label set for human readable output"""
+        return [{
+            "labels": labels,
+            "count": d.count,
+            "sum": d.sum,
+            "avg": d.sum / d.count if d.count else 0.0,
+            "p50": self.quantile(0.5, *labels),
+            "p99": self.quantile(0.99, *labels),
+            "max": d.max
+        } for labels, d in self._data.items()]
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, d in sorted(self._data.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (math.inf,), d.counts):
+                cumulative += c
+                le = 'le="' + _num(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labelText(self.labelNames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labelText(self.labelNames, labels)} {_num(d.sum)}")
+            lines.append(f"{self.name}_count{_labelText(self.labelNames, labels)} {d.count}")
+        return lines
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: tuple) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+class Counter:
+    """Monotonic count per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelNames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def items(self) -> list[tuple[tuple, float]]:
+        return list(self._values.items())
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_labelText(self.labelNames, labels)} {_num(v)}" for labels, v in sorted(self._values.items())]
+
+class Gauge:
+    """Current value, either set directly or read from a callback when collected"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelNames: Iterable[str] = (), fn: Callable[[], float] | None = None) -> None:
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        self.fn = fn
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, *labels) -> None:
+        self._values[labels] = value
+
+    def get(self, *labels) -> float:
+        if self.fn and not labels:
+            try:
+                return float(self.fn())
+            except Exception:
+                return math.nan
+        return self._values.get(labels, math.nan)
+
+    def render(self) -> list[str]:
+        if self.fn:
+            return [f"{self.name} {_num(self.get())}"]
+        return [f"{self.name}{_labelText(self.labelNames, labels)} {_num(v)}" for labels, v in sorted(self._values.items())]
+
+class Registry:
+    """All metrics of the process. Metrics are created on first use and survive extension reloads"""
+    def __init__(self) -> None:
+        self._metrics: dict[str, Histogram | Counter | Gauge] = {}
+
+    def _getOrCreate(self, cls, name: str, *args, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"metric '{name}' already exists as a {metric.kind}")
+        return metric
+
+    def histogram(self, name: str, help: str, labelNames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._getOrCreate(Histogram, name, help, labelNames, buckets)
+
+    def counter(self, name: str, help: str, labelNames: Iterable[str] = ()) -> Counter:
+        return self._getOrCreate(Counter, name, help, labelNames)
+
+    def gauge(self, name: str, help: str, labelNames: Iterable[str] = (), fn: Callable[[], float] | None = None) -> Gauge:
+        gauge = self._getOrCreate(Gauge, name, help, labelNames)
+        if fn is not None: gauge.fn = fn
+        return gauge
+
+    def get(self, name: str) -> Histogram | Counter | Gauge | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# the process wide registry
+registry = Registry()
+
+listenerSeconds = registry.histogram("ninjabot_listener_seconds", "Time spent in discord event listeners", ("listener",))
+routeSeconds = registry.histogram("ninjabot_route_seconds", "Time spent in message router handlers", ("route",))
+taskSeconds = registry.histogram("ninjabot_task_seconds", "Time spent per run of a background task", ("task",))
+handlerErrors = registry.counter("ninjabot_handler_errors_total", "Unhandled exceptions in listeners, routes and tasks", ("handler",))
+httpSeconds = registry.histogram("ninjabot_http_seconds", "Outbound http requests through the shared session", ("host",))
+httpErrors = registry.counter("ninjabot_http_errors_total", "Failed outbound http requests (status >= 400 or exception)", ("host",))
+restSeconds = registry.histogram("ninjabot_discord_rest_seconds", "Discord REST calls by route", ("method", "route"))
+restErrors = registry.counter("ninjabot_discord_rest_errors_total", "Discord REST calls that raised", ("method", "route"))
+restCalls = registry.counter("ninjabot_discord_rest_calls_total", "Discord REST calls by originating feature and route", ("feature", "method", "route"))
+restRateLimited = registry.counter("ninjabot_discord_rest_ratelimited_total", "429 answers from discord by feature and route", ("feature", "method", "route"))
+restWaitSeconds = registry.counter("ninjabot_discord_rest_wait_seconds_total", "Time discord REST calls spent waiting on rate limits and retries", ("feature", "method", "route"))
+
+# the cog and feature discord REST calls are booked on, set by whatever runs a handler
+currentFeature: contextvars.ContextVar[str] = contextvars.ContextVar("ninjabot_feature", default="other")
+# network time and 429s of the REST call in flight, filled by the aiohttp trace
+_restAttempts: contextvars.ContextVar[list | None] = contextvars.ContextVar("ninjabot_rest_attempts", default=None)
+
+@contextlib.contextmanager
+def feature(name: str):
+    """Books the discord REST calls made inside (and in tasks started inside) on 'name'"""
+    token = currentFeature.set(name)
+    try:
+        yield
+    finally:
+        currentFeature.reset(token)
+
+def instrumentLoops(cog) -> None:
+    """Time every run of the tasks.loop jobs of a cog"""
+    for attr in dir(type(cog)):
+        if not isinstance(getattr(type(cog), attr, None), tasks.Loop): continue
+        loop = getattr(cog, attr)
+        if getattr(loop.coro, "__wrapped__", None): continue
+        loop.coro = _timedJob(loop.coro, f"{type(cog).__name__}.{attr}")
+
+def _timedJob(coro, name: str):
+    @functools.wraps(coro)
+    async def timedJob(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with feature(name):
+                return await coro(*args, **kwargs)
+        except Exception:
+            handlerErrors.inc(name)
+            raise
+        finally:
+            taskSeconds.observe(time.perf_counter() - start, name)
+    return timedJob
+
+def instrumentDiscordHttp(http) -> None:
+    """Time every discord REST request, labelled by the route template instead of the concrete url,
+    and book it with its 429s and rate limit waits on the current feature"""
+    request = http.request
+    if getattr(request, "__wrapped__", None): return
+
+    @functools.wraps(request)
+    async def timedRequest(route, **kwargs):
+        attempts = [0.0, 0, 0]  # seconds on the wire, requests sent, 429 answers
+        token = _restAttempts.set(attempts)
+        start = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        except Exception:
+            restErrors.inc(route.method, route.path)
+            raise
+        finally:
+            _restAttempts.reset(token)
+            elapsed = time.perf_counter() - start
+            restSeconds.observe(elapsed, route.method, route.path)
+            labels = (currentFeature.get(), route.method, route.path)
+            restCalls.inc(*labels)
+            if attempts[2]:
+                restRateLimited.inc(*labels, amount=attempts[2])
+            # whatever was not spent on the wire was spent in discord.py's rate limit and retry sleeps
+            if attempts[1] and elapsed - attempts[0] > 0.001:
+                restWaitSeconds.inc(*labels, amount=elapsed - attempts[0])
+    http.request = timedRequest
+
+def restTrace() -> aiohttp.TraceConfig:
+    """aiohttp trace for discord's http session, measures the time on the wire of the REST call in flight"""
+    async def onStart(session, ctx, params) -> None:
+        ctx.start = time.perf_counter()
+
+    async def onEnd(session, ctx, params) -> None:
+        attempts = _restAttempts.get()
+        if attempts is None: return
+        attempts[0] += time.perf_counter() - ctx.start
+        attempts[1] += 1
+        if getattr(params, "response", None) is not None and params.response.status == 429:
+            attempts[2] += 1
+
+    trace = aiohttp.TraceConfig()
+    trace.on_request_start.append(onStart)
+    trace.on_request_end.append(onEnd)
+    trace.on_request_exception.append(onEnd)
+    return trace
+
+def restBudget(limit: int = 15) -> list[dict]:
+    """Features and routes with the most discord REST calls, with their 429s and rate limit waits"""
+    rateLimited = dict(restRateLimited.items())
+    waited = dict(restWaitSeconds.items())
+    rows = [{"feature": labels[0], "route": f"{labels[1]} {labels[2]}", "calls": int(calls),
+             "rateLimited": int(rateLimited.get(labels, 0)), "waitSeconds": waited.get(labels, 0.0)}
+            for labels, calls in restCalls.items()]
+    return sorted(rows, key=lambda r: (r["calls"], r["waitSeconds"]), reverse=True)[:limit]
+
+def topHandlers(limit: int = 10) -> list[tuple[str, dict]]:
+    """Listeners, routes and tasks that used the most time in total"""
+    rows = []
+    for prefix, histogram in (("listener", listenerSeconds), ("route", routeSeconds), ("task", taskSeconds)):
+        for row in histogram.rows():
+            rows.append((f"{prefix}:{row['labels'][0]}", row))
+    return sorted(rows, key=lambda r: r[1]["sum"], reverse=True)[:limit]
+
+class MetricsServer:
+    """Serves the registry on /metrics for prometheus to scrape"""
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108) -> None:
+        self.host = host
+        self.port = port
+        self._runner: web.AppRunner | None = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,99 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# the 64 bit fingerprint is cut into this many bands. two fingerprints that differ in at most
+# BANDS - 1 bits have at least one band in common, so looking up every band finds all of them
+BANDS = 6
+
+def _bandMasks(bands: int) -> list[tuple[int, int]]:
+    """(shift, mask) of each band, the first bands get the left over bits"""
+    masks, shift = [], 0
+    for i in range(bands):
+        width = 64 // bands + (1 if i < 64 % bands else 0)
+        masks.append((shift, (1 << width) - 1))
+        shift += width
+    return masks
+
+class _Cluster:
+    """Near duplicate messages of one guild, keyed by the fingerprint of the first one"""
+    __slots__ = ("guildId", "fingerprint", "keys", "members", "reported")
+
+    def __init__(self, guildId: int, fingerprint: int, keys: list) -> None:
+        self.guildId = guildId
+        self.fingerprint = fingerprint
+        self.keys = keys
+        # user id -> number of their messages in the window
+        self.members: dict[int, int] = {}
+        # user ids already returned as raiders, empty until the cluster is a raid
+        self.reported: set[int] = set()
+
+class RaidIndex:
+    """Guild wide index of recent message fingerprints to catch many accounts posting the same text
+
+    Every message is looked up by the bands of its fingerprint (a few dict hits) and joins the first
+    cluster within maxDistance bits, so the cost per message doesn't depend on how many users are active.
+    Entries leave the index in the order they came in once they are older than 'window' seconds.
+    """
+    def __init__(self, accounts: int = 4, window: float = 60.0, maxDistance: int = BANDS - 1) -> None:
+        self.accounts = accounts
+        self.window = window
+        # more than BANDS - 1 bits can't be guaranteed to share a band
+        self.maxDistance = min(maxDistance, BANDS - 1)
+        self._masks = _bandMasks(BANDS)
+        # (guild id, band number, band value) -> clusters with that band
+        self._bands: dict[tuple[int, int, int], list[_Cluster]] = {}
+        # (time, cluster, user id) in the order they were added
+        self._timeline: deque[tuple[float, _Cluster, int]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._timeline)
+
+    def add(self, guildId: int, uid: int, fingerprint: int, now: float | None = None) -> list[int]:
+        """Record a message, returns the user ids of the raid that were not returned before"""
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+        keys = [(guildId, band, fingerprint >> shift & mask) for band, (shift, mask) in enumerate(self._masks)]
+        cluster = self._find(keys, fingerprint)
+        if cluster is None:
+            cluster = _Cluster(guildId, fingerprint, keys)
+            for key in keys:
+                self._bands.setdefault(key, []).append(cluster)
+        cluster.members[uid] = cluster.members.get(uid, 0) + 1
+        self._timeline.append((now, cluster, uid))
+        if cluster.reported:
+            # the raid was reported already, latecomers are returned one by one
+            if uid in cluster.reported: return []
+            cluster.reported.add(uid)
+            return [uid]
+        if len(cluster.members) >= self.accounts:
+            logger.warning(f"{len(cluster.members)} accounts posted the same text within {self.window} s in guild {guildId}")
+            cluster.reported.update(cluster.members)
+            return list(cluster.members)
+        return []
+
+    def _find(self, keys: list, fingerprint: int) -> _Cluster | None:
+        for key in keys:
+            for cluster in self._bands.get(key, ()):
+                if (cluster.fingerprint ^ fingerprint).bit_count() <= self.maxDistance:
+                    return cluster
+        return None
+
+    def expire(self, now: float | None = None) -> None:
+        """Drop everything older than the window, each entry is touched once"""
+        now = time.monotonic() if now is None else now
+        timeline = self._timeline
+        while timeline and now - timeline[0][0] > self.window:
+            _, cluster, uid = timeline.popleft()
+            count = cluster.members[uid] - 1
+            if count:
+                cluster.members[uid] = count
+                continue
+            del cluster.members[uid]
+            if cluster.members: continue
+            for key in cluster.keys:
+                clusters = self._bands[key]
+                clusters.remove(cluster)
+                if not clusters: del self._bands[key]
@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import Counter, deque
+from aiohttp import web, WSMsgType
+from utils.discordEmulator import DiscordEmulator, CHANNEL_PUBLIC_THREAD
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# gateway opcodes
+OP_DISPATCH = 0
+OP_HEARTBEAT = 1
+OP_IDENTIFY = 2
+OP_RESUME = 6
+OP_REQUEST_MEMBERS = 8
+OP_HELLO = 10
+OP_HEARTBEAT_ACK = 11
+
+# requests per second over all routes, like discord's global limit
+GLOBAL_LIMIT = 50
+
+# (limit, per seconds) of the routes the bot uses, close to what discord reports in its headers.
+# every bucket exists once per major parameter (channel, guild or webhook id)
+BUCKET_LIMITS = {
+    ("POST", "/channels/{channel_id}/messages"): (5, 5.0),
+    ("DELETE", "/channels/{channel_id}/messages/{message_id}"): (5, 1.0),
+    ("POST", "/channels/{channel_id}/messages/bulk-delete"): (1, 1.0),
+    ("GET", "/channels/{channel_id}/messages"): (5, 5.0),
+    ("GET", "/channels/{channel_id}/messages/{message_id}"): (5, 1.0),
+    ("PATCH", "/channels/{channel_id}/messages/{message_id}"): (5, 5.0),
+    ("POST", "/channels/{channel_id}/messages/{message_id}/threads"): (5, 5.0),
+    ("POST", "/channels/{channel_id}/threads"): (5, 5.0),
+    ("PUT", "/channels/{channel_id}/thread-members/{user_id}"): (10, 10.0),
+    ("PATCH", "/channels/{channel_id}"): (2, 600.0),
+    ("DELETE", "/guilds/{guild_id}/members/{user_id}"): (5, 1.0),
+    ("GET", "/users/{user_id}"): (30, 1.0),
+    ("PUT", "/applications/{application_id}/guilds/{guild_id}/commands"): (2, 60.0),
+}
+DEFAULT_LIMIT = (50, 1.0)
+
+def _json(data, status: int = 200, headers: dict | None = None) -> web.Response:
+    # discord.py only parses bodies whose content type is exactly application/json, without charset
+    return web.Response(body=json.dumps(data).encode(), status=status,
+                        headers={**(headers or {}), "Content-Type": "application/json"})
+
+class _Bucket:
+    __slots__ = ("limit", "per", "remaining", "resetAt", "hash")
+
+    def __init__(self, limit: int, per: float, bucketHash: str) -> None:
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.resetAt = 0.0
+        self.hash = bucketHash
+
+    def take(self, now: float) -> float:
+        """Use one request, returns 0 or the seconds to wait if the bucket is exhausted"""
+        if now >= self.resetAt:
+            self.remaining = self.limit
+            self.resetAt = now + self.per
+        if self.remaining == 0:
+            return self.resetAt - now
+        self.remaining -= 1
+        return 0.0
+
+class RateLimiter:
+    """Per route and major parameter buckets plus the global limit, answering like discord does"""
+    def __init__(self, limits: dict | None = None, globalLimit: int = GLOBAL_LIMIT) -> None:
+        self.limits = limits if limits is not None else BUCKET_LIMITS
+        self.globalLimit = globalLimit
+        self._buckets: dict[tuple, _Bucket] = {}
+        self._recent: deque[float] = deque()
+        # (method, template) -> number of 429 answers
+        self.limited: Counter = Counter()
+
+    def check(self, method: str, template: str, pathParams: dict) -> tuple[float, bool, _Bucket]:
+        """(retry after, is global, bucket) for one request. retry after is 0 if the request may pass"""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= 1.0:
+            self._recent.popleft()
+        major = pathParams.get("channel_id") or pathParams.get("guild_id") or pathParams.get("webhook_id") or ""
+        key = (method, template, major)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            limit, per = self.limits.get((method, template), DEFAULT_LIMIT)
+            bucket = self._buckets[key] = _Bucket(limit, per, hashlib.md5(f"{method}{template}".encode()).hexdigest()[:16])
+        if len(self._recent) >= self.globalLimit:
+            self.limited[(method, template)] += 1
+            return 1.0 - (now - self._recent[0]), True, bucket
+        retryAfter = bucket.take(now)
+        if retryAfter:
+            self.limited[(method, template)] += 1
+        else:
+            self._recent.append(now)
+        return retryAfter, False, bucket
+
+class GatewaySession:
+    """One connected bot on the emulated gateway"""
+    def __init__(self, ws: web.WebSocketResponse) -> None:
+        self.ws = ws
+        self.sequence = 0
+        self.ready = False
+
+    async def send(self, op: int, data, event: str | None = None) -> None:
+        payload = {"op": op, "d": data, "s": None, "t": event}
+        if op == OP_DISPATCH:
+            self.sequence += 1
+            payload["s"] = self.sequence
+        await self.ws.send_str(json.dumps(payload))
+
+class StandInServer:
+    """Local aiohttp server speaking enough of discord's REST API and gateway to run the bot against it
+
+    - REST under /api/v10/..., answered by a DiscordEmulator, with rate limit buckets and 429s
+    - gateway websocket under /gateway (hello, identify, ready, guild create, heartbeats)
+    - POST /_standin/events to push gateway events to the connected bot, GET /_standin/stats for call counts
+    """
+    def __init__(self, emulator: DiscordEmulator, host: str = "127.0.0.1", port: int = 8765,
+                 limiter: RateLimiter | None = None) -> None:
+        self.emulator = emulator
+        self.host = host
+        self.port = port
+        self.limiter = limiter or RateLimiter()
+        self.sessions: set[GatewaySession] = set()
+        self.connected = asyncio.Event()
+        self._runner: web.AppRunner | None = None
+        emulator.onEvent = self.broadcast
+
+    @property
+    def baseUrl(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_get("/gateway", self._gateway)
+        app.router.add_get("/gateway/", self._gateway)
+        app.router.add_post("/_standin/events", self._events)
+        app.router.add_get("/_standin/stats", self._stats)
+        app.router.add_route("*", "/api/v{version}/{path:.*}", self._rest)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Discord stand-in listening on {self.baseUrl}")
+
+    async def stop(self) -> None:
+        for session in list(self.sessions):
+            await session.ws.close()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    # REST
+
+    async def _rest(self, request: web.Request) -> web.Response:
+        method = request.method
+        path = "/" + request.match_info["path"]
+        if path == "/gateway/bot" or path == "/gateway":
+            return _json({"url": f"ws://{self.host}:{self.port}/gateway", "shards": 1,
+                                      "session_start_limit": {"total": 1000, "remaining": 1000,
+                                                              "reset_after": 0, "max_concurrency": 1}})
+        if path == "/oauth2/applications/@me" or path == "/applications/@me":
+            return _json({"id": str(self.emulator.applicationId), "name": "NinjaBot", "icon": None,
+                                      "description": "", "bot_public": True, "bot_require_code_grant": False,
+                                      "verify_key": "", "flags": 0, "owner": self.emulator.botUser})
+
+        template, pathParams, _ = self.emulator.match(method, path)
+        retryAfter, isGlobal, bucket = self.limiter.check(method, template or path, pathParams)
+        headers = {
+            "X-RateLimit-Limit": str(bucket.limit),
+            "X-RateLimit-Remaining": str(bucket.remaining),
+            "X-RateLimit-Reset": f"{time.time() + max(bucket.resetAt - time.monotonic(), 0):.3f}",
+            "X-RateLimit-Reset-After": f"{max(bucket.resetAt - time.monotonic(), 0):.3f}",
+            "X-RateLimit-Bucket": bucket.hash,
+        }
+        if retryAfter:
+            headers["Retry-After"] = f"{retryAfter:.3f}"
+            headers["X-RateLimit-Scope"] = "global" if isGlobal else "user"
+            if isGlobal: headers["X-RateLimit-Global"] = "true"
+            # discord.py takes 429s without a Via header for a cloudflare ban and gives up
+            headers["Via"] = "1.1 google"
+            return _json({"message": "You are being rate limited.", "retry_after": round(retryAfter, 3),
+                                      "global": isGlobal}, 429, headers)
+
+        body = None
+        if request.can_read_body:
+            if request.content_type.startswith("multipart/"):
+                async for part in (await request.multipart()):
+                    if part.name == "payload_json":
+                        body = json.loads(await part.text())
+            else:
+                raw = await request.read()
+                body = json.loads(raw) if raw else None
+        status, data = self.emulator.handle(method, path, body, dict(request.query))
+        if status == 204:
+            return web.Response(status=204, headers=headers)
+        return _json(data, status, headers)
+
+    # gateway
+
+    async def _gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        session = GatewaySession(ws)
+        self.sessions.add(session)
+        await session.send(OP_HELLO, {"heartbeat_interval": 41250})
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT: continue
+                payload = json.loads(msg.data)
+                await self._onGatewayMessage(session, payload["op"], payload.get("d"))
+        finally:
+            self.sessions.discard(session)
+        return ws
+
+    async def _onGatewayMessage(self, session: GatewaySession, op: int, data) -> None:
+        if op == OP_HEARTBEAT:
+            await session.send(OP_HEARTBEAT_ACK, None)
+        elif op == OP_IDENTIFY:
+            await session.send(OP_DISPATCH, {
+                "v": 10, "user": self.emulator.botUser, "session_id": "standin", "resume_gateway_url": f"ws://{self.host}:{self.port}/gateway",
+                "guilds": [{"id": str(self.emulator.guildId), "unavailable": True}],
+                "application": {"id": str(self.emulator.applicationId), "flags": 0},
+                # sharded clients identify with [shard id, shard count] and expect it back
+                "shard": (data or {}).get("shard", [0, 1])
+            }, "READY")
+            await session.send(OP_DISPATCH, self.emulator.guildPayload(), "GUILD_CREATE")
+            session.ready = True
+            self.connected.set()
+        elif op == OP_RESUME:
+            await session.send(OP_DISPATCH, {}, "RESUMED")
+            session.ready = True
+        elif op == OP_REQUEST_MEMBERS:
+            await session.send(OP_DISPATCH, {"guild_id": str(self.emulator.guildId), "members": [],
+                                             "chunk_index": 0, "chunk_count": 1, "nonce": data.get("nonce")},
+                               "GUILD_MEMBERS_CHUNK")
+
+    def broadcast(self, event: str, data: dict) -> None:
+        """Send a dispatch event to every connected bot"""
+        for session in list(self.sessions):
+            if session.ready:
+                asyncio.get_running_loop().create_task(session.send(OP_DISPATCH, data, event))
+
+    async def inject(self, event: str, data: dict) -> None:
+        """Push an event as if a user caused it, channels it refers to are created first"""
+        data = dict(data)
+        if "guild_id" in data: data["guild_id"] = str(self.emulator.guildId)
+        if event == "THREAD_CREATE":
+            self.emulator.ensureChannel(int(data["id"]), data.get("name"), CHANNEL_PUBLIC_THREAD,
+                                        int(data.get("parent_id") or 0) or None, int(data.get("owner_id") or 0) or None)
+        elif "channel_id" in data and int(data["channel_id"]) not in self.emulator.channels:
+            self.broadcast("CHANNEL_CREATE", self.emulator.ensureChannel(int(data["channel_id"])))
+        if event == "MESSAGE_CREATE" and int(data["id"]) not in self.emulator.messages:
+            self.emulator.store(data)
+        for session in list(self.sessions):
+            if session.ready:
+                await session.send(OP_DISPATCH, data, event)
+
+    async def _events(self, request: web.Request) -> web.Response:
+        events = await request.json()
+        for entry in events:
+            await self.inject(entry["e"], entry["d"])
+        return _json({"injected": len(events)})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return _json(self.stats())
+
+    def stats(self) -> dict:
+        """REST calls and 429 answers per route"""
+        return {
+            "calls": {f"{m} {p}": n for (m, p), n in self.emulator.calls.most_common()},
+            "rateLimited": {f"{m} {p}": n for (m, p), n in self.limiter.limited.most_common()}
+        }
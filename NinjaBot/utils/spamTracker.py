@@ -0,0 +1,136 @@
+import logging
+from collections import OrderedDict, deque
+from typing import NamedTuple
+from utils.metrics import registry
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+# per user limits, enough for every anti spam rule:
+# a user is kicked at 3 channels, the image rate limit looks at 6 images per channel
+MAX_MESSAGES = 25  # tracked messages for the cleanup
+MAX_REPORT_LINE = 200  # characters of a tracked message kept for the botlog report
+MAX_CHANNELS = 3  # distinct channels with text / with images
+MAX_IMAGES = 12  # (channel id, time) of the latest images
+MAX_TEXT = 2000  # characters of the last message kept for the similarity check
+# rough size of a record with all buffers full (measured with tracemalloc on CPython 3.11),
+# a user with a few short messages needs about a quarter of it
+RECORD_BYTES = 15500
+
+class TrackedMessage(NamedTuple):
+    """A message to delete on cleanup, with its botlog report line captured when it came in"""
+    id: int
+    channelId: int
+    line: str
+
+evictedUsers = registry.counter("ninjabot_antispam_evicted_total", "Tracked users dropped because the tracker was full")
+expiredUsers = registry.counter("ninjabot_antispam_expired_total", "Tracked users dropped after being quiet for the idle time")
+
+class UserRecord:
+    """What the anti spam remembers about one user, every buffer has a fixed maximum size"""
+    __slots__ = ("member", "lastText", "lastSeen", "abuse", "msgs", "channels", "imageChannels", "imageTimes")
+
+    def __init__(self, member, now: float) -> None:
+        # to clean up after them when someone else completes a raid
+        self.member = member
+        self.lastText = ""  # only text content, not filenames
+        self.lastSeen = now
+        self.abuse = 0.0
+        # oldest entries fall out, a spammer is kicked long before that matters
+        self.msgs: deque[TrackedMessage] = deque(maxlen=MAX_MESSAGES)
+        self.channels: list[int] = []
+        self.imageChannels: list[int] = []
+        self.imageTimes: deque[tuple[int, float]] = deque(maxlen=MAX_IMAGES)
+
+    def addMessage(self, messageId: int, channelId: int, line: str) -> None:
+        self.msgs.append(TrackedMessage(messageId, channelId, line[:MAX_REPORT_LINE]))
+
+    def setText(self, text: str) -> None:
+        self.lastText = text[:MAX_TEXT]
+
+    @staticmethod
+    def _addChannel(channels: list[int], channelId: int) -> None:
+        # only the count up to the limit matters, further channels are not stored
+        if channelId not in channels and len(channels) < MAX_CHANNELS:
+            channels.append(channelId)
+
+    def addChannel(self, channelId: int) -> None:
+        self._addChannel(self.channels, channelId)
+
+    def addImage(self, channelId: int, now: float) -> None:
+        self._addChannel(self.imageChannels, channelId)
+        self.imageTimes.append((channelId, now))
+
+    def recentImages(self, channelId: int, now: float, seconds: float) -> int:
+        """images posted in a channel in the last 'seconds'"""
+        return sum(1 for cid, ts in self.imageTimes if cid == channelId and now - ts <= seconds)
+
+    def toDict(self) -> dict:
+        """for logging"""
+        return {name: getattr(self, name) for name in self.__slots__ if name != "member"}
+
+class UserTracker:
+    """Records of recently active users, at most maxUsers of them
+
+    Ordered from least to most recently active, a new user beyond the limit evicts the user that
+    was quiet for the longest time. So memory stays below about maxUsers * RECORD_BYTES even
+    during a raid with thousands of accounts.
+
+    The same order makes expiry cheap: activity times only grow and every touch moves the user to
+    the end, so the users to expire are always at the front. expire() pops them until it reaches
+    one that is still active, O(1) per expired user and no scan over everybody else.
+    """
+    def __init__(self, maxUsers: int = 10000, idleSeconds: float = 60) -> None:
+        self.maxUsers = maxUsers
+        self.idleSeconds = idleSeconds
+        self._records: OrderedDict[int, UserRecord] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, uid: int) -> bool:
+        return uid in self._records
+
+    def items(self):
+        return self._records.items()
+
+    def get(self, uid: int) -> UserRecord | None:
+        return self._records.get(uid)
+
+    def touch(self, uid: int, member, now: float) -> tuple[UserRecord, bool]:
+        """The record of an active user, created if needed. returns (record, created)"""
+        record = self._records.get(uid)
+        if record is not None:
+            record.lastSeen = now
+            self._records.move_to_end(uid)
+            return record, False
+        self.expire(now)
+        record = self._records[uid] = UserRecord(member, now)
+        while len(self._records) > self.maxUsers:
+            evicted, _ = self._records.popitem(last=False)
+            evictedUsers.inc()
+            logger.debug(f"anti spam tracker full, dropped user {evicted}")
+        return record, True
+
+    def expire(self, now: float) -> int:
+        """Drop users that were quiet for idleSeconds, returns how many"""
+        records = self._records
+        expired = 0
+        while records:
+            uid, record = next(iter(records.items()))
+            if now - record.lastSeen < self.idleSeconds: break
+            del records[uid]
+            expired += 1
+        if expired:
+            expiredUsers.inc(amount=expired)
+        return expired
+
+    def pop(self, uid: int) -> UserRecord | None:
+        return self._records.pop(uid, None)
+
+    def merge(self, other: "UserTracker") -> None:
+        """take over the records of another tracker (extension reload), keeping the activity order"""
+        self._records.update(other._records)
+        # both trackers are ordered, but not against each other
+        self._records = OrderedDict(sorted(self._records.items(), key=lambda item: item[1].lastSeen))
+        while len(self._records) > self.maxUsers:
+            self._records.popitem(last=False)
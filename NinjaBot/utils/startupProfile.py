@@ -0,0 +1,101 @@
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+class StartupProfile:
+    """Collects how long each extension took to import and to set up"""
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self._timings: dict[str, dict[str, float]] = {}
+
+    def record(self, name: str, phase: str, seconds: float) -> None:
+        """Save the duration of one phase ('import', 'setup') of an extension"""
+        self._timings.setdefault(name, {})[phase] = seconds
+
+    def get(self, name: str) -> dict[str, float]:
+        return dict(self._timings.get(name, {}))
+
+    def report(self) -> str:
+        """Human readable table, slowest extension first"""
+        total = time.perf_counter() - self._start
+        rows = sorted(self._timings.items(), key=lambda i: sum(i[1].values()), reverse=True)
+        lines = [f"Startup profile ({len(rows)} extensions, {total * 1000:.0f} ms wall time):"]
+        for name, phases in rows:
+            lines.append(f"  {name:<28} import {phases.get('import', 0) * 1000:>7.1f} ms"
+                         f"  setup {phases.get('setup', 0) * 1000:>7.1f} ms")
+        return "\n".join(lines)
+
+class _TimedLoader:
+    """Wraps a module loader so exec_module is timed, everything else is passed through"""
+    def __init__(self, loader, name: str, profiler: "ImportProfiler") -> None:
+        self._loader = loader
+        self._name = name
+        self._profiler = profiler
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module) -> None:
+        self._profiler._enter(self._name)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._leave(self._name)
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+class ImportProfiler:
+    """Meta path hook that measures the import cost of every module imported while it is installed"""
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # module name -> [inclusive seconds, self seconds]
+        self._timings: dict[str, list[float]] = {}
+
+    def install(self) -> None:
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+            logger.info("Import profiling enabled")
+
+    def uninstall(self) -> None:
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        # let the real finders do the work and only wrap the loader they come up with
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"): continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None: break
+        else:
+            return None
+        if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+            spec.loader = _TimedLoader(spec.loader, fullname, self)
+        return spec
+
+    def _enter(self, name: str) -> None:
+        # imports can happen in executor threads too, so the nesting stack is per thread
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append([name, time.perf_counter(), 0.0])
+
+    def _leave(self, name: str) -> None:
+        stack = self._local.stack
+        _, start, children = stack.pop()
+        inclusive = time.perf_counter() - start
+        if stack:
+            stack[-1][2] += inclusive
+        with self._lock:
+            self._timings[name] = [inclusive, inclusive - children]
+
+    def report(self, limit: int = 15) -> str:
+        """Modules with the highest self time first"""
+        with self._lock:
+            rows = sorted(self._timings.items(), key=lambda i: i[1][1], reverse=True)
+        lines = [f"Import profile ({len(rows)} modules, top {limit} by self time):"]
+        for name, (inclusive, selfTime) in rows[:limit]:
+            lines.append(f"  {name:<40} self {selfTime * 1000:>7.1f} ms  total {inclusive * 1000:>7.1f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,224 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sets (
+    namespace TEXT NOT NULL,
+    member TEXT NOT NULL,
+    expires REAL,
+    PRIMARY KEY (namespace, member)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS kv (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS setsExpires ON sets (expires) WHERE expires IS NOT NULL;
+CREATE INDEX IF NOT EXISTS kvExpires ON kv (expires) WHERE expires IS NOT NULL;
+"""
+
+# expired rows are invisible right away, this only frees the space
+PURGE_INTERVAL = 3600
+# posted reddit/youtube ids, the checkers skip anything older than 3 days anyway
+POSTED_TTL = 30 * 86400
+
+class StateStore:
+    """Mutable runtime state of the cogs (posted ids, logged on staff, caches, ...) in a SQLite file
+
+    Two kinds of data, both grouped by a namespace:
+    - keyed sets: a member is in the set or not, e.g. the reddit submissions that were posted already
+    - key/value: any json serializable value, e.g. dynamic commands or resolved docs urls
+    Entries can expire (ttl in seconds). All queries run on one worker thread that owns the connection,
+    so the event loop never waits for the disk. The config file stays read-only configuration.
+    """
+    def __init__(self, file: str | Path) -> None:
+        self.file = str(file)
+        self._db: sqlite3.Connection | None = None
+        # one thread, so the connection is only ever used by the thread that created it
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="stateStore")
+        self._purgeTask: asyncio.Task | None = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> None:
+        self._db = sqlite3.connect(self.file)
+        # readers never block the writer and a commit is an append to the log instead of a rewrite
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    async def open(self) -> None:
+        await self._run(self._open)
+        self._purgeTask = asyncio.get_running_loop().create_task(self._purgeLoop(), name="stateStore.purge")
+        logger.info(f"Opened state store {self.file}")
+
+    async def close(self) -> None:
+        if self._purgeTask:
+            self._purgeTask.cancel()
+            self._purgeTask = None
+        if self._db is None: return
+        db, self._db = self._db, None
+        await self._run(db.close)
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _expires(ttl: float | None) -> float | None:
+        return time.time() + ttl if ttl else None
+
+    # keyed sets
+
+    def _contains(self, namespace: str, member: str) -> bool:
+        row = self._db.execute(
+            "SELECT 1 FROM sets WHERE namespace = ? AND member = ? AND (expires IS NULL OR expires > ?)",
+            (namespace, member, time.time())
+        ).fetchone()
+        return row is not None
+
+    async def contains(self, namespace: str, member: Any) -> bool:
+        """is 'member' in the set, a primary key lookup"""
+        return await self._run(self._contains, namespace, str(member))
+
+    def _members(self, namespace: str) -> set[str]:
+        rows = self._db.execute(
+            "SELECT member FROM sets WHERE namespace = ? AND (expires IS NULL OR expires > ?)",
+            (namespace, time.time())
+        )
+        return {row[0] for row in rows}
+
+    async def members(self, namespace: str) -> set[str]:
+        """all members of the set, as strings"""
+        return await self._run(self._members, namespace)
+
+    def _add(self, namespace: str, members: list[str], expires: float | None) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO sets (namespace, member, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (namespace, member) DO UPDATE SET expires = excluded.expires",
+                [(namespace, member, expires) for member in members]
+            )
+
+    async def add(self, namespace: str, members: Iterable[Any], ttl: float | None = None) -> None:
+        """add (or refresh) all 'members' in one transaction, they are forgotten after 'ttl' seconds"""
+        members = [str(m) for m in members]
+        if members:
+            await self._run(self._add, namespace, members, self._expires(ttl))
+
+    def _discard(self, namespace: str, member: str) -> bool:
+        with self._db:
+            return self._db.execute("DELETE FROM sets WHERE namespace = ? AND member = ?", (namespace, member)).rowcount > 0
+
+    async def discard(self, namespace: str, member: Any) -> bool:
+        """remove 'member', returns if it was in the set"""
+        return await self._run(self._discard, namespace, str(member))
+
+    # key/value
+
+    def _get(self, namespace: str, key: str) -> str | None:
+        row = self._db.execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ? AND (expires IS NULL OR expires > ?)",
+            (namespace, key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    async def get(self, namespace: str, key: str, default=None):
+        value = await self._run(self._get, namespace, key)
+        return default if value is None else json.loads(value)
+
+    def _items(self, namespace: str) -> list[tuple[str, str]]:
+        return self._db.execute(
+            "SELECT key, value FROM kv WHERE namespace = ? AND (expires IS NULL OR expires > ?)",
+            (namespace, time.time())
+        ).fetchall()
+
+    async def items(self, namespace: str) -> dict:
+        """every key of the namespace with its value"""
+        return {key: json.loads(value) for key, value in await self._run(self._items, namespace)}
+
+    def _put(self, namespace: str, rows: list[tuple[str, str]], expires: float | None) -> None:
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO kv (namespace, key, value, expires) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+                [(namespace, key, value, expires) for key, value in rows]
+            )
+
+    async def put(self, namespace: str, key: str, value, ttl: float | None = None) -> None:
+        await self.putMany(namespace, {key: value}, ttl)
+
+    async def putMany(self, namespace: str, values: dict, ttl: float | None = None) -> None:
+        """upsert all 'values' in one transaction"""
+        rows = [(str(key), json.dumps(value)) for key, value in values.items()]
+        if rows:
+            await self._run(self._put, namespace, rows, self._expires(ttl))
+
+    def _delete(self, namespace: str, key: str) -> bool:
+        with self._db:
+            return self._db.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).rowcount > 0
+
+    async def delete(self, namespace: str, key: str) -> bool:
+        return await self._run(self._delete, namespace, str(key))
+
+    # expiry
+
+    def _purge(self) -> int:
+        now = time.time()
+        with self._db:
+            removed = self._db.execute("DELETE FROM sets WHERE expires <= ?", (now,)).rowcount
+            removed += self._db.execute("DELETE FROM kv WHERE expires <= ?", (now,)).rowcount
+        return removed
+
+    async def purgeExpired(self) -> int:
+        """delete expired entries, returns how many"""
+        return await self._run(self._purge)
+
+    async def _purgeLoop(self) -> None:
+        while True:
+            try:
+                removed = await self.purgeExpired()
+                if removed:
+                    logger.debug(f"Purged {removed} expired state entries")
+            except Exception as E:
+                logger.exception(E)
+            await asyncio.sleep(PURGE_INTERVAL)
+
+    async def migrateLegacy(self, config, suggestionsFile: Path) -> None:
+        """Move state that older versions kept in the config file and suggestions.json, once per namespace"""
+        migrated = await self.members("meta.migrated")
+        done = []
+        if "posted" not in migrated:
+            await self.add("reddit.posted", config.get("redditPostedSubmissions") or [], ttl=POSTED_TTL)
+            await self.add("youtube.posted", config.get("youtubePostedVideo") or [], ttl=POSTED_TTL)
+            done.append("posted")
+        if "supportStaff" not in migrated:
+            primaryGuild, guildBlocks = str(config.get("guild")), config.get("guilds") or {}
+            for guildId in config.guildIds() or [None]:
+                # the top level list belongs to the legacy "guild", other guilds only have their own block
+                if guildId is None or str(guildId) == primaryGuild:
+                    staff = config.forGuild(guildId).get("loggedOnSupportStaff")
+                else:
+                    staff = (guildBlocks.get(str(guildId)) or {}).get("loggedOnSupportStaff")
+                await self.add(f"supportStaff.{guildId}", staff or [])
+            done.append("supportStaff")
+        if "dynCmds" not in migrated:
+            # a file that can't be read is tried again on the next start
+            try:
+                if Path(suggestionsFile).is_file():
+                    await self.putMany("dynCmds", json.loads(Path(suggestionsFile).read_text(encoding="utf-8")))
+                done.append("dynCmds")
+            except (OSError, ValueError) as E:
+                logger.error(f"Could not import {suggestionsFile}: {E}")
+        if done:
+            await self.add("meta.migrated", done)
+            logger.info(f"Imported legacy state into the state store: {', '.join(done)}")
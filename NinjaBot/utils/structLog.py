@@ -0,0 +1,84 @@
+import json
+import logging
+import random
+import time
+
+# longest rendered field value in the text output
+MAX_FIELD_LENGTH = 300
+
+class _Site:
+    """Rate limit bookkeeping for one event name"""
+    __slots__ = ("last", "suppressed")
+
+    def __init__(self) -> None:
+        self.last = 0.0
+        self.suppressed = 0
+
+def _plain(value):
+    # json friendly value, evaluated in the calling thread so later mutations can't race the log thread
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return repr(value)
+
+class StructLogger:
+    """Wraps a stdlib logger with lazily evaluated fields and per event sampling and rate limits
+
+    slog.debug("antispam.sift4", every=5.0, distance=dist, user=lambda: str(message.author))
+
+    - fields that are callables are only evaluated if the record is actually emitted
+    - sample=0.1 emits roughly every 10th call
+    - every=5.0 emits at most once per 5 seconds, the number of skipped calls is added as 'suppressed'
+    """
+    def __init__(self, name: str) -> None:
+        self._logger = logging.getLogger(name)
+        self._sites: dict[str, _Site] = {}
+
+    def debug(self, event: str, *, every: float | None = None, sample: float | None = None, **fields) -> None:
+        self.log(logging.DEBUG, event, every, sample, fields)
+
+    def info(self, event: str, *, every: float | None = None, sample: float | None = None, **fields) -> None:
+        self.log(logging.INFO, event, every, sample, fields)
+
+    def warning(self, event: str, *, every: float | None = None, sample: float | None = None, **fields) -> None:
+        self.log(logging.WARNING, event, every, sample, fields)
+
+    def log(self, level: int, event: str, every: float | None, sample: float | None, fields: dict) -> None:
+        # cheapest checks first, nothing gets formatted unless the record goes out
+        if not self._logger.isEnabledFor(level): return
+        if sample is not None and random.random() >= sample: return
+        if every is not None:
+            site = self._sites.get(event)
+            if site is None:
+                site = self._sites[event] = _Site()
+            now = time.monotonic()
+            if now - site.last < every:
+                site.suppressed += 1
+                return
+            site.last = now
+            if site.suppressed:
+                fields["suppressed"] = site.suppressed
+                site.suppressed = 0
+
+        values = {k: _plain(v() if callable(v) else v) for k, v in fields.items()}
+        text = " ".join(f"{k}={str(v)[:MAX_FIELD_LENGTH]}" for k, v in values.items())
+        self._logger.log(level, f"{event} {text}" if text else event, extra={"event": event, "fields": values})
+
+class JsonLinesFormatter(logging.Formatter):
+    """One json object per line, structured records keep their fields"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        if hasattr(record, "event"):
+            entry["event"] = record.event
+            entry.update(record.fields)
+        else:
+            entry["message"] = record.getMessage()
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def getLogger(name: str) -> StructLogger:
+    return StructLogger(name)
@@ -0,0 +1,49 @@
+import discord
+import hashlib
+import json
+import logging
+from pathlib import Path
+from utils.jsonFile import fileHelper
+
+logger = logging.getLogger("NinjaBot." + __name__)
+
+class TreeSyncer:
+    """Pushes application commands to discord, but only when they changed since the last sync"""
+    def __init__(self, tree: discord.app_commands.CommandTree, file: str | Path) -> None:
+        self.tree = tree
+        self._file = Path(file)
+        self._fh = fileHelper(file)
+        self._hashes: dict[str, str] | None = None
+
+    def signature(self, guild: discord.abc.Snowflake) -> str:
+        """Hash of the command payload that a sync for this guild would send"""
+        payload = [cmd.to_dict(self.tree) for cmd in self.tree.get_commands(guild=guild)]
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def sync(self, guildId: int, force: bool = False) -> bool:
+        """Sync the commands of a guild if needed. Returns True if a sync was done"""
+        guild = discord.Object(id=guildId)
+        self.tree.copy_global_to(guild=guild)
+        signature = self.signature(guild)
+        hashes = await self._loadHashes()
+
+        if not force and hashes.get(str(guildId)) == signature:
+            logger.info(f"App commands for guild {guildId} unchanged, skipping sync")
+            return False
+
+        await self.tree.sync(guild=guild)
+        logger.info(f"Synced app commands for guild {guildId}{' (forced)' if force else ''}")
+        hashes[str(guildId)] = signature
+        await self._fh.write(hashes)
+        return True
+
+    async def _loadHashes(self) -> dict[str, str]:
+        if self._hashes is None:
+            self._hashes = {}
+            if self._file.exists():
+                try:
+                    self._hashes = await self._fh.read()
+                except Exception:
+                    # broken hash file, the next sync will overwrite it
+                    logger.warning("Could not read app command hashes, syncing anyway")
+        return self._hashes
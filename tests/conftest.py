@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the bot imports its modules relative to NinjaBot/, e.g. "utils.raidIndex"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "NinjaBot"))
@@ -0,0 +1,23 @@
+import random
+import pytest
+from utils.analysis import _majorityBits, analyzeMessage, fingerprint
+
+def naiveMajority(hashes: list[int]) -> int:
+    return sum(1 << bit for bit in range(64) if sum(h >> bit & 1 for h in hashes) * 2 > len(hashes))
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 8, 100, 1023, 1024])
+def test_majorityBitsMatchesCountingEveryColumn(count):
+    rng = random.Random(count)
+    hashes = [rng.getrandbits(64) for _ in range(count)]
+    assert _majorityBits(iter(hashes), count) == naiveMajority(hashes)
+
+def test_fingerprintIgnoresMentionsCaseAndUrlPaths():
+    text = "Free nitro for everyone, claim it here before it runs out"
+    assert fingerprint(text) is not None
+    assert fingerprint(f"<@123> {text.upper()} https://example.com/a") == fingerprint(f"{text} <@456> https://example.com/b")
+    assert fingerprint("too short") is None
+
+def test_fingerprintOnlyWhenAskedFor():
+    text = "Free nitro for everyone, claim it here before it runs out"
+    assert analyzeMessage(text, "").fingerprint == fingerprint(text)
+    assert analyzeMessage(text, "", withFingerprint=False).fingerprint is None
@@ -0,0 +1,13 @@
+from utils.metrics import Counter, Histogram
+
+def test_labelValuesAreEscaped():
+    counter = Counter("ninjabot_test_total", "test", ("feature",))
+    counter.inc('say "hi"\\\nnow')
+    assert counter.render() == ['ninjabot_test_total{feature="say \\"hi\\"\\\\\\nnow"} 1']
+
+def test_histogramBucketsKeepTheirLeLabel():
+    histogram = Histogram("ninjabot_test_seconds", "test", ("feature",), buckets=(0.1,))
+    histogram.observe(0.05, 'a"b')
+    lines = histogram.render()
+    assert 'ninjabot_test_seconds_bucket{feature="a\\"b",le="0.1"} 1' in lines
+    assert 'ninjabot_test_seconds_count{feature="a\\"b"} 1' in lines
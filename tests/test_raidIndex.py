@@ -0,0 +1,38 @@
+from utils.raidIndex import RaidIndex
+
+GUILD = 1
+FP = 0x0123456789ABCDEF
+
+def test_raidIsReportedOnceAtTheAccountLimit():
+    index = RaidIndex(accounts=3, window=60)
+    assert index.add(GUILD, 1, FP, now=0) == []
+    assert index.add(GUILD, 1, FP, now=1) == []
+    assert index.add(GUILD, 2, FP, now=2) == []
+    assert sorted(index.add(GUILD, 3, FP, now=3)) == [1, 2, 3]
+    # latecomers are returned alone, known raiders not again
+    assert index.add(GUILD, 4, FP, now=4) == [4]
+    assert index.add(GUILD, 2, FP, now=5) == []
+
+def test_nearDuplicatesJoinTheCluster():
+    index = RaidIndex(accounts=3, window=60, maxDistance=5)
+    index.add(GUILD, 1, FP, now=0)
+    index.add(GUILD, 2, FP ^ 0b10101, now=1)
+    assert sorted(index.add(GUILD, 3, FP ^ (1 << 63), now=2)) == [1, 2, 3]
+
+def test_otherTextsAndGuildsDontCount():
+    index = RaidIndex(accounts=2, window=60)
+    index.add(GUILD, 1, FP, now=0)
+    assert index.add(GUILD + 1, 2, FP, now=1) == []
+    assert index.add(GUILD, 3, ~FP & (2**64 - 1), now=2) == []
+
+def test_clustersExpireAfterTheWindow():
+    index = RaidIndex(accounts=3, window=60)
+    index.add(GUILD, 1, FP, now=0)
+    index.add(GUILD, 2, FP, now=30)
+    assert len(index) == 2
+    index.expire(now=61)
+    assert len(index) == 1
+    # the first message is gone, so two more accounts are needed for a raid
+    assert index.add(GUILD, 3, FP, now=62) == []
+    index.expire(now=200)
+    assert len(index) == 0 and index._bands == {}
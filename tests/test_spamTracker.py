@@ -0,0 +1,55 @@
+from utils.spamTracker import MAX_MESSAGES, MAX_REPORT_LINE, MAX_TEXT, UserTracker
+
+def order(tracker: UserTracker) -> list[int]:
+    return [uid for uid, _ in tracker.items()]
+
+def test_touchMovesUserToTheEnd():
+    tracker = UserTracker(maxUsers=10, idleSeconds=60)
+    for uid in (1, 2, 3):
+        assert tracker.touch(uid, None, uid)[1] is True
+    record, created = tracker.touch(1, None, 4)
+    assert created is False and record.lastSeen == 4
+    assert order(tracker) == [2, 3, 1]
+
+def test_leastRecentlyActiveUserIsEvicted():
+    tracker = UserTracker(maxUsers=3, idleSeconds=60)
+    for uid in (1, 2, 3):
+        tracker.touch(uid, None, uid)
+    tracker.touch(1, None, 4)
+    tracker.touch(4, None, 5)
+    assert order(tracker) == [3, 1, 4]
+
+def test_expireStopsAtTheFirstActiveUser():
+    tracker = UserTracker(maxUsers=10, idleSeconds=60)
+    for uid, now in ((1, 0), (2, 10), (3, 20)):
+        tracker.touch(uid, None, now)
+    tracker.touch(1, None, 25)
+    assert tracker.expire(71) == 1
+    assert order(tracker) == [3, 1]
+    assert tracker.expire(71) == 0
+    assert tracker.expire(100) == 2 and len(tracker) == 0
+
+def test_newUsersExpireIdleOnes():
+    tracker = UserTracker(maxUsers=10, idleSeconds=60)
+    tracker.touch(1, None, 0)
+    tracker.touch(2, None, 100)
+    assert order(tracker) == [2]
+
+def test_mergeKeepsActivityOrderAndLimit():
+    tracker, other = UserTracker(maxUsers=3), UserTracker(maxUsers=3)
+    tracker.touch(1, None, 1)
+    tracker.touch(3, None, 3)
+    other.touch(2, None, 2)
+    other.touch(4, None, 4)
+    tracker.merge(other)
+    assert order(tracker) == [2, 3, 4]
+
+def test_recordBuffersAreBounded():
+    tracker = UserTracker()
+    record, _ = tracker.touch(1, None, 0)
+    for i in range(MAX_MESSAGES + 5):
+        record.addMessage(i, 1, "x" * 1000)
+    record.setText("x" * (MAX_TEXT * 2))
+    assert len(record.msgs) == MAX_MESSAGES and record.msgs[0].id == 5
+    assert len(record.msgs[-1].line) == MAX_REPORT_LINE
+    assert len(record.lastText) == MAX_TEXT